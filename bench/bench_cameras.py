@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""CPU use of the daemon as cameras are added.
+
+Each fake camera feeds motion vector frames of --motion-size to
+count_motion_vectors at --framerate, as the encoder does with
+MotionDetector.analyse, and the daemon runs the shared presence thread plus
+a detect_motion thread per camera. The same number of cameras is also run
+as one single-camera daemon process each, the way multiple cameras had to
+be run before.
+
+    python bench/bench_cameras.py --cameras 1 2 4 --seconds 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Future
+from queue import Queue
+from threading import Event, Thread
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.cameras import CameraGroup  # noqa: E402
+from security.motion import MOTION_DTYPE, count_motion_vectors  # noqa: E402
+from security.state import State  # noqa: E402
+from security.threads.detect_motion import detect_motion  # noqa: E402
+from security.threads.monitor_alarm_state import monitor_alarm_state  # noqa: E402
+
+
+class FakeSettings(object):
+
+    def __init__(self, names, motion_size, framerate):
+        self.cameras = names
+        self.packet_timeout = 700
+        self.thumbnail_size = (0, 0)
+        self.motion_size = motion_size
+        self.framerate = framerate
+
+    def for_camera(self, name):
+        return self
+
+
+class FakeNetwork(object):
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.state = State(self)
+
+    def arp_ping_macs(self):
+        pass
+
+
+class FakeCamera(object):
+    """Runs the motion analysis on generated frames while detecting."""
+
+    def __init__(self, name, motion_size, framerate):
+        self.name = name
+        self.framerate = framerate
+        self.queue = Queue()
+        self.motion_detected = Event()
+        self.wake_sensor = None
+        self.detecting = Event()
+        width, height = motion_size
+        shape = ((height + 15) // 16, (width + 15) // 16 + 1)
+        rng = np.random.default_rng(0)
+        self.frames = []
+        for _ in range(10):
+            frame = np.zeros(shape, dtype=MOTION_DTYPE)
+            frame['x'] = rng.integers(-8, 8, shape)
+            frame['y'] = rng.integers(-8, 8, shape)
+            self.frames.append(frame)
+        self.frames_analysed = 0
+        Thread(target=self._encoder, daemon=True).start()
+
+    @classmethod
+    def from_settings(cls, settings, name='security', thumbnails=None):
+        return cls(name, settings.motion_size, settings.framerate)
+
+    def _encoder(self):
+        interval = 1.0 / self.framerate
+        while True:
+            self.detecting.wait()
+            frame = self.frames[self.frames_analysed % len(self.frames)]
+            if count_motion_vectors(frame, 60) > 10:
+                self.motion_detected.set()
+            self.frames_analysed += 1
+            time.sleep(interval)
+
+    def start_motion_detection(self):
+        self.detecting.set()
+
+    def stop_motion_detection(self):
+        self.detecting.clear()
+
+    def trigger_alarm(self):
+        future = Future()
+        future.set_result([])
+        return future
+
+
+def run_daemon(names, args, results=None):
+    """Run one daemon with `names` cameras and return its CPU use in %."""
+    settings = FakeSettings(names, tuple(args.motion_size), args.framerate)
+    network = FakeNetwork(settings)
+    cameras = CameraGroup.from_settings(settings, backend=FakeCamera)
+    Thread(target=monitor_alarm_state, args=(network,), daemon=True).start()
+    for camera in cameras:
+        Thread(target=detect_motion, args=(network, camera), daemon=True).start()
+    network.state.update_state('armed')
+    time.sleep(0.5)
+    started_cpu, started = time.process_time(), time.perf_counter()
+    time.sleep(args.seconds)
+    cpu = 100.0 * (time.process_time() - started_cpu) / (time.perf_counter() - started)
+    if results is not None:
+        results.put(cpu)
+    return cpu
+
+
+def run_single(names, args):
+    # Each measurement gets a fresh process so threads from the previous
+    # run don't count.
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_daemon, args=(names, args, results))
+    process.start()
+    cpu = results.get()
+    process.terminate()
+    process.join()
+    return cpu
+
+
+def run_separate(count, args):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_daemon, args=(['camera{0}'.format(i)], args, results))
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    cpu = sum(results.get() for _ in processes)
+    for process in processes:
+        process.terminate()
+        process.join()
+    return cpu
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--cameras', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--seconds', type=float, default=5)
+    p.add_argument('--framerate', type=int, default=5)
+    p.add_argument('--motion-size', type=int, nargs=2, default=[1280, 720])
+    args = p.parse_args()
+
+    results = []
+    for count in args.cameras:
+        names = ['camera{0}'.format(i) for i in range(count)]
+        results.append({
+            'cameras': count,
+            'one_daemon_cpu_percent': round(run_single(names, args), 2),
+            'daemon_per_camera_cpu_percent': round(run_separate(count, args), 2),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
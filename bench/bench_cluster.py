@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Media throughput and failover latency with local node and coordinator processes.
+
+Throughput: --nodes node processes each upload --files captures of
+--size bytes to one coordinator process.
+
+Failover, each measured --repeat times:
+  node_lost: a node is stopped with SIGSTOP, time until the coordinator
+      notifies that it's offline. Bounded by --heartbeat-timeout.
+  coordinator_killed: the primary coordinator is killed, time until the
+      node is connected to the standby.
+  coordinator_hung: the primary coordinator is stopped with SIGSTOP, time
+      until the node is connected to the standby.
+
+    python bench/bench_cluster.py --nodes 1 4 --files 20 --size 2000000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from queue import Empty, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.cameras import CameraGroup  # noqa: E402
+from security.cluster import Coordinator, Node  # noqa: E402
+from security.state import State  # noqa: E402
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+
+
+class FakeNetwork(object):
+
+    def __init__(self):
+        self.settings = FakeSettings()
+        self.state = State(self)
+
+
+class FakeCamera(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = Queue()
+
+
+def coordinator_process(args, directory, events):
+    coordinator = Coordinator(
+        FakeNetwork(),
+        CameraGroup([]),
+        address=('127.0.0.1', 0),
+        media_directory=directory,
+        heartbeat_interval=args.heartbeat_interval,
+        heartbeat_timeout=args.heartbeat_timeout
+    )
+    coordinator.start()
+    events.put(('address', coordinator.address))
+    notifications = coordinator.network.state.notifications
+    while True:
+        for camera in coordinator.cameras:
+            while not camera.queue.empty():
+                camera.queue.get()
+                events.put(('media', time.time()))
+        try:
+            events.put(('notify', time.time(), notifications.get_nowait()))
+        except Empty:
+            time.sleep(0.001)
+
+
+def node_process(args, name, addresses, directory, files, events):
+    camera = FakeCamera('security')
+    node = Node(
+        name,
+        CameraGroup([camera]),
+        addresses,
+        heartbeat_interval=args.heartbeat_interval,
+        heartbeat_timeout=args.heartbeat_timeout
+    )
+    node.start()
+    connected = None
+    while True:
+        current = node.coordinator if node.connected.is_set() else None
+        if current != connected:
+            connected = current
+            events.put(('connected', time.time(), name, connected))
+            if connected is not None:
+                started = time.time()
+                for path in files:
+                    camera.queue.put(path)
+                files = []
+                events.put(('queued', started))
+        time.sleep(0.001)
+
+
+def start(target, *args):
+    process = multiprocessing.Process(target=target, args=args)
+    process.daemon = True
+    process.start()
+    return process
+
+
+def next_event(events, kind, timeout=30):
+    while True:
+        event = events.get(timeout=timeout)
+        if event[0] == kind:
+            return event
+
+
+def throughput(args, directory, nodes):
+    events = multiprocessing.Queue()
+    media = os.path.join(directory, 'media-{0}'.format(nodes))
+    os.mkdir(media)
+    coordinator = start(coordinator_process, args, media, events)
+    address = next_event(events, 'address')[1]
+    payload = os.urandom(args.size)
+    processes = []
+    for n in range(nodes):
+        files = []
+        for i in range(args.files):
+            path = os.path.join(directory, 'node{0}-{1}.jpg'.format(n, i))
+            with open(path, 'wb') as f:
+                f.write(payload)
+            files.append(path)
+        processes.append(start(node_process, args, 'node{0}'.format(n), [address], directory, files, events))
+    queued = []
+    received = []
+    while len(received) < nodes * args.files:
+        event = events.get(timeout=60)
+        if event[0] == 'queued':
+            queued.append(event[1])
+        elif event[0] == 'media':
+            received.append(event[1])
+    started = min(queued)
+    finished = max(received)
+    for process in processes + [coordinator]:
+        process.terminate()
+    elapsed = finished - started
+    return {
+        'nodes': nodes,
+        'files': nodes * args.files,
+        'size': args.size,
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(nodes * args.files * args.size / elapsed / 1e6, 1),
+    }
+
+
+def node_lost(args, directory):
+    events = multiprocessing.Queue()
+    coordinator = start(coordinator_process, args, directory, events)
+    address = next_event(events, 'address')[1]
+    node = start(node_process, args, 'node', [address], directory, [], events)
+    next_event(events, 'connected')
+    time.sleep(args.heartbeat_interval * 2)
+    stopped = time.time()
+    os.kill(node.pid, signal.SIGSTOP)
+    while True:
+        event = next_event(events, 'notify')
+        if event[2] == 'Node node is offline':
+            break
+    os.kill(node.pid, signal.SIGCONT)
+    node.terminate()
+    coordinator.terminate()
+    return event[1] - stopped
+
+
+def coordinator_lost(args, directory, sig):
+    events = multiprocessing.Queue()
+    primary = start(coordinator_process, args, directory, events)
+    primary_address = next_event(events, 'address')[1]
+    standby = start(coordinator_process, args, directory, events)
+    standby_address = next_event(events, 'address')[1]
+    node = start(node_process, args, 'node', [primary_address, standby_address], directory, [], events)
+    next_event(events, 'connected')
+    time.sleep(args.heartbeat_interval * 2)
+    stopped = time.time()
+    os.kill(primary.pid, sig)
+    while True:
+        event = next_event(events, 'connected')
+        if event[3] == standby_address:
+            break
+    if sig == signal.SIGSTOP:
+        os.kill(primary.pid, signal.SIGCONT)
+    for process in (node, primary, standby):
+        process.terminate()
+    return event[1] - stopped
+
+
+def summary(latencies):
+    latencies.sort()
+    return {
+        'min_ms': round(latencies[0] * 1e3, 1),
+        'median_ms': round(latencies[len(latencies) // 2] * 1e3, 1),
+        'max_ms': round(latencies[-1] * 1e3, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--nodes', type=int, nargs='+', default=[1, 4])
+    p.add_argument('--files', type=int, default=20)
+    p.add_argument('--size', type=int, default=2000000)
+    p.add_argument('--heartbeat-interval', type=float, default=0.2)
+    p.add_argument('--heartbeat-timeout', type=float, default=1.0)
+    p.add_argument('--repeat', type=int, default=3)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            'heartbeat_interval': args.heartbeat_interval,
+            'heartbeat_timeout': args.heartbeat_timeout,
+            'throughput': [throughput(args, directory, n) for n in args.nodes],
+            'node_lost': summary([node_lost(args, directory) for _ in range(args.repeat)]),
+            'coordinator_killed': summary([
+                coordinator_lost(args, directory, signal.SIGKILL) for _ in range(args.repeat)
+            ]),
+            'coordinator_hung': summary([
+                coordinator_lost(args, directory, signal.SIGSTOP) for _ in range(args.repeat)
+            ]),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
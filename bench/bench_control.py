@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Requests/sec and latency of status queries on the control socket.
+
+The server runs in this process with a fake network. Clients run in
+separate processes, each keeping one connection open and sending status
+requests one at a time, or opening a new connection per request as the
+CLI does with --connect-per-request.
+
+    python bench/bench_control.py --clients 1 4 16 --requests 2000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.control import ControlServer, register_state_commands, request  # noqa: E402
+from security.state import State  # noqa: E402
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+
+
+class FakeNetwork(object):
+
+    def __init__(self):
+        self.settings = FakeSettings()
+        self.state = State(self)
+
+
+def client(path, requests, connect_per_request, results):
+    latencies = []
+    if connect_per_request:
+        for _ in range(requests):
+            started = time.perf_counter()
+            request('status', path=path)
+            latencies.append(time.perf_counter() - started)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        reader = sock.makefile('rb')
+        payload = json.dumps({'command': 'status'}).encode('utf-8') + b'\n'
+        for _ in range(requests):
+            started = time.perf_counter()
+            sock.sendall(payload)
+            reader.readline()
+            latencies.append(time.perf_counter() - started)
+        sock.close()
+    results.put(latencies)
+
+
+def run(path, clients, requests, connect_per_request):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client, args=(path, requests, connect_per_request, results))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {
+        'clients': clients,
+        'connect_per_request': connect_per_request,
+        'requests_per_sec': round(len(latencies) / elapsed),
+        'p50_us': round(latencies[len(latencies) // 2] * 1e6, 1),
+        'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    p.add_argument('--requests', type=int, default=2000, help='Per client')
+    p.add_argument('--connect-per-request', action='store_true')
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = ControlServer(os.path.join(directory, 'control.sock'))
+        register_state_commands(server, FakeNetwork())
+        server.start()
+        try:
+            results = [
+                run(server.path, n, args.requests, args.connect_per_request)
+                for n in args.clients
+            ]
+        finally:
+            server.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
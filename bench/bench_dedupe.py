@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Photos and bytes saved by dropping near-duplicate photos, and hash cost.
+
+Events are replayed through a Deduplicator --interval seconds apart, with
+a --window, for each of --distances. With --photos the events are read
+from DIR/<event>/, otherwise --events bursts of --frames photos of one
+scene are generated at --image-size and saved as JPEGs:
+
+  repeat: the scene again, with sensor noise, a patch of leaves swaying
+      and a little exposure drift, like a camera that keeps triggering on
+      a tree.
+  lighting: the scene a fifth brighter or darker, like a cloud passing.
+  person: someone walking across the scene, every photo shows something
+      new.
+
+`bytes_saved_percent` is the size of the JPEGs dropped against all of
+them. `person_photos_dropped` counts photos of people that weren't sent,
+`person_events_missed` events of people where none were. `dhash_us` is
+the time to decode and hash one photo, `hash_array_us` to hash a 17x16
+array and `nearest_us` to search a full HashIndex.
+
+    python bench/bench_dedupe.py --events 60 --distances 4 8 12 16
+    python bench/bench_dedupe.py --photos captures/ --window 300
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.dedupe import HASH_BITS, HASH_SIZE, INDEX_SIZE, Deduplicator, HashIndex, dhash, hash_array  # noqa: E402
+
+KINDS = ('repeat', 'lighting', 'person')
+# Generated scenes are drawn at this size and scaled up to --image-size.
+DRAW_SIZE = (320, 240)
+
+
+def scene(rng):
+    width, height = DRAW_SIZE
+    coarse = rng.uniform(0.2, 0.7, (6, 8))
+    image = np.asarray(
+        Image.fromarray((coarse * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC),
+        dtype=np.float32
+    ) / 255
+    return image + rng.normal(0, 0.04, (height, width)).astype(np.float32)
+
+
+def draw_event(rng, background, kind, frames):
+    width, height = DRAW_SIZE
+    out = []
+    if kind == 'person':
+        size = int(rng.uniform(0.35, 0.8) * height)
+        blob = (size, int(size * rng.uniform(0.3, 0.45)))
+        bottom = int(rng.uniform(0.75, 0.98) * height)
+        step = rng.uniform(0.1, 0.2) * width * rng.choice((-1, 1))
+        start = rng.uniform(0.2, 0.8) * width - blob[1] / 2
+        tone = float(np.clip(background.mean() + rng.choice((-1, 1)) * rng.uniform(0.2, 0.45), 0, 1))
+    exposure = rng.uniform(0.8, 0.9) if kind == 'lighting' and rng.random() < 0.5 else 1.0
+    if kind == 'lighting' and exposure == 1.0:
+        exposure = rng.uniform(1.1, 1.2)
+    for n in range(frames):
+        frame = background * exposure * rng.uniform(0.97, 1.03)
+        if kind == 'repeat':
+            # Leaves in the top corner move by a few pixels.
+            shift = int(rng.integers(-3, 4))
+            frame[10:70, 20:100] = np.roll(background[10:70, 20:100], shift, axis=1) * exposure
+        elif kind == 'person':
+            left = int(start + step * n)
+            top = max(0, bottom - blob[0])
+            lo, hi = max(0, left), min(width, left + blob[1])
+            if hi > lo:
+                frame[top:bottom, lo:hi] = tone + rng.normal(0, 0.04, (bottom - top, hi - lo))
+        frame = frame + rng.normal(0, 0.015, frame.shape)
+        out.append(np.clip(frame, 0, 1))
+    return out
+
+
+def generate(directory, args):
+    """Save the events, returning [(paths, kind)]."""
+    rng = np.random.default_rng(args.seed)
+    background = scene(rng)
+    events = []
+    for n in range(args.events):
+        kind = KINDS[int(rng.integers(0, len(KINDS)))]
+        paths = []
+        for i, frame in enumerate(draw_event(rng, background, kind, args.frames)):
+            path = os.path.join(directory, '{0:04d}-{1}-{2}.jpg'.format(n, kind, i))
+            image = Image.fromarray((frame * 255).astype(np.uint8))
+            image.resize(tuple(args.image_size), Image.BILINEAR).save(path, 'JPEG', quality=85)
+            paths.append(path)
+        events.append((paths, kind))
+    return events
+
+
+def read_photos(directory):
+    events = []
+    for name in sorted(os.listdir(directory)):
+        event = os.path.join(directory, name)
+        if os.path.isdir(event):
+            paths = sorted(os.path.join(event, f) for f in os.listdir(event))
+            events.append((paths, None))
+    return events
+
+
+def replay(events, args, distance):
+    deduplicator = Deduplicator()
+    result = {
+        'photos_sent': 0,
+        'photos_dropped': 0,
+        'bytes_saved_percent': 0.0,
+        'person_photos_dropped': 0,
+        'person_events_missed': 0,
+    }
+    total = saved = 0
+    for n, (paths, kind) in enumerate(events):
+        kept, dropped = deduplicator.filter('bench', paths, args.window, distance, now=n * args.interval)
+        for path in kept:
+            deduplicator.sent('bench', path, now=n * args.interval)
+        result['photos_sent'] += len(kept)
+        result['photos_dropped'] += len(dropped)
+        total += sum(os.path.getsize(path) for path in paths)
+        saved += sum(os.path.getsize(path) for path in dropped)
+        if kind == 'person':
+            result['person_photos_dropped'] += len(dropped)
+            result['person_events_missed'] += int(not kept)
+    result['bytes_saved_percent'] = round(100.0 * saved / max(total, 1), 1)
+    return result
+
+
+def timings(events, repeats):
+    paths = [path for event, _ in events for path in event][:repeats]
+    started = time.perf_counter()
+    for path in paths:
+        dhash(path)
+    dhash_us = (time.perf_counter() - started) / len(paths) * 1e6
+
+    pixels = np.random.default_rng(0).integers(0, 255, (HASH_SIZE, HASH_SIZE + 1)).astype(np.int16)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        hash_array(pixels)
+    hash_array_us = (time.perf_counter() - started) / repeats * 1e6
+
+    index = HashIndex()
+    for i in range(INDEX_SIZE):
+        index.add(i * 0x9E3779B97F4A7C15 % 2 ** HASH_BITS, 0)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        index.nearest(2 ** HASH_BITS - 1, 0, 60)
+    nearest_us = (time.perf_counter() - started) / repeats * 1e6
+    return {
+        'dhash_us': round(dhash_us, 1),
+        'hash_array_us': round(hash_array_us, 1),
+        'nearest_us': round(nearest_us, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--photos', help='a directory with a directory of photos per event')
+    p.add_argument('--events', type=int, default=60)
+    p.add_argument('--frames', type=int, default=3)
+    p.add_argument('--image-size', type=int, nargs=2, default=[1024, 768])
+    p.add_argument('--interval', type=float, default=60)
+    p.add_argument('--window', type=float, default=600)
+    p.add_argument('--distances', type=int, nargs='+', default=[0, 4, 8, 12, 16, 24])
+    p.add_argument('--repeats', type=int, default=200)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        events = read_photos(args.photos) if args.photos else generate(directory, args)
+        result = {
+            'events': len(events),
+            'photos': sum(len(paths) for paths, _ in events),
+            'kinds': dict((kind, sum(1 for _, k in events if k == kind)) for kind in KINDS),
+        }
+        result.update(timings(events, args.repeats))
+        result['distances'] = dict(
+            (distance, replay(events, args, distance)) for distance in args.distances
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Import time of the package, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter and the cumulative time
+reported by importtime is summed per top level package, so the output
+shows what an import actually drags in.
+
+    python bench/bench_imports.py security security.network security.camera
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Dependencies that must only be imported by the subsystems that use them.
+HEAVY_MODULES = ('picamera', 'scapy', 'telegram', 'numpy', 'PIL', 'netaddr', 'netifaces')
+
+LIGHT_MODULES = (
+    'security',
+    'security.threads',
+    'security.settings',
+    'security.state',
+    'security.util',
+    'security.scheduler',
+    'security.preview',
+    'security.thumbnails',
+    'security.network',
+)
+
+
+def import_time(module):
+    """Import `module` in a new interpreter.
+
+    Returns:
+        (dict): Cumulative microseconds per imported module, in import order.
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module)],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        check=True
+    )
+    times = {}
+    for line in process.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def summary(module):
+    times = import_time(module)
+    heavy = dict(
+        (name, times[name] / 1000.0) for name in HEAVY_MODULES if name in times
+    )
+    return {
+        'module': module,
+        'total_ms': round(times.get(module, 0) / 1000.0, 2),
+        'heavy_ms': heavy,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('modules', nargs='*', default=list(LIGHT_MODULES))
+    args = p.parse_args()
+    print(json.dumps([summary(module) for module in args.modules], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Per-packet and per-frame cost of logging, written directly and queued.
+
+Each of --packets sniffed packets from a watched MAC address goes through
+update_time, and each of --frames frames through MotionAnalyser.analyse
+while the camera settles, so both log a debug line on every call. The
+handlers are the ones setup_logging makes, with syslog sent over UDP to a
+local socket that's drained by a thread, and stdout written to /dev/null.
+
+  direct_off: as before, handlers on the root logger, which is at debug
+      level, with syslog at info.
+  direct_debug: as before, with debug on.
+  queued_off: a LogPipeline with syslog at info, the root logger follows
+      it so debug records aren't created.
+  queued_debug: a LogPipeline with debug on.
+
+`packet_us` and `frame_us` are the median time per call over --repeats
+runs. For the pipelines `drain_ms` is how long the listener took to write
+what was queued after the last run, `dropped` and `suppressed` are the
+records it dropped and rate limited. --rate 0 turns rate limiting off.
+
+    python bench/bench_logging.py --packets 20000 --frames 2000
+    python bench/bench_logging.py --rate 0 --queue-size 100000
+"""
+
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import socket
+import statistics
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.logs import DEBUG_FORMAT, SYSLOG_FORMAT, LogPipeline  # noqa: E402
+from security.motion import MotionAnalyser  # noqa: E402
+from security.threads.capture_packets import update_time  # noqa: E402
+
+MAC = 'aa:aa:aa:aa:aa:aa'
+MODES = ('direct_off', 'direct_debug', 'queued_off', 'queued_debug')
+
+
+class FakePacket(object):
+    addr2 = MAC
+    addr3 = None
+
+    def __getitem__(self, layer):
+        return self
+
+
+class FakeState(object):
+
+    def update_last_mac(self, mac):
+        pass
+
+
+class FakeNetwork(object):
+    state = FakeState()
+
+
+def syslog_sink():
+    """A UDP socket standing in for syslog, drained by a thread."""
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+
+    def drain():
+        while True:
+            try:
+                sink.recv(65536)
+            except OSError:
+                return
+
+    Thread(target=drain, daemon=True).start()
+    return sink
+
+
+def make_handlers(sink, devnull, debug):
+    syslog_handler = logging.handlers.SysLogHandler(address=sink.getsockname())
+    syslog_handler.setFormatter(SYSLOG_FORMAT)
+    syslog_handler.setLevel(logging.DEBUG if debug else logging.INFO)
+    stdout_handler = logging.StreamHandler(devnull)
+    stdout_handler.setFormatter(DEBUG_FORMAT)
+    stdout_handler.setLevel(logging.DEBUG if debug else logging.CRITICAL)
+    return [syslog_handler, stdout_handler]
+
+
+def per_call_us(func, count, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(count):
+            func()
+        times.append((time.perf_counter() - started) / count * 1e6)
+    return round(statistics.median(times), 2)
+
+
+def run(mode, args, sink, devnull):
+    root = logging.getLogger()
+    handlers = make_handlers(sink, devnull, debug=mode.endswith('debug'))
+    pipeline = None
+    if mode.startswith('direct'):
+        root.setLevel(logging.DEBUG)
+        for handler in handlers:
+            root.addHandler(handler)
+    else:
+        rate = args.rate or float('inf')
+        pipeline = LogPipeline(handlers, queue_size=args.queue_size, rate=rate, burst=max(rate, 1))
+        pipeline.start()
+
+    network, packet = FakeNetwork(), FakePacket()
+    analyser = MotionAnalyser(settle_time=float('inf'))
+    analyser.start()
+    result = {
+        'packet_us': per_call_us(lambda: update_time(network, (MAC,), packet), args.packets, args.repeats),
+        'frame_us': per_call_us(lambda: analyser.analyse(None), args.frames, args.repeats),
+    }
+
+    if pipeline is None:
+        for handler in handlers:
+            root.removeHandler(handler)
+    else:
+        started = time.perf_counter()
+        pipeline.stop()
+        result['drain_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        result.update(pipeline.stats())
+        root.removeHandler(pipeline.handler)
+    for handler in handlers:
+        handler.close()
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--packets', type=int, default=20000)
+    p.add_argument('--frames', type=int, default=2000)
+    p.add_argument('--repeats', type=int, default=5)
+    p.add_argument('--rate', type=float, default=5, help='records a second from a line, 0 for no limit')
+    p.add_argument('--queue-size', type=int, default=1000)
+    p.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = p.parse_args()
+
+    sink = syslog_sink()
+    with open(os.devnull, 'w') as devnull:
+        results = dict((mode, run(mode, args, sink, devnull)) for mode in args.modes)
+    sink.close()
+    print(json.dumps({'rate': args.rate, 'queue_size': args.queue_size, 'modes': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""Cost and accuracy of motion detection at each motion_analysis_size.
+
+For each of --sizes a daemon with one fake camera runs in its own process:
+the camera feeds motion vector frames of that size to MotionAnalyser at
+--framerate, with motion_detection_setting scaled from --motion-size as
+Camera.motion_thresholds does, and a detect_motion thread watches it.
+`cpu_percent` is the daemon's CPU use, which includes waking up for each
+frame, and `us_per_frame` the time of one analyse call in a tight loop.
+The encoder's own work, which runs on the GPU, shrinks with `macroblocks`.
+
+Accuracy is measured on generated frames: an object a fifth of the frame
+wide moving a tenth of the frame width per frame, and noise frames. Noise
+and motion are in pixels of the analysed stream, so both shrink with it.
+
+    python bench/bench_motion_size.py --sizes 1280x720 640x360 320x180
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Future
+from queue import Queue
+from threading import Event, Thread
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.cameras import CameraGroup  # noqa: E402
+from security.motion import MOTION_DTYPE, MotionAnalyser, motion_grid, scale_thresholds  # noqa: E402
+from security.state import State  # noqa: E402
+from security.threads.detect_motion import detect_motion  # noqa: E402
+
+# Standard deviation of the noise vectors at --motion-size, in pixels.
+NOISE = 6
+
+
+class FakeSettings(object):
+
+    def __init__(self, motion_size, analysis_size, setting, framerate):
+        self.cameras = ()
+        self.thumbnail_size = (0, 0)
+        self.motion_size = motion_size
+        self.motion_analysis_size = analysis_size
+        self.motion_detection_setting = setting
+        self.framerate = framerate
+
+    def for_camera(self, name):
+        return self
+
+
+class FakeNetwork(object):
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.state = State(self)
+
+
+def noise_frame(rng, shape, scale):
+    a = np.zeros(shape, dtype=MOTION_DTYPE)
+    a['x'] = np.clip(rng.normal(0, NOISE * scale, shape), -128, 127)
+    a['y'] = np.clip(rng.normal(0, NOISE * scale, shape), -128, 127)
+    return a
+
+
+def object_frame(rng, shape, scale, motion_size):
+    a = noise_frame(rng, shape, scale)
+    rows, cols = shape
+    height, width = max(1, rows // 4), max(1, (cols - 1) // 5)
+    row = int(rng.integers(0, rows - height + 1))
+    col = int(rng.integers(0, cols - width))
+    a['x'][row:row + height, col:col + width] = min(127, motion_size[0] * scale / 10)
+    return a
+
+
+class FakeCamera(object):
+    """Analyses generated noise frames at `motion_analysis_size` while detecting."""
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.framerate = settings.framerate
+        self.queue = Queue()
+        self.motion_detected = Event()
+        self.wake_sensor = None
+        self.detecting = Event()
+        scale = float(settings.motion_analysis_size[0]) / settings.motion_size[0]
+        shape = motion_grid(settings.motion_analysis_size)
+        rng = np.random.default_rng(0)
+        self.frames = [noise_frame(rng, shape, scale) for _ in range(10)]
+        self.analyser = MotionAnalyser(*scale_thresholds(
+            settings.motion_detection_setting,
+            settings.motion_size,
+            settings.motion_analysis_size
+        ), settle_time=0)
+        self.frames_analysed = 0
+        Thread(target=self._encoder, daemon=True).start()
+
+    @classmethod
+    def from_settings(cls, settings, name='security', thumbnails=None):
+        return cls(name, settings)
+
+    def _encoder(self):
+        interval = 1.0 / self.framerate
+        while True:
+            self.detecting.wait()
+            frame = self.frames[self.frames_analysed % len(self.frames)]
+            if self.analyser.analyse(frame):
+                self.motion_detected.set()
+            self.frames_analysed += 1
+            time.sleep(interval)
+
+    def start_motion_detection(self):
+        self.detecting.set()
+
+    def stop_motion_detection(self):
+        self.detecting.clear()
+
+    def trigger_alarm(self):
+        future = Future()
+        future.set_result([])
+        return future
+
+
+def run_daemon(args, analysis_size, results):
+    settings = FakeSettings(tuple(args.motion_size), analysis_size, tuple(args.setting), args.framerate)
+    network = FakeNetwork(settings)
+    camera = CameraGroup.from_settings(settings, backend=FakeCamera).get()
+    Thread(target=detect_motion, args=(network, camera), daemon=True).start()
+    frames = camera.frames
+    started = time.perf_counter()
+    for i in range(args.repeats):
+        camera.analyser.analyse(frames[i % len(frames)])
+    us_per_frame = (time.perf_counter() - started) / args.repeats * 1e6
+    network.state.update_state('armed')
+    time.sleep(0.5)
+    started_cpu, started = time.process_time(), time.perf_counter()
+    time.sleep(args.seconds)
+    cpu = 100.0 * (time.process_time() - started_cpu) / (time.perf_counter() - started)
+    results.put({
+        'cpu_percent': round(cpu, 2),
+        'us_per_frame': round(us_per_frame, 1),
+    })
+
+
+def accuracy(args, analysis_size, frames=500):
+    scale = float(analysis_size[0]) / args.motion_size[0]
+    shape = motion_grid(analysis_size)
+    magnitude, vectors = scale_thresholds(tuple(args.setting), tuple(args.motion_size), analysis_size)
+    analyser = MotionAnalyser(magnitude, vectors, settle_time=0)
+    rng = np.random.default_rng(1)
+    detected = sum(analyser.analyse(object_frame(rng, shape, scale, args.motion_size)) for _ in range(frames))
+    false = sum(analyser.analyse(noise_frame(rng, shape, scale)) for _ in range(frames))
+    return {
+        'thresholds': [magnitude, vectors],
+        'detected_percent': round(100.0 * detected / frames, 1),
+        'false_positive_percent': round(100.0 * false / frames, 1),
+    }
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--sizes', type=parse_size, nargs='+', default=[(1280, 720), (640, 360), (320, 180)])
+    p.add_argument('--motion-size', type=int, nargs=2, default=[1280, 720])
+    p.add_argument('--setting', type=int, nargs=2, default=[60, 10])
+    p.add_argument('--seconds', type=float, default=5)
+    p.add_argument('--framerate', type=int, default=30)
+    p.add_argument('--repeats', type=int, default=10000)
+    args = p.parse_args()
+
+    results = []
+    for size in args.sizes:
+        rows, cols = motion_grid(size)
+        # A fresh process per size so threads from the previous run don't count.
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_daemon, args=(args, size, queue))
+        process.start()
+        result = queue.get()
+        process.terminate()
+        process.join()
+        result.update(accuracy(args, size))
+        results.append(dict(
+            motion_analysis_size='{0}x{1}'.format(*size),
+            macroblocks=rows * (cols - 1),
+            **result
+        ))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
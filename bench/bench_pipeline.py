@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""Offline replay of the detection pipeline, compared against a baseline.
+
+Each stage runs in a fresh process so its peak RSS is its own.
+
+  motion: motion vector frames through MotionAnalyser, as the encoder feeds
+      them to MotionDetector.analyse. Frames are timed at --framerate so the
+      settle time and trigger latency are in stream time. --motion replays
+      a recording: a .motion trace from trace_directory, which keeps its
+      frame times, a .npy array of frames or the raw motion_output of a
+      picamera recording with --motion-size. --motion-events is a JSON
+      list of [first, last] frame numbers with motion, without it false
+      positives and misses aren't counted. With no recording, sensor noise
+      with --events objects crossing the frame is generated.
+  packets: 802.11 frames through update_time, the capture_packets callback,
+      into State. --pcap replays a capture, such as one recorded to
+      trace_directory, otherwise probe requests and
+      data frames from the phones in --macs and from other devices are
+      generated. There is no BPF filter so every packet is dissected.
+  notify: --transitions state changes through State and the notifier thread
+      to a fake telegram_send_message.
+  jpeg: synthetic JPEG frames through the preview FrameBuffer to a reader
+      thread, and through make_thumbnail.
+
+    python bench/bench_pipeline.py --save-baseline bench/baseline_pipeline.json
+    python bench/bench_pipeline.py --baseline bench/baseline_pipeline.json
+
+With --baseline the exit status is 1 if a metric is more than --tolerance
+worse than in the baseline. Stages run with different options than the
+baseline aren't compared.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from threading import Event, Thread
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.motion import MOTION_DTYPE, MotionAnalyser  # noqa: E402
+from security.preview import FrameBuffer  # noqa: E402
+from security.recorder import MotionTrace  # noqa: E402
+from security.state import State  # noqa: E402
+from security.threads.capture_packets import update_time  # noqa: E402
+from security.threads.notifier import notifier  # noqa: E402
+from security.thumbnails import make_thumbnail  # noqa: E402
+
+STAGES = ('motion', 'packets', 'notify', 'jpeg')
+
+# Whether more or less is better. Metrics not listed aren't compared.
+HIGHER = 'higher'
+LOWER = 'lower'
+METRICS = {
+    'frames_per_sec': HIGHER,
+    'packets_per_sec': HIGHER,
+    'thumbnails_per_sec': HIGHER,
+    'false_positives': LOWER,
+    'missed': LOWER,
+    'false_matches': LOWER,
+    'trigger_latency_ms_median': LOWER,
+    'trigger_latency_ms_max': LOWER,
+    'notify_latency_ms_median': LOWER,
+    'notify_latency_ms_p99': LOWER,
+    'peak_rss_mb': LOWER,
+}
+
+MY_MAC = '02:00:00:00:00:01'
+ACCESS_POINT = '02:00:00:00:00:02'
+BROADCAST = 'ff:ff:ff:ff:ff:ff'
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+
+
+class FakeNetwork(object):
+    """Records when each notification would have been sent."""
+
+    def __init__(self):
+        self.settings = FakeSettings()
+        self.state = State(self)
+        self.sent = []
+        self.message_sent = Event()
+
+    def telegram_send_message(self, message):
+        self.sent.append(time.perf_counter())
+        self.message_sent.set()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def motion_shape(motion_size):
+    """Rows and columns of macroblocks, with the encoder's extra column."""
+    width, height = motion_size
+    return (height + 15) // 16, (width + 15) // 16 + 1
+
+
+def synthetic_motion(args):
+    """Sensor noise with objects crossing the frame.
+
+    Returns:
+        (tuple): (frames, events), events are [first, last] frame numbers.
+    """
+    rng = np.random.default_rng(args.seed)
+    rows, cols = motion_shape(args.motion_size)
+    frames = np.zeros((args.frames, rows, cols), dtype=MOTION_DTYPE)
+    # Single macroblocks with long vectors, mostly from light changes and
+    # compression, with the odd flicker across a handful at once.
+    for i in range(args.frames):
+        frames[i]['x'] = np.clip(rng.normal(0, 4, (rows, cols)), -128, 127)
+        frames[i]['y'] = np.clip(rng.normal(0, 4, (rows, cols)), -128, 127)
+        frames[i]['sad'] = rng.integers(0, 1000, (rows, cols))
+        spikes = rng.poisson(args.noise)
+        if rng.random() < 0.02:
+            spikes += rng.integers(4, 12)
+        at = rng.integers(0, rows * cols, spikes)
+        frames[i]['x'].flat[at] = rng.integers(45, 90, spikes)
+    events = []
+    gap = args.frames // (args.events + 1)
+    for n in range(args.events):
+        first = gap * (n + 1)
+        length = min(gap, int(rng.integers(args.framerate, args.framerate * 4)))
+        size = int(rng.integers(4, 8))
+        row = int(rng.integers(0, rows - size))
+        for i in range(length):
+            col = min(cols - size, i * (cols - size) // length)
+            block = frames[first + i][row:row + size, col:col + size]
+            block['x'] = rng.integers(50, 100, block.shape)
+            block['y'] = rng.integers(-30, 30, block.shape)
+        events.append([first, first + length - 1])
+    return frames, events
+
+
+def load_motion(args):
+    """Returns:
+        (tuple): (frames, times, events), frames are (time, vectors).
+    """
+    if args.motion.endswith('.motion'):
+        trace = MotionTrace(args.motion)
+        frames = trace
+        times = trace.records['time'] if trace.records is not None else [t for t, _ in trace]
+    else:
+        if args.motion.endswith('.npy'):
+            vectors = np.load(args.motion, mmap_mode='r')
+        else:
+            rows, cols = motion_shape(args.motion_size)
+            vectors = np.fromfile(args.motion, dtype=MOTION_DTYPE).reshape(-1, rows, cols)
+        times = [i / args.framerate for i in range(len(vectors))]
+        frames = list(zip(times, vectors))
+    events = None
+    if args.motion_events:
+        with open(args.motion_events) as f:
+            events = json.load(f)
+    return frames, times, events
+
+
+def stage_motion(args):
+    if args.motion:
+        frames, times, events = load_motion(args)
+    else:
+        vectors, events = synthetic_motion(args)
+        times = [i / args.framerate for i in range(len(vectors))]
+        frames = list(zip(times, vectors))
+    magnitude, vectors = args.motion_detection_setting
+    analyser = MotionAnalyser(magnitude, vectors)
+    analyser.start(now=times[0] if len(times) else 0)
+    triggers = []
+    count = 0
+    started = time.perf_counter()
+    for i, (now, frame) in enumerate(frames):
+        if analyser.analyse(frame, now=now):
+            triggers.append(i)
+        count += 1
+    elapsed = time.perf_counter() - started
+    result = {
+        'frames': count,
+        'frames_per_sec': round(count / elapsed, 1),
+        'us_per_frame': round(elapsed / count * 1e6, 1),
+        'triggered_frames': len(triggers),
+    }
+    if events is None:
+        return result
+
+    latencies = []
+    for first, last in events:
+        hits = [i for i in triggers if first <= i <= last]
+        if hits:
+            latencies.append((times[hits[0]] - times[first]) * 1e3)
+    # Consecutive triggered frames outside an event count as one false
+    # positive, that's one alarm.
+    false_positives = 0
+    previous = None
+    for i in triggers:
+        outside = not any(first <= i <= last for first, last in events)
+        if outside and previous != i - 1:
+            false_positives += 1
+        previous = i if outside else None
+    result.update({
+        'events': len(events),
+        'missed': len(events) - len(latencies),
+        'false_positives': false_positives,
+    })
+    if latencies:
+        result['trigger_latency_ms_median'] = round(statistics.median(latencies), 1)
+        result['trigger_latency_ms_max'] = round(max(latencies), 1)
+    return result
+
+
+def synthetic_pcap(args, path):
+    """Write a capture with probe requests and data frames, a share from --macs.
+
+    Returns:
+        (int): The number of packets from --macs.
+    """
+    from scapy.all import Dot11, Dot11ProbeReq, RadioTap, wrpcap
+
+    rng = np.random.default_rng(args.seed)
+    others = ['02:00:00:00:{0:02x}:{1:02x}'.format(i // 256, i % 256) for i in range(3, 200)]
+    packets = []
+    expected = 0
+    for _ in range(args.packets):
+        phone = rng.random() < args.phone_share
+        mac = args.macs[rng.integers(len(args.macs))] if phone else others[rng.integers(len(others))]
+        expected += phone
+        if rng.random() < 0.5:
+            dot11 = Dot11(type=0, subtype=4, addr1=BROADCAST, addr2=mac, addr3=BROADCAST) / Dot11ProbeReq()
+        else:
+            dot11 = Dot11(type=2, subtype=0, addr1=MY_MAC, addr2=ACCESS_POINT, addr3=mac)
+        packets.append(RadioTap() / dot11 / bytes(int(rng.integers(0, 200))))
+    wrpcap(path, packets)
+    return expected
+
+
+def stage_packets(args):
+    from scapy.all import PcapReader
+
+    network = FakeNetwork()
+    expected = None
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.pcap
+        if path is None:
+            path = os.path.join(directory, 'packets.pcap')
+            expected = synthetic_pcap(args, path)
+        count = 0
+        matched = 0
+        started = time.perf_counter()
+        # Reading is included, scapy dissects each packet before the
+        # callback the same way when sniffing.
+        with PcapReader(path) as reader:
+            for packet in reader:
+                count += 1
+                if update_time(network, args.macs, packet) is not None:
+                    matched += 1
+        elapsed = time.perf_counter() - started
+    result = {
+        'packets': count,
+        'matched': matched,
+        'packets_per_sec': round(count / elapsed, 1),
+        'last_mac': network.state.last_mac,
+    }
+    if expected is not None:
+        result['false_matches'] = abs(matched - expected)
+    return result
+
+
+def stage_notify(args):
+    network = FakeNetwork()
+    Thread(target=notifier, args=(network,), daemon=True).start()
+    latencies = []
+    calls = []
+    for i in range(args.transitions):
+        network.message_sent.clear()
+        started = time.perf_counter()
+        network.state.update_state('armed' if i % 2 == 0 else 'disarmed')
+        calls.append(time.perf_counter() - started)
+        network.message_sent.wait()
+        latencies.append(network.sent[-1] - started)
+    return {
+        'transitions': args.transitions,
+        'update_state_us_median': round(statistics.median(calls) * 1e6, 1),
+        'notify_latency_ms_median': round(statistics.median(latencies) * 1e3, 3),
+        'notify_latency_ms_p99': round(percentile(latencies, 0.99) * 1e3, 3),
+    }
+
+
+def synthetic_jpegs(args, count=8):
+    from PIL import Image
+
+    rng = np.random.default_rng(args.seed)
+    width, height = args.jpeg_size
+    jpegs = []
+    for _ in range(count):
+        # Smooth gradients plus noise compress roughly like a camera image.
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 20, (height, width, 3))
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, 'JPEG', quality=85)
+        jpegs.append(buf.getvalue())
+    return jpegs
+
+
+def stage_jpeg(args):
+    jpegs = synthetic_jpegs(args)
+    frames = FrameBuffer()
+    received = []
+
+    def reader():
+        sequence = 0
+        while True:
+            sequence, frame = frames.wait(sequence)
+            if frame is None:
+                return
+            received.append(sequence)
+
+    thread = Thread(target=reader, daemon=True)
+    thread.start()
+    started = time.perf_counter()
+    for i in range(args.jpeg_frames):
+        jpeg = jpegs[i % len(jpegs)]
+        # Split in two as if the encoder's buffer was smaller than a frame.
+        frames.write(jpeg[:len(jpeg) // 2])
+        frames.write(jpeg[len(jpeg) // 2:])
+    elapsed = time.perf_counter() - started
+    frames.close()
+    thread.join()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, jpeg in enumerate(jpegs):
+            paths.append(os.path.join(directory, '{0}.jpg'.format(i)))
+            with open(paths[-1], 'wb') as f:
+                f.write(jpeg)
+        thumbnails_started = time.perf_counter()
+        for i in range(args.thumbnails):
+            make_thumbnail(paths[i % len(paths)], tuple(args.thumbnail_size))
+        thumbnails_elapsed = time.perf_counter() - thumbnails_started
+    return {
+        'frames': args.jpeg_frames,
+        'frame_bytes': sum(len(jpeg) for jpeg in jpegs) // len(jpegs),
+        'frames_per_sec': round(args.jpeg_frames / elapsed, 1),
+        'frames_read': len(received),
+        'thumbnails_per_sec': round(args.thumbnails / thumbnails_elapsed, 1),
+    }
+
+
+def stage_config(args, stage):
+    """The options a stage's results depend on, for comparing with a baseline."""
+    common = {'seed': args.seed}
+    if stage == 'motion':
+        return dict(
+            common,
+            motion=args.motion,
+            motion_events=args.motion_events,
+            motion_size=args.motion_size,
+            motion_detection_setting=args.motion_detection_setting,
+            framerate=args.framerate,
+            frames=args.frames,
+            events=args.events,
+            noise=args.noise,
+        )
+    if stage == 'packets':
+        return dict(common, pcap=args.pcap, macs=args.macs, packets=args.packets, phone_share=args.phone_share)
+    if stage == 'notify':
+        return {'transitions': args.transitions}
+    return dict(
+        common,
+        jpeg_size=args.jpeg_size,
+        jpeg_frames=args.jpeg_frames,
+        thumbnails=args.thumbnails,
+        thumbnail_size=args.thumbnail_size,
+    )
+
+
+def run_stage(stage, args, results):
+    result = globals()['stage_' + stage](args)
+    # Kilobytes on Linux.
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    results.put(result)
+
+
+def run(stage, args):
+    # Spawned rather than forked so memory used by earlier stages doesn't
+    # count towards the peak RSS.
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return {'config': stage_config(args, stage), 'results': result}
+
+
+def compare(baseline, stages, tolerance):
+    """Return the metrics more than `tolerance` worse than in `baseline`."""
+    regressions = []
+    for stage, current in stages.items():
+        before = baseline.get('stages', {}).get(stage)
+        if before is None or before['config'] != current['config']:
+            continue
+        for metric, direction in METRICS.items():
+            if metric not in before['results'] or metric not in current['results']:
+                continue
+            old = before['results'][metric]
+            new = current['results'][metric]
+            if direction == HIGHER:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                regressions.append({'stage': stage, 'metric': metric, 'baseline': old, 'current': new})
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--motion')
+    p.add_argument('--motion-events')
+    p.add_argument('--motion-size', type=int, nargs=2, default=[1280, 720])
+    p.add_argument('--motion-detection-setting', type=int, nargs=2, default=[60, 10])
+    p.add_argument('--framerate', type=int, default=5)
+    p.add_argument('--frames', type=int, default=3000)
+    p.add_argument('--events', type=int, default=20)
+    p.add_argument('--noise', type=float, default=1.0,
+                   help='Mean single-macroblock spikes per generated frame')
+    p.add_argument('--pcap')
+    p.add_argument('--macs', nargs='+', default=['02:00:00:00:aa:01', '02:00:00:00:aa:02'])
+    p.add_argument('--packets', type=int, default=5000)
+    p.add_argument('--phone-share', type=float, default=0.2)
+    p.add_argument('--transitions', type=int, default=2000)
+    p.add_argument('--jpeg-size', type=int, nargs=2, default=[640, 480])
+    p.add_argument('--jpeg-frames', type=int, default=5000)
+    p.add_argument('--thumbnails', type=int, default=50)
+    p.add_argument('--thumbnail-size', type=int, nargs=2, default=[320, 240])
+    p.add_argument('--baseline')
+    p.add_argument('--save-baseline')
+    p.add_argument('--tolerance', type=float, default=0.25)
+    args = p.parse_args()
+
+    output = {'stages': {stage: run(stage, args) for stage in args.stages}}
+    if args.baseline:
+        with open(args.baseline) as f:
+            output['regressions'] = compare(json.load(f), output['stages'], args.tolerance)
+    print(json.dumps(output, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'stages': output['stages']}, f, indent=2)
+            f.write('\n')
+    if output.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
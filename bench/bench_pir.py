@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Idle CPU and false triggers with a PIR sensor fused with the motion vectors.
+
+PIR edges and motion vector frames are replayed through a PIRSensor and
+MotionAnalyser for each pir_mode:
+
+  off: every frame is analysed, the vectors alone trigger.
+  gate: frames only count while the PIR is active, as MotionAnalyser does
+      with the sensor as its gate.
+  wake: the encoder only runs while the PIR is active, as detect_motion
+      does with a wake_sensor. Motion vectors are ignored for the settle
+      time after each start.
+
+--motion and --pir replay a .motion and a .pir trace from trace_directory,
+--events-file is a JSON list of [start, end] seconds from the start of the
+motion trace with real motion. Without traces, --minutes of frames at --fps
+are generated at --motion-size with --events people walking past, who trip
+the PIR and move the vectors, plus bursts of vectors without the PIR, like
+swaying trees or headlights, and PIR triggers without vectors, like
+sunlight on a radiator, --false-alarms of each per hour.
+
+After a trigger detection stops for --cooldown seconds, as for a capture.
+`analyse_cpu_percent` is the time spent in the encoder's callback,
+wrapping the buffer and analysing it, against the length of the replay.
+`encoder_percent` is the share of the replay the encoder runs, which is
+where most of the power goes.
+
+    python bench/bench_pir.py --minutes 60 --events 20
+    python bench/bench_pir.py --motion front.motion --pir pir14.pir --events-file events.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.motion import MOTION_DTYPE, MotionAnalyser, motion_grid, scale_thresholds  # noqa: E402
+from security.pir import PIRSensor  # noqa: E402
+from security.recorder import MotionTrace, read_pir_trace  # noqa: E402
+
+MODES = ('off', 'gate', 'wake')
+
+
+class FakeGPIO(object):
+    BCM = IN = PUD_DOWN = BOTH = 0
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        pass
+
+    def input(self, pin):
+        return 0
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        pass
+
+    def remove_event_detect(self, pin):
+        pass
+
+
+def synthetic(args):
+    """Return (frames, pir edges, events), frames as (time, vectors)."""
+    rng = np.random.default_rng(args.seed)
+    seconds = args.minutes * 60
+    shape = motion_grid(args.motion_size)
+    scale = args.motion_size[0] / 1280.0
+    events = sorted((start, start + 8) for start in rng.uniform(0, seconds - 20, args.events))
+    bursts = sorted(
+        (start, start + rng.uniform(1, 2))
+        for start in rng.uniform(0, seconds, int(args.false_alarms * args.minutes / 60))
+    )
+    pir = [(start + 0.5, end + rng.uniform(2, 4)) for start, end in events]
+    pir += [
+        (start, start + rng.uniform(2, 3))
+        for start in rng.uniform(0, seconds, int(args.false_alarms * args.minutes / 60))
+    ]
+    edges = []
+    for start, end in sorted(pir):
+        if edges and start <= edges[-1][0]:
+            # Overlapping, the output stays high.
+            edges[-1] = (max(edges[-1][0], end), False)
+            continue
+        edges.extend([(start, True), (end, False)])
+
+    def frames():
+        for i in range(int(seconds * args.fps)):
+            now = i / args.fps
+            a = np.zeros(shape, dtype=MOTION_DTYPE)
+            a['x'] = np.clip(rng.normal(0, 8 * scale, shape), -128, 127)
+            a['y'] = np.clip(rng.normal(0, 8 * scale, shape), -128, 127)
+            for start, end in events:
+                if start <= now < end:
+                    col = int((now - start) / (end - start) * (shape[1] - 4))
+                    a['x'][shape[0] // 3:shape[0] // 3 + 4, col:col + 3] = min(127, 100 * scale)
+            for start, end in bursts:
+                if start <= now < end:
+                    a['x'][rng.random(shape) < 0.3] = min(127, 90 * scale)
+            yield now, a
+
+    return frames(), edges, events
+
+
+def replay(args):
+    trace = MotionTrace(args.motion)
+    start = trace[0][0] if len(trace) else 0
+    edges = [(now - start, level) for now, level in read_pir_trace(args.pir)] if args.pir else []
+    events = []
+    if args.events_file:
+        with open(args.events_file) as f:
+            events = [tuple(event) for event in json.load(f)]
+
+    def frames():
+        for now, a in trace:
+            yield now - start, a
+
+    return frames(), edges, events
+
+
+class Run(object):
+    """One pir_mode over the replay."""
+
+    def __init__(self, mode, thresholds, hold, cooldown):
+        self.mode = mode
+        self.sensor = PIRSensor(0, hold=hold, gpio=FakeGPIO())
+        self.analyser = MotionAnalyser(*thresholds, settle_time=1)
+        if mode != 'off':
+            self.analyser.gate = self.sensor.active
+        self.cooldown = cooldown
+        self.resume_at = 0
+        self.recording = mode != 'wake'
+        self.encoder_frames = 0
+        self.analysed = 0
+        self.cpu = 0.0
+        self.triggers = []
+
+    def frame(self, now, buf, shape):
+        if now < self.resume_at:
+            return
+        if self.mode == 'wake':
+            active = self.sensor.active(now)
+            if active and not self.recording:
+                self.analyser.start(now=now)
+            self.recording = active
+        if not self.recording:
+            return
+        self.encoder_frames += 1
+        started = time.thread_time()
+        # As PiMotionAnalysis.write does with the encoder's buffer.
+        a = np.frombuffer(buf, dtype=MOTION_DTYPE).reshape(shape)
+        motion = self.analyser.analyse(a, now=now)
+        self.cpu += time.thread_time() - started
+        self.analysed += 1
+        if motion:
+            self.triggers.append(now)
+            self.resume_at = now + self.cooldown
+            self.analyser.start(now=self.resume_at)
+
+    def result(self, events, seconds, frame_count):
+        detected = {}
+        false = 0
+        for trigger in self.triggers:
+            matches = [event for event in events if event[0] <= trigger <= event[1] + 1]
+            if not matches:
+                false += 1
+            for event in matches:
+                detected.setdefault(event, trigger - event[0])
+        hours = seconds / 3600.0
+        return {
+            'detected': len(detected),
+            'missed': len(events) - len(detected),
+            'latency_s_median': round(statistics.median(detected.values()), 2) if detected else None,
+            'false_triggers': false,
+            'false_triggers_per_hour': round(false / hours, 1) if hours else None,
+            'encoder_percent': round(100.0 * self.encoder_frames / max(frame_count, 1), 1),
+            'frames_analysed': self.analysed,
+            'analyse_cpu_percent': round(100.0 * self.cpu / seconds, 4) if seconds else None,
+        }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--motion', help='a .motion trace to replay')
+    p.add_argument('--pir', help='a .pir trace to replay')
+    p.add_argument('--events-file', help='JSON [start, end] seconds of real motion in the traces')
+    p.add_argument('--minutes', type=float, default=60)
+    p.add_argument('--fps', type=float, default=5)
+    p.add_argument('--events', type=int, default=20)
+    p.add_argument('--false-alarms', type=float, default=30, help='of each kind per hour')
+    p.add_argument('--motion-size', type=int, nargs=2, default=[320, 180])
+    p.add_argument('--setting', type=int, nargs=2, default=[60, 10], help='for 1280x720')
+    p.add_argument('--hold', type=float, default=5)
+    p.add_argument('--cooldown', type=float, default=4)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    if args.motion:
+        frames, edges, events = replay(args)
+        thresholds = tuple(args.setting)
+    else:
+        frames, edges, events = synthetic(args)
+        thresholds = scale_thresholds(tuple(args.setting), (1280, 720), tuple(args.motion_size))
+    runs = [Run(mode, thresholds, args.hold, args.cooldown) for mode in MODES]
+    edges = list(edges)
+    frame_count = 0
+    now = 0
+    for now, a in frames:
+        while edges and edges[0][0] <= now:
+            when, level = edges.pop(0)
+            for run in runs:
+                run.sensor.edge(level, now=when)
+        buf = a.tobytes()
+        for run in runs:
+            run.frame(now, buf, a.shape)
+        frame_count += 1
+    seconds = now + (1.0 / args.fps if frame_count else 0)
+    print(json.dumps({
+        'frames': frame_count,
+        'seconds': round(seconds, 1),
+        'events': len(events),
+        'thresholds': list(thresholds),
+        'modes': dict((run.mode, run.result(events, seconds, frame_count)) for run in runs),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""CPU cost of the MJPEG preview server per connected client.
+
+A fake camera writes JPEG-sized frames into a FrameBuffer at a fixed rate
+while N clients read the stream. The server runs in its own process so
+its CPU time can be measured separately from the clients.
+
+    python bench/bench_preview.py --clients 0 1 2 4 --seconds 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.preview import FrameBuffer, PreviewServer  # noqa: E402
+
+
+def serve(port_pipe, framerate, frame_size, seconds, max_clients):
+    frames = FrameBuffer()
+    server = PreviewServer(frames, address=('127.0.0.1', 0), max_clients=max_clients)
+    server.start()
+    port_pipe.send(server.server_address[1])
+    port_pipe.recv()
+
+    frame = b'\xff\xd8' + os.urandom(frame_size) + b'\xff\xd9'
+    started_cpu = time.process_time()
+    started = time.time()
+    count = 0
+    while time.time() - started < seconds:
+        frames.write(frame)
+        count += 1
+        time.sleep(max(0, started + count / framerate - time.time()))
+    cpu = time.process_time() - started_cpu
+    port_pipe.send({'cpu_s': cpu, 'frames': count})
+    server.stop()
+
+
+def client(port, received):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(b'GET /stream.mjpg HTTP/1.0\r\n\r\n')
+    total = 0
+    try:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            total += len(data)
+    except OSError:
+        pass
+    received.append(total)
+
+
+def run(clients, framerate, frame_size, seconds):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=serve,
+        args=(child, framerate, frame_size, seconds, max(clients, 1))
+    )
+    process.start()
+    port = parent.recv()
+    received = []
+    threads = [Thread(target=client, args=(port, received), daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    parent.send('go')
+    result = parent.recv()
+    process.join()
+    result['clients'] = clients
+    result['cpu_percent'] = round(100 * result['cpu_s'] / seconds, 2)
+    result['mbytes_sent'] = round(sum(received) / 1e6, 2)
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--clients', type=int, nargs='+', default=[0, 1, 2, 4])
+    p.add_argument('--framerate', type=int, default=10)
+    p.add_argument('--frame-size', type=int, default=40000, help='Bytes per JPEG')
+    p.add_argument('--seconds', type=float, default=5)
+    args = p.parse_args()
+
+    results = [run(n, args.framerate, args.frame_size, args.seconds) for n in args.clients]
+    baseline = results[0]['cpu_s'] if results[0]['clients'] == 0 else 0
+    for result in results:
+        if result['clients']:
+            result['cpu_per_client_percent'] = round(
+                100 * (result['cpu_s'] - baseline) / args.seconds / result['clients'], 3
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Overhead of the sampling profiler at several sampling rates.
+
+--threads worker threads run a mix of motion vector counting and pure
+Python work, the busy threads of a loaded box, while --idle threads wait
+on queues like the bot and notifier. Worker throughput is measured
+without the profiler and while profiling at each --intervals, --repeat
+times in turn, and the medians are reported.
+
+    python bench/bench_profiler.py --threads 4 --idle 10 --seconds 2 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from queue import Queue
+from threading import Event, Thread
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.motion import MOTION_DTYPE, count_motion_vectors  # noqa: E402
+from security.profiler import profile  # noqa: E402
+
+
+def work(frame, stop, counts, i):
+    while not stop.is_set():
+        count_motion_vectors(frame, 60)
+        sorted(str(n) for n in range(200))
+        counts[i] += 1
+
+
+def measure(args, interval):
+    frame = np.zeros((45, 81), dtype=MOTION_DTYPE)
+    stop = Event()
+    counts = [0] * args.threads
+    threads = [Thread(target=work, args=(frame, stop, counts, i), daemon=True) for i in range(args.threads)]
+    for _ in range(args.idle):
+        Thread(target=Queue().get, daemon=True).start()
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    before = sum(counts)
+    result = {'interval': interval}
+    if interval is None:
+        time.sleep(args.seconds)
+    else:
+        profiled = profile(args.seconds, interval)
+        result['samples'] = profiled.sample_count
+        result['profiler_cpu_percent'] = round(100 * profiled.profiler_cpu_seconds / profiled.seconds, 2)
+    result['iterations_per_sec'] = round((sum(counts) - before) / args.seconds, 1)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--threads', type=int, default=4)
+    p.add_argument('--idle', type=int, default=10)
+    p.add_argument('--seconds', type=float, default=2)
+    p.add_argument('--intervals', type=float, nargs='+', default=[0.1, 0.01, 0.001])
+    p.add_argument('--repeat', type=int, default=5)
+    args = p.parse_args()
+
+    intervals = [None] + args.intervals
+    runs = dict((interval, []) for interval in intervals)
+    for _ in range(args.repeat):
+        for interval in intervals:
+            runs[interval].append(measure(args, interval))
+    results = []
+    for interval in intervals:
+        result = {'interval': interval}
+        for key in runs[interval][0]:
+            if key != 'interval':
+                result[key] = statistics.median(run[key] for run in runs[interval])
+        results.append(result)
+    baseline = results[0]['iterations_per_sec']
+    for result in results[1:]:
+        result['overhead_percent'] = round(100 * (1 - result['iterations_per_sec'] / baseline), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Motion detection through a night, metered once against scheduled profiles.
+
+A scene goes from daylight through dusk to night and back at dawn, with
+--events objects crossing it and --headlights flashes of light at night.
+Frames of motion vectors are generated at --fps in simulated time and run
+through MotionAnalyser for two strategies:
+
+  metered_once: the day profile is metered at the start and stays locked,
+      as the camera did before night mode.
+  scheduled: a ProfileSwitcher reads the brightness every
+      --profile-interval seconds and switches profile or meters again, as
+      the switch_profiles thread does.
+
+The camera is a simple model. Metering picks an exposure and gain for a
+mean pixel value of 100 within the profile's limits. Objects are seen in
+proportion to how bright the image is and vector noise grows as fewer
+photons are collected. Frames in the METERING_TIME after exposure changes
+have global motion, which the analyser ignores as Camera._apply_profile
+restarts it. An event is detected if any of its frames trigger, triggers
+outside events are false positives. `luminance_us` is the cost of one
+brightness reading from a LUMINANCE_SIZE frame.
+
+    python bench/bench_profiles.py --hours 14 --events 60
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.motion import MOTION_DTYPE, MotionAnalyser  # noqa: E402
+from security.profiles import (  # noqa: E402
+    LUMINANCE_SIZE,
+    METERING_TIME,
+    REFERENCE_EXPOSURE,
+    CameraProfile,
+    ProfileSwitcher,
+    luminance,
+)
+from security.settings import Settings  # noqa: E402
+
+# Scene brightness in luminance() units.
+DAYLIGHT = 2000.0
+NIGHT = 0.3
+HEADLIGHTS = 80.0
+# Mean pixel value metering aims for, and the most gain an ISO 800 gives.
+TARGET = 100.0
+MAX_GAIN = 8.0
+# Pixel value below which objects and noise fade into the dark.
+VISIBLE = 30.0
+OBJECT_MAGNITUDE = 80
+TRANSIENT_MAGNITUDE = 70
+
+
+def scene(t, hours):
+    """Brightness at `t` seconds: dusk over the 2nd to 3rd hour, dawn over the
+    3rd to 2nd last, on a log scale.
+    """
+    dusk = min(max(t / 3600.0 - 2, 0), 1)
+    dawn = min(max(t / 3600.0 - (hours - 3), 0), 1)
+    darkness = (1 - math.cos(math.pi * dusk)) / 2 - (1 - math.cos(math.pi * dawn)) / 2
+    return math.exp(math.log(DAYLIGHT) + darkness * (math.log(NIGHT) - math.log(DAYLIGHT)))
+
+
+def meter(profile, brightness):
+    """Return the (exposure, gain) metering settles on, exposure in units of
+    REFERENCE_EXPOSURE.
+    """
+    max_exposure = 1e6 / (profile.framerate or 30) / REFERENCE_EXPOSURE
+    exposure = profile.shutter_speed / REFERENCE_EXPOSURE if profile.shutter_speed else None
+    gain = profile.iso / 100.0 if profile.iso else None
+    if exposure is None and gain is not None:
+        exposure = min(max_exposure, TARGET / (brightness * gain))
+    elif exposure is None:
+        exposure = min(max_exposure, TARGET / brightness)
+    if gain is None:
+        gain = min(max(TARGET / (brightness * exposure), 1), MAX_GAIN)
+    return exposure, gain
+
+
+class Strategy(object):
+    """One camera running through the night."""
+
+    def __init__(self, name, settings, switcher=None):
+        self.name = name
+        self.settings = settings
+        self.switcher = switcher
+        self.profile = CameraProfile.day(settings)
+        self.analyser = MotionAnalyser(*self.profile.motion_detection_setting, settle_time=1)
+        self.exposure = self.gain = None
+        self.metered_at = None
+        self.meterings = 0
+        self.switches = 0
+        self.blind_frames = 0
+
+    def apply(self, profile, brightness, now):
+        if profile.name != self.profile.name:
+            self.switches += 1
+        self.profile = profile
+        self.exposure, self.gain = meter(profile, brightness)
+        self.metered_at = now
+        self.meterings += 1
+        self.analyser.start(now=now + METERING_TIME)
+        self.analyser.magnitude, self.analyser.vectors = profile.motion_detection_setting
+
+    def reading(self, brightness):
+        """The brightness as measure_luminance would read it."""
+        scale = self.exposure * self.gain
+        return min(255.0, brightness * scale) / scale
+
+    def update(self, brightness, now):
+        if self.switcher is None:
+            return
+        profile = self.switcher.update(self.reading(brightness))
+        if profile is not None:
+            self.apply(profile, brightness, now)
+
+    def frame(self, brightness, noise, objects, transient, now):
+        image = min(255.0, brightness * self.exposure * self.gain)
+        visibility = min(1.0, image / VISIBLE)
+        photons = max(brightness * self.exposure, 1e-3)
+        sigma = self.noise * math.sqrt(TARGET / photons) * visibility
+        x = noise[0] * sigma
+        y = noise[1] * sigma
+        for rows, cols, dx, dy in objects:
+            x[rows, cols] = dx * visibility
+            y[rows, cols] = dy * visibility
+        if now - self.metered_at < METERING_TIME:
+            x[transient] = TRANSIENT_MAGNITUDE
+        a = np.zeros(x.shape, dtype=MOTION_DTYPE)
+        a['x'] = np.clip(x, -128, 127)
+        a['y'] = np.clip(y, -128, 127)
+        if now < self.analyser.started + self.analyser.settle_time:
+            self.blind_frames += 1
+        return self.analyser.analyse(a, now=now)
+
+
+def make_events(rng, count, seconds, duration, shape):
+    events = []
+    for start in sorted(rng.uniform(0, seconds - duration, count)):
+        size = int(rng.integers(5, 9))
+        row = int(rng.integers(0, shape[0] - size))
+        col = int(rng.integers(0, shape[1] - size))
+        angle = rng.uniform(0, 2 * math.pi)
+        events.append((
+            start,
+            start + duration,
+            slice(row, row + size),
+            slice(col, col + size),
+            OBJECT_MAGNITUDE * math.cos(angle),
+            OBJECT_MAGNITUDE * math.sin(angle),
+        ))
+    return events
+
+
+def luminance_us(repeats=1000):
+    width, height = LUMINANCE_SIZE
+    frame = bytes(width * height * 3 // 2)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        luminance(frame, 20000, 2.5)
+    return round((time.perf_counter() - started) / repeats * 1e6, 1)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--hours', type=float, default=14)
+    p.add_argument('--fps', type=float, default=1)
+    p.add_argument('--events', type=int, default=60)
+    p.add_argument('--event-seconds', type=float, default=6)
+    p.add_argument('--headlights', type=int, default=10)
+    p.add_argument('--noise', type=float, default=3)
+    p.add_argument('--profile-interval', type=int, default=60)
+    p.add_argument('--motion-size', type=int, nargs=2, default=[640, 480])
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    width, height = args.motion_size
+    shape = ((height + 15) // 16, (width + 15) // 16 + 1)
+    seconds = args.hours * 3600
+    rng = np.random.default_rng(args.seed)
+    events = make_events(rng, args.events, seconds, args.event_seconds, shape)
+    night = (3 * 3600, seconds - 3 * 3600)
+    headlights = sorted(rng.uniform(night[0], night[1] - 10, args.headlights))
+    transient = rng.random(shape) < 0.3
+
+    settings = Settings(
+        mac_addresses=('02:00:00:00:00:01',),
+        telegram_bot_token='bench',
+        night_mode=True,
+        profile_interval=args.profile_interval
+    )
+    strategies = [
+        Strategy('metered_once', settings),
+        Strategy('scheduled', settings, ProfileSwitcher(settings)),
+    ]
+    results = {}
+    for strategy in strategies:
+        strategy.noise = args.noise
+        strategy.apply(strategy.profile, scene(0, args.hours), 0)
+        if strategy.switcher is not None:
+            strategy.switcher.update(strategy.reading(scene(0, args.hours)))
+        results[strategy.name] = {
+            'detected': 0, 'missed': 0, 'missed_at_night': 0, 'false_positives': 0
+        }
+
+    started = time.perf_counter()
+    detected = dict((s.name, set()) for s in strategies)
+    triggered = dict((s.name, False) for s in strategies)
+    next_reading = args.profile_interval
+    frames = int(seconds * args.fps)
+    for i in range(frames):
+        now = i / args.fps
+        brightness = scene(now, args.hours)
+        if any(start <= now < start + 10 for start in headlights):
+            brightness = max(brightness, HEADLIGHTS)
+        if now >= next_reading:
+            next_reading += args.profile_interval
+            for strategy in strategies:
+                strategy.update(brightness, now)
+        active = [(n, e) for n, e in enumerate(events) if e[0] <= now < e[1]]
+        objects = [(e[2], e[3], e[4], e[5]) for _, e in active]
+        noise = rng.standard_normal((2,) + shape)
+        for strategy in strategies:
+            motion = strategy.frame(brightness, noise, objects, transient, now)
+            if motion and active:
+                detected[strategy.name].update(n for n, _ in active)
+            elif motion and not triggered[strategy.name]:
+                results[strategy.name]['false_positives'] += 1
+            triggered[strategy.name] = motion
+    elapsed = time.perf_counter() - started
+
+    for strategy in strategies:
+        result = results[strategy.name]
+        for n, event in enumerate(events):
+            if n in detected[strategy.name]:
+                result['detected'] += 1
+                continue
+            result['missed'] += 1
+            if night[0] <= event[0] < night[1]:
+                result['missed_at_night'] += 1
+        result.update(
+            meterings=strategy.meterings,
+            profile_switches=strategy.switches,
+            blind_seconds=round(strategy.blind_frames / args.fps, 1),
+        )
+    print(json.dumps({
+        'frames': frames,
+        'events': len(events),
+        'events_at_night': sum(1 for e in events if night[0] <= e[0] < night[1]),
+        'elapsed_s': round(elapsed, 2),
+        'luminance_us': luminance_us(),
+        'strategies': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
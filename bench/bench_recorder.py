@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Cost of recording motion vectors on the live path, and trace sizes.
+
+--frames frames of --motion-size are analysed at --framerate as
+MotionDetector.analyse does, without a recorder and with uncompressed and
+compressed MotionRecorders. Only the time spent in the encoder's callback
+counts, which includes waiting for the GIL while the writer runs.
+`dropped` shows whether the writer keeps up. Each trace is then read back
+through MotionTrace.
+
+    python bench/bench_recorder.py --frames 300 --framerate 30
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.motion import MOTION_DTYPE, MotionAnalyser  # noqa: E402
+from security.recorder import MotionRecorder, MotionTrace  # noqa: E402
+
+
+def make_frames(motion_size, count=20):
+    width, height = motion_size
+    shape = ((height + 15) // 16, (width + 15) // 16 + 1)
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        frame = np.zeros(shape, dtype=MOTION_DTYPE)
+        frame['x'] = np.clip(rng.normal(0, 4, shape), -128, 127)
+        frame['y'] = np.clip(rng.normal(0, 4, shape), -128, 127)
+        frame['sad'] = rng.integers(0, 1000, shape)
+        frames.append(frame)
+    return frames
+
+
+def analyse(frames, count, framerate, recorder=None):
+    """Return the live path's median and maximum microseconds per frame."""
+    analyser = MotionAnalyser(settle_time=0)
+    durations = []
+    started = time.perf_counter()
+    for i in range(count):
+        time.sleep(max(0, started + i / framerate - time.perf_counter()))
+        frame = frames[i % len(frames)]
+        called = time.perf_counter()
+        if recorder is not None:
+            recorder.record(frame)
+        analyser.analyse(frame)
+        durations.append(time.perf_counter() - called)
+    durations.sort()
+    return {
+        'us_per_frame_median': round(durations[len(durations) // 2] * 1e6, 1),
+        'us_per_frame_max': round(durations[-1] * 1e6, 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--frames', type=int, default=300)
+    p.add_argument('--framerate', type=int, default=30)
+    p.add_argument('--motion-size', type=int, nargs=2, default=[1280, 720])
+    args = p.parse_args()
+
+    frames = make_frames(args.motion_size)
+    results = {'without_recorder': analyse(frames, args.frames, args.framerate)}
+    with tempfile.TemporaryDirectory() as directory:
+        for compress in (False, True):
+            path = os.path.join(directory, 'trace.motion')
+            recorder = MotionRecorder(path, compress=compress)
+            live = analyse(frames, args.frames, args.framerate, recorder)
+            started = time.perf_counter()
+            recorder.close()
+            drain = time.perf_counter() - started
+            started = time.perf_counter()
+            with MotionTrace(path) as trace:
+                read = sum(1 for _ in trace)
+            read_elapsed = time.perf_counter() - started
+            results['compressed' if compress else 'uncompressed'] = dict(
+                live,
+                dropped=recorder.dropped,
+                drain_s=round(drain, 3),
+                bytes_per_frame=os.path.getsize(path) // max(recorder.written, 1),
+                read_frames_per_sec=round(read / read_elapsed, 1),
+            )
+            os.remove(path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
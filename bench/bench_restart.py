@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Restart-to-armed time with and without a StateStore, and checkpoint cost.
+
+The phones left --away seconds before the service restarts, just after
+the old process checkpointed, armed if that's longer than packet_timeout
++ 20 seconds and disarmed otherwise. State.check runs every 0.1s as
+monitor_alarm_state does, on a fake clock, until the new process arms.
+
+  fresh: no checkpoint, as before. The phones count as just seen, so it
+      takes packet_timeout + 20 seconds whenever they left.
+  restored: the checkpoint is restored. `restore_ms` is how long a new
+      process takes from starting to having restored it, interpreter
+      startup included.
+
+`save_ms` is the time to write a checkpoint with its fsyncs over --saves
+saves, in --directory, which should be on the SD card to be realistic.
+For crash injection a process saves checkpoints as fast as it can and is
+killed --kills times after a random delay, `restored` counts the
+checkpoints that restored afterwards.
+
+    python bench/bench_restart.py --away 800
+    python bench/bench_restart.py --directory /var/lib/rpi-security --kills 100
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import security.state  # noqa: E402
+from security.state import State  # noqa: E402
+from security.store import StateStore  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MAC = 'aa:aa:aa:bb:bb:bb'
+CHECK_INTERVAL = 0.1
+
+RESTART = """
+import sys, time
+started = time.time()
+sys.path.insert(0, {root!r})
+from security.state import State
+from security.store import StateStore
+
+class FakeNetwork(object):
+    pass
+
+assert StateStore({path!r}, State(FakeNetwork())).restore()
+print(time.time() - started)
+"""
+
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+from security.state import State
+from security.store import StateStore
+
+class FakeNetwork(object):
+    pass
+
+state = State(FakeNetwork())
+state.notify = lambda message: None
+store = StateStore({path!r}, state)
+store.save()
+print('ready', flush=True)
+while True:
+    for current in ('armed', 'disarmed', 'disabled'):
+        state.update_state(current)
+        state.update_last_mac('aa:aa:aa:bb:bb:' + current[:2])
+        store.save()
+"""
+
+
+class FakeSettings(object):
+
+    def __init__(self, packet_timeout):
+        self.packet_timeout = packet_timeout
+
+
+class FakeNetwork(object):
+
+    def __init__(self, packet_timeout):
+        self.settings = FakeSettings(packet_timeout)
+        self.state = State(self)
+
+    def arp_ping_macs(self):
+        pass
+
+
+class FakeClock(object):
+    """Stands in for the time module in security.state."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def armed_after(packet_timeout, path=None):
+    """Seconds until a new State arms, restored from `path` if there is
+    one, on a fake clock.
+    """
+    real = security.state.time
+    clock = security.state.time = FakeClock(real.time())
+    try:
+        network = FakeNetwork(packet_timeout)
+        if path is not None:
+            StateStore(path, network.state).restore(now=clock.now)
+        started = clock.now
+        while network.state.current != 'armed':
+            network.state.check()
+            clock.now += CHECK_INTERVAL
+        return clock.now - started
+    finally:
+        security.state.time = real
+
+
+def write_checkpoint(path, args):
+    """The checkpoint of a process that stopped --away seconds after the
+    phones left.
+    """
+    network = FakeNetwork(args.packet_timeout)
+    if args.away > args.packet_timeout + 20:
+        network.state.update_state('armed')
+    network.state.update_last_mac(MAC)
+    network.state.snapshot = dataclasses.replace(network.state.snapshot, last_packet=time.time() - args.away)
+    StateStore(path, network.state).save()
+
+
+def restore_ms(path):
+    script = RESTART.format(root=ROOT, path=path)
+    output = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True).stdout
+    return round(float(output) * 1000, 1)
+
+
+def save_times(path, args):
+    network = FakeNetwork(args.packet_timeout)
+    store = StateStore(path, network.state)
+    times = []
+    for _ in range(args.saves):
+        network.state.update_last_mac(MAC)
+        started = time.perf_counter()
+        store.save()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return {
+        'save_ms_median': round(statistics.median(times), 3),
+        'save_ms_p99': round(times[int(len(times) * 0.99)], 3),
+        'checkpoint_bytes': os.path.getsize(path),
+    }
+
+
+def crash(path, args):
+    rng = random.Random(args.seed)
+    script = WRITER.format(root=ROOT, path=path)
+    restored = 0
+    for _ in range(args.kills):
+        process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+        process.stdout.readline()
+        time.sleep(rng.uniform(0, 0.1))
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+        process.stdout.close()
+        network = FakeNetwork(args.packet_timeout)
+        if StateStore(path, network.state).restore():
+            restored += int(network.state.last_mac[-2:] == network.state.current[:2])
+    return {'kills': args.kills, 'restored': restored}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--packet-timeout', type=int, default=700)
+    p.add_argument('--away', type=float, default=800, help='seconds the phones left before the restart')
+    p.add_argument('--saves', type=int, default=200)
+    p.add_argument('--kills', type=int, default=30)
+    p.add_argument('--directory', help='where to write checkpoints, a temporary directory by default')
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        path = os.path.join(directory, 'state.json')
+        write_checkpoint(path, args)
+        result = {
+            'packet_timeout': args.packet_timeout,
+            'away_s': args.away,
+            'fresh': {'armed_after_s': round(armed_after(args.packet_timeout), 1)},
+            'restored': {
+                'armed_after_s': round(armed_after(args.packet_timeout, path), 1),
+                'restore_ms': restore_ms(path),
+            },
+        }
+        result.update(save_times(path, args))
+        result['crash'] = crash(path, args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Command latency under concurrent /photo load.
+
+A single dispatcher thread handles a burst of /photo commands interleaved
+with /disable. With synchronous captures every command waits behind the
+camera; with the capture scheduler the dispatcher only submits the job.
+
+    python bench/bench_scheduler.py --capture-time 0.2 --photos 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from queue import Queue
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.scheduler import CaptureScheduler  # noqa: E402
+
+
+class FakeCamera(object):
+
+    def __init__(self, capture_time):
+        self.capture_time = capture_time
+        self.captures = 0
+
+    def capture(self):
+        time.sleep(self.capture_time)
+        self.captures += 1
+        return '/var/tmp/photo.jpg'
+
+
+def run(commands, handle):
+    """Feed `commands` to a single dispatcher thread.
+
+    Returns the latency of every non-photo command in seconds.
+    """
+    queue = Queue()
+    latencies = []
+
+    def dispatcher():
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            command, queued = item
+            handle(command)
+            if command != 'photo':
+                latencies.append(time.time() - queued)
+
+    thread = Thread(target=dispatcher)
+    thread.start()
+    for command in commands:
+        queue.put((command, time.time()))
+    queue.put(None)
+    thread.join()
+    return latencies
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'median_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--capture-time', type=float, default=0.2)
+    p.add_argument('--photos', type=int, default=10)
+    args = p.parse_args()
+
+    commands = []
+    for _ in range(args.photos):
+        commands.extend(['photo', 'disable'])
+
+    camera = FakeCamera(args.capture_time)
+    blocking = run(commands, lambda command: command == 'photo' and camera.capture())
+    blocking_captures = camera.captures
+
+    camera = FakeCamera(args.capture_time)
+    scheduler = CaptureScheduler()
+    scheduler.start()
+    futures = []
+    queued = run(
+        commands,
+        lambda command: command == 'photo' and futures.append(scheduler.submit('photo', camera.capture))
+    )
+    for future in futures:
+        future.result()
+    scheduler.stop()
+
+    print(json.dumps({
+        'capture_time_s': args.capture_time,
+        'photo_commands': args.photos,
+        'blocking': dict(summary(blocking), captures=blocking_captures),
+        'scheduled': dict(summary(queued), captures=camera.captures),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
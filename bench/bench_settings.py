@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Time taken to load and validate the config file.
+
+Compares a bare ConfigParser read with Settings.from_file so the cost of
+parsing and validation is visible, and times the import of the settings
+module in a fresh interpreter.
+
+    python bench/bench_settings.py --repeat 1000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+from configparser import ConfigParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.settings import Settings  # noqa: E402
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'etc', 'rpi-security.conf')
+
+
+def raw_read(path):
+    cfg = ConfigParser()
+    cfg.read(path)
+    return dict(cfg.items('main'))
+
+
+def import_time():
+    code = 'import time; t = time.perf_counter(); import security.settings; print(time.perf_counter() - t)'
+    output = subprocess.check_output(
+        [sys.executable, '-c', code],
+        cwd=os.path.join(os.path.dirname(__file__), '..')
+    )
+    return float(output.decode('ascii').strip())
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--config-file', default=CONFIG_FILE)
+    p.add_argument('--repeat', type=int, default=1000)
+    args = p.parse_args()
+
+    raw = timeit.timeit(lambda: raw_read(args.config_file), number=args.repeat)
+    settings = timeit.timeit(lambda: Settings.from_file(args.config_file), number=args.repeat)
+    print(json.dumps({
+        'configparser_us': round(raw / args.repeat * 1e6, 1),
+        'settings_from_file_us': round(settings / args.repeat * 1e6, 1),
+        'validation_overhead_us': round((settings - raw) / args.repeat * 1e6, 1),
+        'import_ms': round(import_time() * 1000, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""State contention with many reader and writer threads.
+
+Readers call generate_status_text, writers call update_last_mac as the
+packet thread does, and one thread flips the alarm state with a Telegram
+send that takes --send-delay seconds. `--legacy` emulates the old State
+which sent the message while holding the lock.
+
+    python bench/bench_state.py --readers 8 --writers 4 --seconds 3
+    python bench/bench_state.py --readers 8 --writers 4 --seconds 3 --legacy
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import replace
+from threading import Event, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.state import State  # noqa: E402
+from security.threads.notifier import notifier  # noqa: E402
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+
+
+class FakeNetwork(object):
+
+    def __init__(self, send_delay):
+        self.settings = FakeSettings()
+        self.send_delay = send_delay
+        self.state = None
+
+    def telegram_send_message(self, message):
+        time.sleep(self.send_delay)
+        return True
+
+
+class LegacyState(State):
+    """Sends the notification inside the lock, like the old State."""
+
+    def update_state(self, new_state):
+        with self.lock:
+            snapshot = self.snapshot
+            if new_state == snapshot.current:
+                return
+            self.snapshot = replace(
+                snapshot,
+                previous=snapshot.current,
+                current=new_state,
+                last_change=time.time()
+            )
+            self.network.telegram_send_message("rpi-security is now {0}".format(new_state))
+
+
+def percentiles(latencies):
+    latencies.sort()
+    if not latencies:
+        return {}
+    return {
+        'calls': len(latencies),
+        'p50_us': round(latencies[len(latencies) // 2] * 1e6, 1),
+        'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        'max_ms': round(latencies[-1] * 1e3, 2),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--readers', type=int, default=8)
+    p.add_argument('--writers', type=int, default=4)
+    p.add_argument('--seconds', type=float, default=3)
+    p.add_argument('--send-delay', type=float, default=0.5)
+    p.add_argument('--legacy', action='store_true')
+    args = p.parse_args()
+
+    network = FakeNetwork(args.send_delay)
+    network.state = (LegacyState if args.legacy else State)(network)
+    stop = Event()
+    reads = []
+    writes = []
+
+    def reader():
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            network.state.generate_status_text()
+            latencies.append(time.perf_counter() - started)
+        reads.extend(latencies)
+
+    def writer():
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            network.state.update_last_mac('aa:aa:aa:bb:bb:bb')
+            latencies.append(time.perf_counter() - started)
+            time.sleep(0.001)
+        writes.extend(latencies)
+
+    def flipper():
+        while not stop.is_set():
+            network.state.update_state('armed')
+            network.state.update_state('disarmed')
+            time.sleep(0.1)
+
+    threads = [Thread(target=reader) for _ in range(args.readers)]
+    threads += [Thread(target=writer) for _ in range(args.writers)]
+    threads.append(Thread(target=flipper))
+    if not args.legacy:
+        Thread(target=notifier, args=(network,), daemon=True).start()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'legacy': args.legacy,
+        'readers': args.readers,
+        'writers': args.writers,
+        'send_delay_s': args.send_delay,
+        'generate_status_text': percentiles(reads),
+        'update_last_mac': percentiles(writes),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Time for a supervised worker to get going again after a fault.
+
+A worker handles items put on a queue at --rate per second, as the photo
+and notifier threads do. It is made to raise, or to hang in a call that
+never returns, and the gap in handled items is measured. Without a
+supervisor the daemon stops handling items until it's restarted.
+
+    python bench/bench_supervisor.py --timeout 5 --backoff 1 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from queue import Empty, Queue
+from threading import Event, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.supervisor import Supervisor, heartbeat  # noqa: E402
+
+
+class FaultyWorker(object):
+
+    def __init__(self, items):
+        self.items = items
+        self.fault = None
+        self.handled = []
+        self.stuck = Event()
+
+    def __call__(self):
+        while True:
+            heartbeat()
+            if self.fault == 'raise':
+                self.fault = None
+                raise RuntimeError('injected')
+            if self.fault == 'hang':
+                self.fault = None
+                self.stuck.wait()
+            try:
+                self.items.get(timeout=0.1)
+            except Empty:
+                continue
+            self.handled.append(time.monotonic())
+
+
+def producer(items, rate):
+    while True:
+        items.put(None)
+        time.sleep(1.0 / rate)
+
+
+def recovery(args, worker, fault):
+    time.sleep(0.5)
+    injected = time.monotonic()
+    worker.fault = fault
+    while not worker.handled or worker.handled[-1] <= injected:
+        time.sleep(0.01)
+    # Items handled before the fault took effect don't count.
+    time.sleep(args.timeout + args.backoff * 4 + 1)
+    handled = [t for t in worker.handled if t > injected]
+    gaps = [b - a for a, b in zip(handled, handled[1:])]
+    return round(max(gaps), 2)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--rate', type=float, default=20)
+    p.add_argument('--timeout', type=float, default=5)
+    p.add_argument('--backoff', type=float, default=1)
+    p.add_argument('--check-interval', type=float, default=1)
+    p.add_argument('--repeat', type=int, default=3)
+    args = p.parse_args()
+
+    items = Queue()
+    worker = FaultyWorker(items)
+    supervisor = Supervisor(
+        check_interval=args.check_interval,
+        backoff=args.backoff,
+        # Each fault is treated as the first.
+        reset_after=0
+    )
+    supervisor.add('worker', worker, timeout=args.timeout)
+    supervisor.start()
+    Thread(target=producer, args=(items, args.rate), daemon=True).start()
+    results = {}
+    for fault in ('raise', 'hang'):
+        gaps = [recovery(args, worker, fault) for _ in range(args.repeat)]
+        results[fault] = {'max_gap_s': max(gaps), 'gaps_s': gaps}
+    results['restarts'] = supervisor.status()['worker']['restarts']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Thumbnail throughput and peak memory for different pool sizes.
+
+Generates full size camera JPEGs and thumbnails them through a
+ThumbnailPool, reporting images/sec and the peak RSS of the main process
+and the largest worker.
+
+    python bench/bench_thumbnails.py --workers 1 2 4 --images 40
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def make_photos(directory, count, size):
+    import numpy as np
+    from PIL import Image
+
+    # Noise compresses like a real photo rather than a flat colour.
+    pixels = np.random.randint(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, '{0}.jpg'.format(i))
+        Image.fromarray(pixels).save(path, quality=85)
+        paths.append(path)
+    return paths
+
+
+def run_workers(workers, paths, size):
+    """Run in a fresh interpreter so ru_maxrss isn't shared between runs."""
+    code = (
+        'import json, resource, sys, time\n'
+        'from security.thumbnails import ThumbnailPool\n'
+        'paths = sys.argv[3:]\n'
+        'pool = ThumbnailPool(size=(int(sys.argv[1]), int(sys.argv[2])), workers={0})\n'
+        'started = time.time()\n'
+        'list(pool.map(paths))\n'
+        'elapsed = time.time() - started\n'
+        'pool.shutdown()\n'
+        'print(json.dumps({{\n'
+        '    "elapsed_s": elapsed,\n'
+        '    "main_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,\n'
+        '    "worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,\n'
+        '}}))\n'
+    ).format(workers)
+    output = subprocess.check_output(
+        [sys.executable, '-c', code, str(size[0]), str(size[1])] + paths,
+        cwd=os.path.join(os.path.dirname(__file__), '..')
+    )
+    result = json.loads(output.decode('utf-8').splitlines()[-1])
+    return {
+        'workers': workers,
+        'images_per_sec': round(len(paths) / result['elapsed_s'], 2),
+        'main_rss_mb': round(result['main_rss_mb'], 1),
+        'worker_peak_rss_mb': round(result['worker_rss_mb'], 1),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--images', type=int, default=40)
+    p.add_argument('--photo-size', default='2592x1944')
+    p.add_argument('--thumbnail-size', default='1024x768')
+    args = p.parse_args()
+
+    photo_size = tuple(int(x) for x in args.photo_size.split('x'))
+    thumbnail_size = tuple(int(x) for x in args.thumbnail_size.split('x'))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_photos(directory, args.images, photo_size)
+        results = [run_workers(n, paths, thumbnail_size) for n in args.workers]
+    print(json.dumps({
+        'photo_size': args.photo_size,
+        'thumbnail_size': args.thumbnail_size,
+        'images': args.images,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Delivery latency of alerts over a throttled uplink, as captured and re-encoded.
+
+A local HTTP server stands in for Telegram. It waits half of --rtt before
+reading each request and again before answering, and reads the body at
+each of --bandwidths kbit/s. A StubBot posts messages and files to it in
+place of python-telegram-bot, so Network times the sends as it does for
+real, and --events alerts are sent through send_photos as process_photos
+does: in photo mode --frames 1024x768 thumbnails, in gif mode one GIF of
+3 x --frames 640x480 frames, after the alert message.
+
+  as_is: files are sent as they were captured.
+  adaptive: an UplinkEncoder re-encodes them to arrive within --target
+      seconds, from what Network.uplink measured of the sends before.
+
+`latency_s` is from the alert message to the last file arriving or timing
+out, `failed` counts the files that timed out over all alerts. The
+first alert is sent as captured either way as nothing has been measured
+yet, it's reported as `first_latency_s`. `encode_ms` is the time spent
+re-encoding per alert, in this process rather than a worker.
+
+    python bench/bench_uplink.py --bandwidths 256 1024 4096 --target 5
+    python bench/bench_uplink.py --mode gif
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.network import Network  # noqa: E402
+from security.settings import Settings  # noqa: E402
+from security.threads.process_photos import send_photos  # noqa: E402
+from security.uplink import UplinkEncoder, UplinkEstimator  # noqa: E402
+
+CHUNK = 4096
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        time.sleep(self.server.rtt / 2)
+        started = time.perf_counter()
+        read = 0
+        while read < length:
+            read += len(self.rfile.read(min(CHUNK, length - read)))
+            delay = started + read / self.server.bytes_per_second - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        time.sleep(self.server.rtt / 2)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out.
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StubBot(object):
+    """Posts what python-telegram-bot would upload to the stub server."""
+
+    def __init__(self, url):
+        self.url = url
+        self.sent = 0
+        self.failed = 0
+
+    def _post(self, data, timeout):
+        self.sent += len(data)
+        request = urllib.request.Request(self.url, data=data, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+        except Exception:
+            self.failed += 1
+            raise
+
+    def _post_file(self, f, timeout):
+        with f:
+            self._post(f.read(), timeout)
+
+    def sendMessage(self, chat_id, parse_mode, text, timeout):
+        self._post(text.encode('utf-8'), timeout)
+
+    def sendPhoto(self, chat_id, photo, caption, timeout):
+        self._post_file(photo, timeout)
+
+    def sendDocument(self, chat_id, document, caption, timeout):
+        self._post_file(document, timeout)
+
+    def sendVideo(self, chat_id, video, caption, timeout):
+        self._post_file(video, timeout)
+
+
+class FakeState(object):
+    current = 'armed'
+
+
+class FakeCamera(object):
+    thumbnails = None
+
+
+class TimedEncoder(UplinkEncoder):
+
+    def __init__(self, *args, **kwargs):
+        super(TimedEncoder, self).__init__(*args, **kwargs)
+        self.seconds = 0.0
+
+    def fit(self, path, seconds):
+        started = time.perf_counter()
+        try:
+            return super(TimedEncoder, self).fit(path, seconds)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def make_network(url, target):
+    """A Network that sends to the stub, without the system checks."""
+    network = Network.__new__(Network)
+    network.settings = Settings(
+        mac_addresses=('02:00:00:00:00:01',),
+        telegram_bot_token='bench',
+        upload_target=target
+    )
+    network.saved_data = {'telegram_chat_id': 1}
+    network.state = FakeState()
+    network.uplink = UplinkEstimator()
+    network._bot = StubBot(url)
+    network._bot_lock = Lock()
+    return network
+
+
+def frames(rng, count, size):
+    """Frames of a textured scene with someone walking across."""
+    width, height = size
+    coarse = rng.uniform(0.2, 0.7, (12, 16))
+    scene = np.asarray(
+        Image.fromarray((coarse * 255).astype(np.uint8)).resize(size, Image.BICUBIC),
+        dtype=np.float32
+    ) / 255
+    scene += rng.normal(0, 0.05, (height, width)).astype(np.float32)
+    for n in range(count):
+        frame = scene + rng.normal(0, 0.02, scene.shape).astype(np.float32)
+        left = int(width * (0.1 + 0.7 * n / max(count - 1, 1)))
+        frame[height // 4:height * 9 // 10, left:left + width // 10] = 0.15
+        yield Image.fromarray((np.clip(frame, 0, 1) * 255).astype(np.uint8)).convert('RGB')
+
+
+def make_media(directory, args):
+    rng = np.random.default_rng(args.seed)
+    if args.mode == 'photo':
+        paths = []
+        for n, image in enumerate(frames(rng, args.frames, (1024, 768))):
+            paths.append(os.path.join(directory, 'photo-{0}.jpg'.format(n)))
+            image.save(paths[-1], 'JPEG', quality=80)
+        return paths
+    images = list(frames(rng, args.frames * 3, (640, 480)))
+    path = os.path.join(directory, 'event.gif')
+    images[0].save(path, save_all=True, append_images=images[1:], loop=0, duration=200)
+    return [path]
+
+
+def run(url, media, args, adaptive):
+    network = make_network(url, args.target)
+    encoder = TimedEncoder(network.uplink) if adaptive else None
+    latencies, encode_ms, sent = [], [], []
+    for _ in range(args.events):
+        if encoder is not None:
+            encoder.seconds = 0.0
+        network.bot.sent = 0
+        started = time.perf_counter()
+        network.telegram_send_message('Motioned detected')
+        send_photos(network, FakeCamera(), media, encoder=encoder)
+        latencies.append(time.perf_counter() - started)
+        encode_ms.append(encoder.seconds * 1000 if encoder is not None else 0)
+        sent.append(network.bot.sent)
+    rest = latencies[1:] or latencies
+    return {
+        'first_latency_s': round(latencies[0], 2),
+        'latency_s_median': round(statistics.median(rest), 2),
+        'latency_s_max': round(max(rest), 2),
+        'kbytes_per_alert': round(statistics.median(sent[1:] or sent) / 1024.0, 1),
+        'encode_ms': round(statistics.median(encode_ms[1:] or encode_ms), 1),
+        'failed': network.bot.failed,
+        'estimated_kbit': round(network.uplink.bytes_per_second * 8 / 1000.0) if network.uplink.bytes_per_second else None,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--bandwidths', type=float, nargs='+', default=[256, 512, 1024, 4096], help='kbit/s')
+    p.add_argument('--rtt', type=float, default=0.3)
+    p.add_argument('--target', type=float, default=5)
+    p.add_argument('--mode', choices=('photo', 'gif'), default='photo')
+    p.add_argument('--frames', type=int, default=3)
+    p.add_argument('--events', type=int, default=4)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+    # Timeouts are counted in `failed` rather than logged.
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    server.rtt = args.rtt
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{0}/'.format(server.server_address[1])
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        media = make_media(directory, args)
+        for kbit in args.bandwidths:
+            server.bytes_per_second = kbit * 1000 / 8.0
+            results.append({
+                'kbit': kbit,
+                'as_is': run(url, media, args, adaptive=False),
+                'adaptive': run(url, media, args, adaptive=True),
+            })
+        captured = sum(os.path.getsize(path) for path in media)
+    server.shutdown()
+    print(json.dumps({
+        'mode': args.mode,
+        'target_s': args.target,
+        'captured_kbytes': round(captured / 1024.0, 1),
+        'bandwidths': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Accuracy and latency of the event verifier on a labelled sample set.
+
+Each event is a directory of the JPEGs or GIF one capture saved. With
+--samples the events are read from DIR/person/<event>/ and
+DIR/other/<event>/, otherwise --events of each kind are generated in a
+temporary directory: a person walking past, a pet, a cloud shadow drifting
+over, headlights sweeping the scene and rain. Frames are drawn at
+--image-size over a textured background with sensor noise and saved as
+JPEGs, --frames per event.
+
+Events are scored in this process with load_frames, features and predict,
+as score_event does in the worker, with --budget-ms per frame.
+`ms_per_frame` is the decode and feature time over the frames used and
+`over_budget_percent` the share of events that took longer than the budget
+per frame. `worker_ms_median` scores --worker-events through an
+EventVerifier with its own worker process, including the round trip.
+
+--train fits MEAN, SCALE, WEIGHTS and BIAS for security/verifier.py with
+logistic regression on --train-share of the events, prints them and
+reports the accuracy of the fitted model on the rest.
+
+    python bench/bench_verifier.py --events 60
+    python bench/bench_verifier.py --samples captures/ --train
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from security.verifier import FEATURES, EventVerifier, features, load_frames, predict  # noqa: E402
+
+KINDS = ('person', 'pet', 'shadow', 'headlights', 'rain')
+# Generated scenes are drawn at this size and scaled up to --image-size.
+DRAW_SIZE = (320, 240)
+
+
+def background(rng, width, height):
+    """Smooth texture with a few edges, like a garden or a driveway."""
+    coarse = rng.uniform(0.25, 0.65, (6, 8))
+    image = np.asarray(
+        Image.fromarray((coarse * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC),
+        dtype=np.float32
+    ) / 255
+    image = image + rng.normal(0, 0.03, (height, width)).astype(np.float32)
+    for _ in range(int(rng.integers(2, 5))):
+        row = int(rng.integers(0, height))
+        image[row:row + int(rng.integers(2, 6))] += rng.uniform(-0.15, 0.15)
+    return image
+
+
+def figure(rng, frame, left, bottom, height, width, tone, upright):
+    """Draw a textured blob, upright with a head and legs for a person."""
+    rows, cols = frame.shape
+    top = max(0, bottom - height)
+    left, right = max(0, left), min(cols, left + width)
+    if right <= left or bottom <= top:
+        return
+    patch = np.full((bottom - top, right - left), tone, dtype=np.float32)
+    patch += rng.normal(0, 0.04, patch.shape).astype(np.float32)
+    if upright:
+        # Darker legs with a gap between them, and a head narrower than the body.
+        legs = (bottom - top) * 2 // 5
+        patch[-legs:] -= 0.1
+        gap = slice(patch.shape[1] * 2 // 5, patch.shape[1] * 3 // 5)
+        patch[-legs:, gap] = frame[bottom - legs:bottom, left:right][:, gap]
+        head = max(1, (bottom - top) // 7)
+        for side in (slice(0, patch.shape[1] // 4), slice(patch.shape[1] * 3 // 4, None)):
+            patch[:head, side] = frame[top:top + head, left:right][:, side]
+    frame[top:bottom, left:right] = patch
+
+
+def draw_event(rng, kind, frames):
+    """Return `frames` greyscale float frames of one generated event."""
+    width, height = DRAW_SIZE
+    scene = background(rng, width, height)
+    out = []
+    if kind in ('person', 'pet'):
+        if kind == 'person':
+            size = int(rng.uniform(0.35, 0.8) * height)
+            blob = (size, int(size * rng.uniform(0.3, 0.45)))
+            bottom = int(rng.uniform(0.75, 0.98) * height)
+        else:
+            size = int(rng.uniform(0.08, 0.2) * height)
+            blob = (size, int(size * rng.uniform(1.5, 2.5)))
+            bottom = int(rng.uniform(0.85, 1.0) * height)
+        speed = rng.uniform(0.03, 0.1) * width * rng.choice((-1, 1))
+        start = rng.uniform(0.1, 0.9) * width - blob[1] / 2
+        tone = float(np.clip(scene.mean() + rng.choice((-1, 1)) * rng.uniform(0.2, 0.45), 0.02, 0.98))
+    for n in range(frames):
+        frame = scene.copy()
+        if kind in ('person', 'pet'):
+            figure(rng, frame, int(start + speed * n), bottom, blob[0], blob[1], tone, kind == 'person')
+        elif kind == 'shadow':
+            if n == 0:
+                sigma = rng.uniform(0.15, 0.3) * width
+                cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+                drift = rng.uniform(0.01, 0.05) * width * rng.choice((-1, 1))
+                depth = rng.uniform(0.1, 0.25)
+            y, x = np.mgrid[0:height, 0:width]
+            shade = np.exp(-((x - cx - drift * n) ** 2 + (y - cy) ** 2) / (2 * sigma ** 2))
+            frame *= 1 - depth * shade
+        elif kind == 'headlights':
+            if n == 0:
+                gain = rng.uniform(0.15, 0.5)
+                sweep = rng.uniform(0.1, 0.3) * width
+                beam = rng.uniform(0.1, 0.25) * width
+                centre = rng.uniform(0, width)
+            x = np.arange(width)
+            band = np.exp(-((x - centre - sweep * n) ** 2) / (2 * beam ** 2))
+            frame *= 1 + gain * n / max(frames - 1, 1) + 0.4 * band[None, :]
+        elif kind == 'rain':
+            drops = rng.random(frame.shape) < rng.uniform(0.005, 0.03)
+            frame[drops] += rng.uniform(0.15, 0.4)
+        frame += rng.normal(0, 0.015, frame.shape).astype(np.float32)
+        out.append(np.clip(frame, 0, 1))
+    return out
+
+
+def generate(directory, args):
+    """Save --events of each kind, returning [(paths, label, kind)]."""
+    rng = np.random.default_rng(args.seed)
+    events = []
+    for kind in KINDS:
+        for n in range(args.events):
+            paths = []
+            for i, frame in enumerate(draw_event(rng, kind, args.frames)):
+                path = os.path.join(directory, '{0}-{1}-{2}.jpg'.format(kind, n, i))
+                image = Image.fromarray((frame * 255).astype(np.uint8))
+                image.resize(tuple(args.image_size), Image.BILINEAR).save(path, 'JPEG', quality=85)
+                paths.append(path)
+            events.append((paths, int(kind == 'person'), kind))
+    return events
+
+
+def read_samples(directory):
+    """Events from DIR/person/<event>/ and DIR/other/<event>/."""
+    events = []
+    for label, kind in ((1, 'person'), (0, 'other')):
+        root = os.path.join(directory, kind)
+        for name in sorted(os.listdir(root)):
+            event = os.path.join(root, name)
+            paths = sorted(
+                os.path.join(event, f) for f in os.listdir(event)
+                if os.path.splitext(f)[1].lower() in ('.jpg', '.jpeg', '.gif')
+            )
+            if paths:
+                events.append((paths, label, kind))
+    return events
+
+
+def measure(events, budget_ms):
+    """Return the feature rows and per frame latencies of `events`."""
+    rows, latencies = [], []
+    for paths, label, kind in events:
+        started = time.perf_counter()
+        frames = load_frames(paths, budget_ms=budget_ms)
+        values = features(frames) if len(frames) >= 2 else np.zeros(len(FEATURES))
+        latencies.append((time.perf_counter() - started) * 1000 / max(len(frames), 1))
+        rows.append(values)
+    return np.array(rows), latencies
+
+
+def train(x, y, steps=5000, rate=0.5, l2=1e-3):
+    """Logistic regression by gradient descent on standardised features."""
+    mean = x.mean(axis=0)
+    scale = np.where(x.std(axis=0) > 1e-6, x.std(axis=0), 1.0)
+    z = (x - mean) / scale
+    weights = np.zeros(x.shape[1])
+    bias = 0.0
+    for _ in range(steps):
+        p = 1 / (1 + np.exp(-(z @ weights + bias)))
+        weights -= rate * (z.T @ (p - y) / len(y) + l2 * weights)
+        bias -= rate * float((p - y).mean())
+    return {
+        'mean': tuple(round(float(v), 4) for v in mean),
+        'scale': tuple(round(float(v), 4) for v in scale),
+        'weights': tuple(round(float(v), 4) for v in weights),
+        'bias': round(bias, 4),
+    }
+
+
+def evaluate(x, events, threshold, model):
+    scores = [predict(values, **model) for values in x]
+    labels = [label for _, label, _ in events]
+    sent = [score >= threshold for score in scores]
+    true_positives = sum(1 for s, label in zip(sent, labels) if s and label)
+    by_kind = {}
+    for (_, label, kind), s in zip(events, sent):
+        by_kind.setdefault(kind, []).append(s)
+    return {
+        'events': len(events),
+        'accuracy': round(sum(1 for s, label in zip(sent, labels) if s == bool(label)) / len(events), 3),
+        'precision': round(true_positives / max(sum(sent), 1), 3),
+        'recall': round(true_positives / max(sum(labels), 1), 3),
+        'sent_percent': dict(
+            (kind, round(100.0 * sum(s) / len(s), 1)) for kind, s in sorted(by_kind.items())
+        ),
+    }
+
+
+def worker_latency(events, budget_ms, count):
+    verifier = EventVerifier()
+    # The first call starts the worker and imports NumPy and PIL.
+    verifier.score(events[0][0], budget_ms)
+    times = []
+    for paths, _, _ in events[:count]:
+        started = time.perf_counter()
+        verifier.score(paths, budget_ms)
+        times.append((time.perf_counter() - started) * 1000)
+    verifier.pool.shutdown()
+    return round(statistics.median(times), 1)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--samples', help='a directory with person/ and other/ event directories')
+    p.add_argument('--events', type=int, default=60, help='of each kind to generate')
+    p.add_argument('--frames', type=int, default=3)
+    p.add_argument('--image-size', type=int, nargs=2, default=[1024, 768])
+    p.add_argument('--budget-ms', type=float, default=100)
+    p.add_argument('--threshold', type=float, default=0.5)
+    p.add_argument('--worker-events', type=int, default=20)
+    p.add_argument('--train', action='store_true')
+    p.add_argument('--train-share', type=float, default=0.7)
+    p.add_argument('--seed', type=int, default=0)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        events = read_samples(args.samples) if args.samples else generate(directory, args)
+        x, latencies = measure(events, args.budget_ms)
+        result = {
+            'events': len(events),
+            'ms_per_frame_median': round(statistics.median(latencies), 1),
+            'ms_per_frame_p95': round(float(np.percentile(latencies, 95)), 1),
+            'over_budget_percent': round(100.0 * sum(1 for t in latencies if t > args.budget_ms) / len(latencies), 1),
+            'worker_ms_median': worker_latency(events, args.budget_ms, args.worker_events),
+        }
+        if args.train:
+            order = np.random.default_rng(args.seed).permutation(len(events))
+            split = int(len(events) * args.train_share)
+            fit, held = order[:split], order[split:]
+            y = np.array([events[i][1] for i in fit], dtype=np.float64)
+            model = train(x[fit], y)
+            result['held_out'] = evaluate(x[held], [events[i] for i in held], args.threshold, model)
+            print('\n'.join(
+                '{0} = {1}'.format(name.upper(), model[name]) for name in ('mean', 'scale', 'weights', 'bias')
+            ), file=sys.stderr)
+        else:
+            result['model'] = evaluate(x, events, args.threshold, {})
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
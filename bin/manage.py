@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
 import logging
-import logging.handlers
 import signal
 import sys
 import time
-from threading import Thread
 
 import security
-from security.camera import Camera
+from security.cameras import CameraGroup
+from security.cluster import Coordinator
+from security.control import ControlServer, register_state_commands
+from security.dedupe import Deduplicator
+from security.logs import set_debug, setup_logging
 from security.network import Network
+from security.preview import FrameBuffer, PreviewServer
+from security.recorder import PacketRecorder
+from security.store import CHECKPOINT_INTERVAL, StateStore
+from security.supervisor import Supervisor
+from security.threads.capture_packets import SNIFF_TIMEOUT
+from security.threads.telegram_bot import CAPTURE_TIMEOUT
+from security.uplink import UplinkEncoder
 from security.util import exit_error, exit_clean, exception_handler
+from security.verifier import EventVerifier
 
 
 def parse_arguments():
@@ -40,94 +51,111 @@ def parse_arguments():
     return p.parse_args()
 
 
-def setup_logging(debug_mode, log_to_stdout):
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
-    syslog_handler = logging.handlers.SysLogHandler(address='/dev/log')
-    syslog_format = logging.Formatter(
-        "%(filename)s:%(threadName)s %(message)s",
-        "%Y-%m-%d %H:%M:%S"
-    )
-    syslog_handler.setFormatter(syslog_format)
-
-    if log_to_stdout:
-        stdout_level = logging.DEBUG
-        stdout_format = logging.Formatter(
-            "%(asctime)s %(levelname)-7s %(filename)s:%(lineno)-12s %(threadName)-25s %(message)s", "%Y-%m-%d %H:%M:%S")
-    else:
-        stdout_level = logging.CRITICAL
-        stdout_format = logging.Formatter("ERROR: %(message)s")
-
-    if debug_mode:
-        syslog_handler.setLevel(logging.DEBUG)
-    else:
-        syslog_handler.setLevel(logging.INFO)
-
-    logger.addHandler(syslog_handler)
-    stdout_handler = logging.StreamHandler()
-    stdout_handler.setFormatter(stdout_format)
-    stdout_handler.setLevel(stdout_level)
-    logger.addHandler(stdout_handler)
-    return logger
-
-
 if __name__ == "__main__":
     args = parse_arguments()
-    logger = setup_logging(debug_mode=False, log_to_stdout=args.debug)
+    logs = setup_logging(debug_mode=False, log_to_stdout=args.debug)
+    logger = logging.getLogger()
 
     try:
         network = Network(args.config_file, args.data_file)
-        camera = Camera(
-            network.photo_size,
-            network.gif_size,
-            network.motion_size,
-            network.camera_vflip,
-            network.camera_hflip,
-            network.motion_detection_setting,
-            network.camera_capture_length,
-            network.camera_mode
-        )
-        if network.debug_mode:
-            logger.handlers[0].setLevel(logging.DEBUG)
+        if network.settings.cluster_role == 'node':
+            exit_error('cluster_role is node, run rpi-security-node.py instead')
+        cameras = CameraGroup.from_settings(network.settings)
+        if network.settings.debug_mode:
+            set_debug(logs, True)
     except Exception as exc:
         exit_error('Configuration error: {0}'.format(repr(exc)))
 
     sys.excepthook = exception_handler
 
-    # Start the threads
-    telegram_bot_thread = Thread(
-        name='telegram_bot',
-        target=security.threads.telegram_bot,
-        args=(security, camera)
-    )
-    telegram_bot_thread.daemon = True
-    telegram_bot_thread.start()
-
-    monitor_alarm_state_thread = Thread(
-        name='monitor_alarm_state',
-        target=security.threads.monitor_alarm_state,
-        args=(security, camera)
+    # Carry on from the state before a restart, if it was saved recently,
+    # rather than waiting out packet_timeout before arming.
+    store = None
+    if network.settings.state_file:
+        store = StateStore(
+            network.settings.state_file,
+            network.state,
+            cameras,
+            max_age=network.settings.state_max_age
+        )
+        store.restore()
+        network.state.listeners.append(store.state_changed)
+        atexit.register(store.save)
+
+    # Start the threads. Motion detection goes first, the others import
+    # telegram and scapy when they start. Each camera has its own motion
+    # detection thread, the rest are shared. The supervisor restarts any
+    # that fail, or that go longer than their timeout without a heartbeat.
+    supervisor = Supervisor()
+    supervisor.add('monitor_alarm_state', security.threads.monitor_alarm_state, (network,), timeout=60)
+    for camera in cameras:
+        supervisor.add(
+            'detect_motion_{0}'.format(camera.name),
+            security.threads.detect_motion,
+            (network, camera),
+            timeout=CAPTURE_TIMEOUT
+        )
+        supervisor.add(
+            'switch_profiles_{0}'.format(camera.name),
+            security.threads.switch_profiles,
+            (camera, lambda: network.settings),
+            timeout=CAPTURE_TIMEOUT
+        )
+    supervisor.add('telegram_bot', security.threads.telegram_bot, (network, cameras), timeout=60)
+    # The packet recorder outlives restarts of capture_packets, so they carry
+    # on writing the same trace.
+    packet_recorder = PacketRecorder.from_settings(network.settings)
+    supervisor.add(
+        'capture_packets',
+        security.threads.capture_packets,
+        (network, packet_recorder),
+        timeout=SNIFF_TIMEOUT * 3
     )
-    monitor_alarm_state_thread.daemon = True
-    monitor_alarm_state_thread.start()
-
-    capture_packets_thread = Thread(
-        name='capture_packets',
-        target=security.threads.capture_packets,
-        args=(security,)
+    # Events are scored, hashed and re-encoded in the thumbnail pool's processes.
+    verifier = EventVerifier(cameras.thumbnails)
+    deduplicator = Deduplicator(cameras.thumbnails)
+    encoder = UplinkEncoder(network.uplink, cameras.thumbnails)
+    supervisor.add(
+        'process_photos',
+        security.threads.process_photos,
+        (network, cameras, verifier, deduplicator, encoder),
+        timeout=CAPTURE_TIMEOUT
     )
-    capture_packets_thread.daemon = True
-    capture_packets_thread.start()
+    supervisor.add('notifier', security.threads.notifier, (network,), timeout=60)
+    if store is not None:
+        supervisor.add('save_state', security.threads.save_state, (store,), timeout=CHECKPOINT_INTERVAL * 3)
+    supervisor.start()
+
+    for camera in cameras:
+        camera_settings = network.settings.for_camera(camera.name)
+        if camera_settings.preview_port:
+            preview_frames = FrameBuffer()
+            camera.start_preview_stream(preview_frames, camera_settings.preview_size)
+            preview_server = PreviewServer(
+                preview_frames,
+                address=('', camera_settings.preview_port),
+                max_clients=camera_settings.preview_max_clients
+            )
+            preview_server.start()
+
+    if network.settings.control_socket:
+        control_server = ControlServer(network.settings.control_socket)
+        register_state_commands(control_server, network, cameras)
+        control_server.register('workers', supervisor.status)
+        control_server.register('logging', logs.stats)
+        control_server.start()
+
+    if network.settings.cluster_role == 'coordinator':
+        coordinator = Coordinator.from_settings(network, cameras)
+        coordinator.start()
+
+    def reload_settings(signal=None, frame=None):
+        if network.reload_settings() is not None:
+            cameras.apply_settings(network.settings)
+            set_debug(logs, network.settings.debug_mode)
 
-    process_photos_thread = Thread(
-        name='process_photos',
-        target=security.threads.process_photos,
-        args=(security, camera)
-    )
-    process_photos_thread.daemon = True
-    process_photos_thread.start()
     signal.signal(signal.SIGTERM, exit_clean)
+    signal.signal(signal.SIGHUP, reload_settings)
     try:
         logger.info("rpi-security running")
         network.telegram_send_message('rpi-security running')
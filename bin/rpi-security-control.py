@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+
+from security.control import DEFAULT_SOCKET, request
+
+
+def parse_arguments():
+    p = argparse.ArgumentParser(
+        description='Control a running rpi-security over its local socket.'
+    )
+    p.add_argument(
+        'command',
+        help='Command to send, eg status, enable, disable, photo. Use help to list them.'
+    )
+    p.add_argument(
+        'args',
+        nargs='*',
+        help='Command arguments as key=value.'
+    )
+    p.add_argument(
+        '-s',
+        '--socket',
+        help='Path to the control socket.',
+        default=DEFAULT_SOCKET
+    )
+    p.add_argument(
+        '-t',
+        '--timeout',
+        help='Seconds to wait for a response.',
+        type=float,
+        default=30
+    )
+    p.add_argument(
+        '-j',
+        '--json',
+        help='Print the raw JSON response.',
+        action='store_true',
+        default=False
+    )
+    return p.parse_args()
+
+
+def parse_command_args(args):
+    result = {}
+    for arg in args:
+        key, _, value = arg.partition('=')
+        try:
+            result[key] = json.loads(value)
+        except ValueError:
+            result[key] = value
+    return result
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    try:
+        response = request(
+            args.command,
+            parse_command_args(args.args),
+            path=args.socket,
+            timeout=args.timeout
+        )
+    except OSError as exc:
+        sys.exit('Unable to connect to {0}: {1}'.format(args.socket, exc))
+
+    if args.json:
+        print(json.dumps(response, indent=2))
+    elif not response['ok']:
+        print('ERROR: {0}'.format(response['error']), file=sys.stderr)
+    elif isinstance(response['result'], dict):
+        for key, value in sorted(response['result'].items()):
+            print('{0}: {1}'.format(key, value))
+    else:
+        print(response['result'])
+    sys.exit(0 if response['ok'] else 1)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import signal
+import sys
+import time
+
+import security
+from security.cameras import CameraGroup
+from security.cluster import Node
+from security.logs import set_debug, setup_logging
+from security.settings import Settings
+from security.supervisor import Supervisor
+from security.threads.telegram_bot import CAPTURE_TIMEOUT
+from security.util import exit_error, exit_clean, exception_handler
+
+
+def parse_arguments():
+    p = argparse.ArgumentParser(
+        description='Run the cameras of this Raspberry Pi for an rpi-security coordinator.'
+    )
+    p.add_argument(
+        '-c',
+        '--config_file',
+        help='Path to config file.',
+        default='/etc/rpi-security.conf'
+    )
+    p.add_argument(
+        '-d',
+        '--debug',
+        help='To enable debug output to stdout',
+        action='store_true',
+        default=False
+    )
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    logs = setup_logging(debug_mode=False, log_to_stdout=args.debug)
+    logger = logging.getLogger()
+
+    try:
+        settings = Settings.from_file(args.config_file)
+        if settings.cluster_role != 'node':
+            exit_error('cluster_role must be node to run as a node')
+        cameras = CameraGroup.from_settings(settings)
+        node = Node.from_settings(settings, cameras)
+        if settings.debug_mode:
+            set_debug(logs, True)
+    except Exception as exc:
+        exit_error('Configuration error: {0}'.format(repr(exc)))
+
+    sys.excepthook = exception_handler
+
+    supervisor = Supervisor()
+    for camera in cameras:
+        supervisor.add(
+            'detect_motion_{0}'.format(camera.name),
+            security.threads.detect_motion,
+            (node, camera, node.send_motion),
+            timeout=CAPTURE_TIMEOUT
+        )
+        supervisor.add(
+            'switch_profiles_{0}'.format(camera.name),
+            security.threads.switch_profiles,
+            (camera, lambda: settings),
+            timeout=CAPTURE_TIMEOUT
+        )
+    supervisor.start()
+
+    node.start()
+
+    signal.signal(signal.SIGTERM, exit_clean)
+    try:
+        logger.info("rpi-security node %s running", node.name)
+        while True:
+            time.sleep(100)
+    except KeyboardInterrupt:
+        exit_clean()
@@ -1,7 +1,39 @@
 # -*- coding: utf-8 -*-
+"""rpi-security.
 
-from .network import Network
-from .camera import Camera
-from .state import State
-from .threads import process_photos, capture_packets, monitor_alarm_state, telegram_bot
-from .util import exit_clean, exit_error, exception_handler
+The public names are imported on first use so that importing the package,
+or a light module like `security.settings`, doesn't pull in picamera, scapy,
+telegram, numpy and PIL. On a Pi those take seconds to import.
+"""
+
+from importlib import import_module
+
+_LAZY_ATTRIBUTES = {
+    'Network': '.network',
+    'Camera': '.camera',
+    'CameraGroup': '.cameras',
+    'State': '.state',
+    'Settings': '.settings',
+    'exit_clean': '.util',
+    'exit_error': '.util',
+    'exception_handler': '.util',
+}
+
+_LAZY_MODULES = ('threads',)
+
+__all__ = sorted(list(_LAZY_ATTRIBUTES) + list(_LAZY_MODULES))
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    elif name in _LAZY_MODULES:
+        value = import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
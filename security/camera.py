@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import io
 import logging
 import os
 import time
@@ -7,18 +8,27 @@ from datetime import datetime
 from queue import Queue
 from threading import Event, Lock
 
-import numpy as np
-from PIL import Image
-
 from picamera import PiCamera
 from picamera.exc import PiCameraNotRecording
 from picamera.array import PiMotionAnalysis
 
+from .motion import MotionAnalyser, scale_thresholds
+from .pir import PIRSensor
+from .profiles import LUMINANCE_SIZE, METERING_TIME, luminance
+from .recorder import MotionRecorder
+from .scheduler import PRIORITY_ALARM, PRIORITY_MAINTENANCE, PRIORITY_ON_DEMAND, CaptureScheduler
+from .thumbnails import ThumbnailPool
+
 
 logger = logging.getLogger()
 
 TIMESTAMP_FORMAT = '%Y-%m-%d-%H%M%S'
 
+# Motion detection records on the default splitter port 1.
+MOTION_SPLITTER_PORT = 1
+PREVIEW_SPLITTER_PORT = 2
+LUMINANCE_SPLITTER_PORT = 3
+
 
 def queue_captured(func):
     """Decorator to put the captured images on a queue."""
@@ -27,7 +37,7 @@ def queue_captured(func):
         queue = args[0].queue # self.queue
         captured = func(*args)
         for capture in captured:
-            queue.put(captured)
+            queue.put(capture)
         return captured
 
     return wrapper
@@ -50,85 +60,35 @@ def log(func):
             logger.info('%s: %s', func.__name__, result)
             return result
 
-
-def pause_record(func):
-    """Pause recording before a method and start afterward."""
-
-    def wrapper(self):
-        """Inner wrapper."""
-        if self.camera.recording:
-            self.camera.wait_recording(0.1)
-        try:
-            response = func(self)
-        except Exception as exc:
-            logger.error('Error in start_motion_detection: %s', exc)
-        finally:
-            self.camera.start_recording(
-                os.devnull,
-                format='h264',
-                motion_output=self
-            )
-        return response
-
-    return wrapper
-
-
-def settle_time(func):
-    """Check if `settle time` has been reached."""
-
-    def wrapper(self):
-        """Internal wrapper."""
-        if (time.time() - self.motion_detection_started) < self.motion_settle_time:
-            logger.debug('Ignoring initial motion due to settle time')
-            return
-        func(self)
     return wrapper
 
 
 class MotionDetector(PiMotionAnalysis):
-    """Extend PiMotionAnalysis with custom analysis method."""
+    """Extend PiMotionAnalysis with custom analysis method.
 
-    camera_trigger = Event()
+    Each camera has its own detector and `camera_trigger` event. Frames are
+    passed to `recorder` first if there is one.
+    """
 
-    def __init__(self, camera, size=None):
+    def __init__(self, camera, camera_trigger, magnitude=60, vectors=10, size=None, recorder=None):
         super(MotionDetector, self).__init__(camera, size)
-        self.motion_magnitude = 60
-        self.motion_vectors = 10
-        self.motion_settle_time = 1
-        self.motion_detection_started = 0
+        self.camera_trigger = camera_trigger
+        self.recorder = recorder
+        self.analyser = MotionAnalyser(magnitude, vectors)
 
-        self.camera.framerate = self.motion_framerate
         exposure_speed = self.camera.exposure_speed
         self.camera.shutter_speed = exposure_speed
         self.camera.awb_mode = 'off'
         self.camera.exposure_mode = 'off'
 
-    @log
-    @pause_record
-    def start_motion_detection(self):
-        """Begin motion detection."""
-        logger.debug('Starting motion detection')
-        self.set_motion_settings()
-        self.motion_detection_started = time.time()
-
-    @settle_time
     def analyse(self, a):
         """Motion detection algorithm taken from docs.
 
         https://picamera.readthedocs.io/en/release-1.10/api_array.html#picamera.array.PiMotionAnalysis
         """
-        a = np.sqrt(
-            np.square(a['x'].astype(np.float)) +
-            np.square(a['y'].astype(np.float))
-        ).clip(0, 255).astype(np.uint8)
-
-        vector_count = (a > self.motion_magnitude).sum()
-        if vector_count > self.motion_vectors:
-            logger.info(
-                'Motion detected. Vector count: %s. Threshold: %s',
-                vector_count,
-                self.motion_vectors
-            )
+        if self.recorder is not None:
+            self.recorder.record(a)
+        if self.analyser.analyse(a):
             # Set flag=True. Notify all threads.
             self.camera_trigger.set()
 
@@ -138,34 +98,128 @@ class Camera(PiCamera):
 
     Runs motion detection, provides a queue for photos, captues photos and GIFs.
     Default resolution is 1280x720. Original code has it as 1024x768.
+    `name` goes in the file names of the captures to tell cameras apart.
+    Motion detection records at `motion_analysis_size`, the full resolution
+    if None, while captures from the video port keep the full resolution.
+    With a `pir` sensor motion vectors only count while it's active, and
+    with `pir_mode` 'wake' the detect_motion thread only records then.
     """
 
     def __init__(
             self,
+            name='security',
+            camera_num=0,
             framerate=5,
             resolution='1024x768',  # auto set to 1280 x 720 if None
-            # capture_length='3',
+            capture_length=3,
             camera_mode='gif',
             photo_size='1024x768',
             # gif_size='1024x768',
             temp_directory='/var/tmp',
-            images_directory='/var/tmp'
+            images_directory='/var/tmp',
+            thumbnail_size=(1024, 768),
+            thumbnail_quality=80,
+            thumbnail_workers=1,
+            thumbnails=None,
+            recorder=None,
+            motion_analysis_size=None,
+            pir=None,
+            pir_mode=''
     ):
-        super(Camera, self).__init__(framerate=framerate, resolution=resolution)
+        super(Camera, self).__init__(
+            camera_num=camera_num,
+            framerate=framerate,
+            resolution=resolution
+        )
 
+        self.name = name
         self.photo_size = photo_size
         # self.gif_size = gif_size
-        # self.capture_length = capture_length
+        self.capture_length = capture_length
         self.camera_mode = camera_mode
         self.temp_directory = temp_directory
         self.images_directory = images_directory
+        self.motion_detection_setting = (60, 10)
+        self.motion_analysis_size = motion_analysis_size
+        self.pir = pir
+        # The sensor detect_motion waits for before recording, if any.
+        self.wake_sensor = pir if pir_mode == 'wake' else None
+        self.motion_detector = None
+        self.motion_detected = Event()
+        # PiCamera.recording is True while any splitter port records, the
+        # preview included, so motion detection is tracked on its own.
+        self.motion_detecting = False
+        self.recorder = recorder
+        # The CameraProfile last applied, None until the first.
+        self.profile = None
 
         self.lock = Lock()
         self.queue = Queue()
+        self.scheduler = CaptureScheduler('capture_scheduler_{0}'.format(name))
+        self.scheduler.start()
+        # A pool can be shared by several cameras.
+        self.thumbnails = thumbnails
+        if self.thumbnails is None and thumbnail_size and all(thumbnail_size):
+            self.thumbnails = ThumbnailPool(
+                size=thumbnail_size,
+                quality=thumbnail_quality,
+                workers=thumbnail_workers
+            )
+
+    @classmethod
+    def from_settings(cls, settings, name='security', thumbnails=None):
+        """Create a camera from a `Settings` instance."""
+        camera = cls(
+            name=name,
+            camera_num=settings.camera_num,
+            resolution=settings.motion_size,
+            capture_length=settings.camera_capture_length,
+            camera_mode=settings.camera_mode,
+            photo_size=settings.photo_size,
+            images_directory=settings.camera_save_path,
+            thumbnail_size=settings.thumbnail_size,
+            thumbnail_quality=settings.thumbnail_quality,
+            thumbnail_workers=settings.thumbnail_workers,
+            thumbnails=thumbnails,
+            recorder=MotionRecorder.from_settings(settings, name),
+            motion_analysis_size=settings.analysis_size,
+            pir=PIRSensor.from_settings(settings),
+            pir_mode=settings.pir_mode
+        )
+        camera.apply_settings(settings)
+        return camera
+
+    def apply_settings(self, settings):
+        """Apply the settings that can change without restarting the camera."""
+        self.capture_length = settings.camera_capture_length
+        self.camera_mode = settings.camera_mode
+        self.photo_size = settings.photo_size
+        self.images_directory = settings.camera_save_path
+        self.vflip = settings.camera_vflip
+        self.hflip = settings.camera_hflip
+        self.motion_detection_setting = settings.motion_detection_setting
+        # Thresholds are left to the profile while there is one.
+        if getattr(self, 'motion_detector', None) is not None and self.profile is None:
+            magnitude, vectors = self.motion_thresholds(settings.motion_detection_setting)
+            self.motion_detector.analyser.magnitude = magnitude
+            self.motion_detector.analyser.vectors = vectors
+        if self.thumbnails is not None:
+            self.thumbnails.size = settings.thumbnail_size
+            self.thumbnails.quality = settings.thumbnail_quality
+
+    def motion_thresholds(self, setting):
+        """Scale a (magnitude, vectors) setting for the full resolution to the
+        resolution motion is analysed at.
+        """
+        if self.motion_analysis_size is None:
+            return setting
+        return scale_thresholds(setting, self.resolution, self.motion_analysis_size)
 
-    def create_image_path(self, timestamp, prefix='security', name=None, file_suffix='.jpg'):
+    def create_image_path(self, timestamp, prefix=None, name=None, file_suffix='.jpg'):
         """Create the location on disk to store the captured image."""
         # timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+        if prefix is None:
+            prefix = self.name
         if prefix == name:
             prefix = None
 
@@ -197,10 +251,13 @@ class Camera(PiCamera):
         """Captures an image and saves it to disk."""
         image_path = self.create_image_path(timestamp, name=name)
         with self.lock:
-            while self.recording:
-                time.sleep(0.1)
-            time.sleep(2)
-            self.capture(image_path, use_video_port=False)
+            if self.recording:
+                # Grab from the video port rather than waiting for motion
+                # detection to stop.
+                self.capture(image_path, use_video_port=True)
+            else:
+                time.sleep(2)
+                self.capture(image_path, use_video_port=False)
         return image_path
 
     def create_jpg_paths(self, path, capture_length=3):
@@ -222,24 +279,27 @@ class Camera(PiCamera):
             rest (list): A list of paths to the remaining images.
             timestamp (str): A string representing the current date and
                 time.
-        Returns: None
+        Returns:
+            (str): The path to the saved gif.
         """
 
+        from PIL import Image
+
         # Create a new path to store a .gif
         if timestamp is None:
-            date_time = datetime.utcnow()
+            timestamp = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
 
-        timestamp = date_time.strftime(TIMESTAMP_FORMAT)
         gif_path = self.create_image_path(timestamp, file_suffix='.gif')
 
         first_jpg = Image.open(first)
-        return first_jpg.save(
+        first_jpg.save(
             gif_path,
             append_images=[Image.open(path) for path in rest],
             save_all=True,
             loop=0,
             duration=200
         )
+        return gif_path
 
     def capture_to_path(self, path):
         """Capture an image from the camera to the current path.
@@ -249,7 +309,7 @@ class Camera(PiCamera):
 
         Returns: None
         """
-        while self.recording:
+        while self.motion_detecting:
             time.sleep(0.1)
         self.capture(path)
 
@@ -259,13 +319,18 @@ class Camera(PiCamera):
 
         Args:
             timestamp (str): A string in the form `TIMESTAMP_FORMAT`
+        Returns:
+            (str): The path to the saved gif.
         """
-        prepared_paths = [self.create_image_path(timestamp, name=i) for i in range(capture_length * 3)]
-        paths = self.capture_sequence(prepared_paths)
+        paths = [
+            self.create_image_path(timestamp, name=str(i))
+            for i in range(capture_length * 3)
+        ]
 
         with self.lock:
-            for path in paths:
-                self.capture_to_path(path)
+            self.capture_sequence(paths, use_video_port=True)
+
+        return self.save_gif(paths[0], paths[1:], timestamp=timestamp)
 
         # # Remove the unused jpg paths.
         # for jpeg in jpg_paths:
@@ -277,29 +342,205 @@ class Camera(PiCamera):
 
         Args:
             timestamp (str): Timestamp in format '%Y-%m-%d-%H%M%S'
+        Returns:
+            (list): The paths of the captured files.
         """
+        captured = []
         if self.camera_mode == 'gif':
-            captured = self.create_gif(timestamp)
+            captured.append(self.create_gif(timestamp, capture_length))
 
         elif self.camera_mode == 'photo':
             for i in range(capture_length):
-                captured = self.capture_image(timestamp, name=i)
+                captured.append(self.capture_image(timestamp, name=str(i)))
 
         else:
             logger.error('Unsupported camera_mode: %s', self.camera_mode)
-        return captured
+        # Failed captures are logged and returned as None by `log`.
+        return [path for path in captured if path is not None]
+
+    def start_motion_detection(self):
+        """Record to the motion detector on the default splitter port, resized
+        to `motion_analysis_size`.
+
+        Errors are raised so the detect_motion thread is restarted.
+        """
+        if self.motion_detecting:
+            return
+        if self.motion_detector is None:
+            setting = self.motion_detection_setting
+            if self.profile is not None:
+                setting = self.profile.motion_detection_setting
+            magnitude, vectors = self.motion_thresholds(setting)
+            self.motion_detector = MotionDetector(
+                self,
+                self.motion_detected,
+                magnitude,
+                vectors,
+                size=self.motion_analysis_size,
+                recorder=self.recorder
+            )
+            if self.pir is not None:
+                self.motion_detector.analyser.gate = self.pir.active
+        logger.debug('Starting motion detection')
+        self.motion_detected.clear()
+        self.motion_detector.analyser.start()
+        self.start_recording(
+            os.devnull,
+            format='h264',
+            motion_output=self.motion_detector,
+            splitter_port=MOTION_SPLITTER_PORT,
+            resize=self.motion_analysis_size
+        )
+        self.motion_detecting = True
+
+    def stop_motion_detection(self):
+        """Stop motion detection so the camera can capture."""
+        if self.motion_detecting:
+            self.end_recording()
 
     @log
     def end_recording(self):
-        """Stop the camera from recording."""
+        """Stop motion detection recording."""
+        self.motion_detecting = False
         try:
             logger.debug('Stopping recording.')
-            self.stop_recording()
+            self.stop_recording(splitter_port=MOTION_SPLITTER_PORT)
         except PiCameraNotRecording as exc:
             logger.warning(str(exc))
             return
 
 
+    def start_preview_stream(self, output, size=(640, 480), framerate=None):
+        """Record MJPEG to `output` from a second splitter port.
+
+        Runs alongside motion detection on the default port so the live
+        preview doesn't interrupt it.
+
+        Args:
+            output (FrameBuffer): Receives the JPEG frames.
+            size (tuple): Resolution to resize the preview to.
+        """
+        logger.debug('Starting preview stream at %s', size)
+        self.start_recording(
+            output,
+            format='mjpeg',
+            splitter_port=PREVIEW_SPLITTER_PORT,
+            resize=size
+        )
+
+    @log
+    def stop_preview_stream(self):
+        """Stop the MJPEG preview recording."""
+        try:
+            self.stop_recording(splitter_port=PREVIEW_SPLITTER_PORT)
+        except PiCameraNotRecording as exc:
+            logger.warning(str(exc))
+
+    def take_photo(self):
+        """Request an on-demand photo.
+
+        Returns:
+            (Future): Resolves to the path of the captured photo.
+        """
+        return self.scheduler.submit(
+            'photo',
+            lambda: self.capture_image(self._timestamp(), name='photo'),
+            priority=PRIORITY_ON_DEMAND
+        )
+
+    def take_gif(self):
+        """Request an on-demand gif.
+
+        Returns:
+            (Future): Resolves to the path of the saved gif.
+        """
+        return self.scheduler.submit(
+            'gif',
+            lambda: self.create_gif(self._timestamp()),
+            priority=PRIORITY_ON_DEMAND
+        )
+
+    def trigger_alarm(self, capture_length=None):
+        """Request the captures for a motion alarm ahead of on-demand jobs.
+
+        Returns:
+            (Future): Resolves to the captured path(s).
+        """
+        timestamp = self._timestamp()
+        capture_length = capture_length or self.capture_length
+        return self.scheduler.submit(
+            ('alarm', timestamp),
+            lambda: self.trigger_camera(timestamp, capture_length),
+            priority=PRIORITY_ALARM
+        )
+
+    def measure_luminance(self):
+        """Request the brightness of the scene from a small video port frame.
+
+        Recording carries on while it's measured.
+
+        Returns:
+            (Future): Resolves to the brightness, as in profiles.luminance.
+        """
+        return self.scheduler.submit('luminance', self._measure_luminance, priority=PRIORITY_MAINTENANCE)
+
+    def _measure_luminance(self):
+        output = io.BytesIO()
+        with self.lock:
+            self.capture(
+                output,
+                format='yuv',
+                resize=LUMINANCE_SIZE,
+                use_video_port=True,
+                splitter_port=LUMINANCE_SPLITTER_PORT
+            )
+            exposure_speed = self.exposure_speed
+            gain = self.analog_gain * self.digital_gain
+        return luminance(output.getbuffer(), exposure_speed, gain)
+
+    def apply_profile(self, profile):
+        """Request a switch to `profile`, metering exposure again.
+
+        Returns:
+            (Future): Resolves to the profile once applied.
+        """
+        return self.scheduler.submit(
+            ('profile', profile),
+            lambda: self._apply_profile(profile),
+            priority=PRIORITY_MAINTENANCE
+        )
+
+    def _apply_profile(self, profile):
+        # The framerate can't change while recording but framerate_delta
+        # can, so motion detection keeps running.
+        detector = self.motion_detector
+        if detector is not None:
+            # Changing exposure looks like motion.
+            detector.analyser.start(now=time.time() + METERING_TIME)
+        with self.lock:
+            self.framerate_delta = (profile.framerate or self.framerate) - self.framerate
+            self.iso = profile.iso
+            self.shutter_speed = profile.shutter_speed
+            self.exposure_mode = profile.exposure_mode
+            self.awb_mode = 'auto'
+            time.sleep(METERING_TIME)
+            if not profile.shutter_speed:
+                self.shutter_speed = self.exposure_speed
+            self.exposure_mode = 'off'
+            gains = self.awb_gains
+            self.awb_mode = 'off'
+            self.awb_gains = gains
+        self.profile = profile
+        if detector is not None:
+            detector.analyser.magnitude, detector.analyser.vectors = self.motion_thresholds(
+                profile.motion_detection_setting
+            )
+        logger.info('Camera %s using the %s profile', self.name, profile.name)
+        return profile
+
+    def _timestamp(self):
+        return datetime.now().strftime(TIMESTAMP_FORMAT)
+
     def clear_queue(self):
         with self.queue.mutex:
             self.queue.queue.clear()
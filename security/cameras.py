@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import OrderedDict
+
+from .thumbnails import ThumbnailPool
+
+logger = logging.getLogger()
+
+# Used when the config file doesn't list any cameras. It's also the prefix
+# the single camera has always used for its file names.
+DEFAULT_CAMERA = 'security'
+
+
+class CameraGroup(object):
+    """The cameras run by one daemon, in the order they are configured.
+
+    Each camera has its own motion detection thread and capture scheduler.
+    They share the daemon's alarm state, notifier and thumbnail pool.
+    """
+
+    def __init__(self, cameras, thumbnails=None):
+        self.cameras = OrderedDict((camera.name, camera) for camera in cameras)
+        self.thumbnails = thumbnails
+
+    @classmethod
+    def from_settings(cls, settings, backend=None):
+        """Create every camera listed in `settings.cameras`.
+
+        Args:
+            settings (Settings): The daemon settings.
+            backend (type): The camera class, `Camera` if None. It's
+                created with `backend.from_settings(settings, name,
+                thumbnails)`.
+        """
+        if backend is None:
+            from .camera import Camera as backend
+        thumbnails = None
+        if settings.thumbnail_size and all(settings.thumbnail_size):
+            thumbnails = ThumbnailPool(
+                size=settings.thumbnail_size,
+                quality=settings.thumbnail_quality,
+                workers=settings.thumbnail_workers
+            )
+        cameras = [
+            backend.from_settings(settings.for_camera(name), name=name, thumbnails=thumbnails)
+            for name in settings.cameras or (DEFAULT_CAMERA,)
+        ]
+        logger.debug('Created cameras: %s', ', '.join(camera.name for camera in cameras))
+        return cls(cameras, thumbnails)
+
+    def __iter__(self):
+        # A copy, cameras of coordinator nodes are added while running.
+        return iter(list(self.cameras.values()))
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def names(self):
+        return list(self.cameras)
+
+    def add(self, camera):
+        """Add a camera unless there is one with the same name."""
+        self.cameras.setdefault(camera.name, camera)
+        return self.cameras[camera.name]
+
+    def get(self, name=None):
+        """Return the camera called `name`, or the first camera if None.
+
+        Raises:
+            KeyError: If there is no camera called `name`.
+        """
+        if name is None:
+            return next(iter(self.cameras.values()))
+        try:
+            return self.cameras[name.lower()]
+        except KeyError:
+            raise KeyError('Unknown camera: {0}'.format(name))
+
+    def label(self, camera):
+        """Return ' on <name>' for messages when there is more than one camera."""
+        if len(self.cameras) > 1:
+            return ' on {0}'.format(camera.name)
+        return ''
+
+    def apply_settings(self, settings):
+        for camera in self:
+            camera.apply_settings(settings.for_camera(camera.name))
+
+    def clear_queues(self):
+        for camera in self:
+            camera.clear_queue()
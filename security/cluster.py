@@ -0,0 +1,680 @@
+# -*- coding: utf-8 -*-
+"""Nodes and a coordinator for installs with several camera Pis.
+
+Nodes run cameras and motion detection only. The coordinator runs the
+presence detection, `State` and Telegram bot and treats the cameras of
+its nodes like its own, so /photo, /gif and motion alerts work the same.
+
+Every message is a frame of two big-endian uint32s, the header and body
+lengths, then a JSON header and an optional binary body for media
+chunks. Both sides send a heartbeat every `heartbeat_interval` and drop a
+connection that has been silent for `heartbeat_timeout`.
+
+Node to coordinator:
+    hello {node, cameras, token}, heartbeat, motion {camera, time},
+    media_begin {id, name, camera, size, request}, media_chunk {id, offset}
+    + body, media_end {id}, capture_failed {request, error}
+
+Coordinator to node:
+    welcome {state}, heartbeat {state}, error {error},
+    capture {camera, kind, request}, media_offset {id, offset},
+    media_ack {id}
+
+Media uploads resume where they stopped. The coordinator keeps partial
+uploads in `<name>.part` and answers media_begin and media_end with the
+offset it has, the node sends from there.
+"""
+
+import hmac
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Queue
+from threading import Condition, Event, Lock, Thread
+
+from .settings import CAMERA_NAME_PATTERN
+from .state import STATES, State
+
+logger = logging.getLogger()
+
+DEFAULT_PORT = 7300
+FRAME = struct.Struct('!II')
+MAX_HEADER_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+
+# Seconds a node waits for the coordinator to answer media_begin/end.
+REPLY_TIMEOUT = 30
+
+# Media waiting to be uploaded while the coordinator is unreachable.
+MAX_OUTBOX = 100
+
+UPLOAD_ATTEMPTS = 3
+
+Media = namedtuple('Media', 'id path camera request')
+
+
+class ClusterError(Exception):
+    """A protocol error or a lost connection."""
+
+
+def parse_address(value, default_port=DEFAULT_PORT):
+    """Parse `host:port`, `:port` or `host` into a (host, port) tuple."""
+    host, sep, port = value.strip().rpartition(':')
+    if not sep:
+        return (port, default_port)
+    return (host, int(port or default_port))
+
+
+def send_frame(sock, header, body=b''):
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(FRAME.pack(len(data), len(body)) + data + body)
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ClusterError('Connection closed')
+        received += count
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """Read one frame.
+
+    Returns:
+        (tuple): The header dict and the body bytes.
+    """
+    header_size, body_size = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    if header_size > MAX_HEADER_SIZE or body_size > MAX_BODY_SIZE:
+        raise ClusterError('Frame too large')
+    header = json.loads(_recv_exactly(sock, header_size).decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ClusterError('Header must be a JSON object')
+    body = _recv_exactly(sock, body_size) if body_size else b''
+    return header, body
+
+
+class Peer(object):
+    """One end of a connection, sends are serialised so threads can share it."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = Lock()
+        self.closed = False
+
+    def send(self, header, body=b''):
+        if self.closed:
+            raise ClusterError('Connection closed')
+        with self.lock:
+            send_frame(self.sock, header, body)
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class RemoteCamera(object):
+    """A camera on a node as seen by the coordinator."""
+
+    def __init__(self, coordinator, node, camera, thumbnails=None):
+        self.name = '{0}-{1}'.format(node, camera)
+        self.node = node
+        self.camera = camera
+        self.coordinator = coordinator
+        self.thumbnails = thumbnails
+        self.queue = Queue()
+
+    def apply_settings(self, settings):
+        pass
+
+    def take_photo(self):
+        return self.coordinator.request_capture(self, 'photo')
+
+    def take_gif(self):
+        return self.coordinator.request_capture(self, 'gif')
+
+    def clear_queue(self):
+        with self.queue.mutex:
+            self.queue.queue.clear()
+
+
+class Upload(object):
+
+    def __init__(self, path, size, camera, request):
+        self.path = path
+        self.size = size
+        self.camera = camera
+        self.request = request
+        self.file = open(path + '.part', 'ab')
+        self.offset = self.file.tell()
+        if self.offset > size:
+            self.file.truncate(0)
+            self.offset = 0
+
+
+class Coordinator(object):
+    """Accepts nodes, shares the alarm state with them and receives their media.
+
+    Cameras of connected nodes are added to `cameras` as `RemoteCamera`.
+    Alarm media goes on the remote camera's queue for process_photos, media
+    for /photo and /gif resolves the Future from `request_capture`.
+    """
+
+    def __init__(
+            self,
+            network,
+            cameras,
+            address=('', DEFAULT_PORT),
+            token='',
+            media_directory='/var/tmp',
+            heartbeat_interval=1.0,
+            heartbeat_timeout=5.0
+    ):
+        self.network = network
+        self.cameras = cameras
+        self.address = address
+        self.token = token
+        self.media_directory = media_directory
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.nodes = {}
+        self.offline = set()
+        # request id: (node, Future)
+        self.requests = {}
+        self.request_ids = itertools.count()
+        self.lock = Lock()
+        self.state_changed = Event()
+        self.running = False
+        self.listener = None
+        network.state.listeners.append(lambda snapshot: self.state_changed.set())
+
+    @classmethod
+    def from_settings(cls, network, cameras):
+        settings = network.settings
+        return cls(
+            network,
+            cameras,
+            address=parse_address(settings.cluster_address),
+            token=settings.cluster_token,
+            media_directory=settings.camera_save_path,
+            heartbeat_interval=settings.heartbeat_interval,
+            heartbeat_timeout=settings.heartbeat_timeout
+        )
+
+    def start(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.address)
+        self.listener.listen(16)
+        self.address = self.listener.getsockname()[:2]
+        self.running = True
+        for name, target in (('coordinator', self._accept), ('coordinator_heartbeat', self._heartbeat)):
+            thread = Thread(name=name, target=target)
+            thread.daemon = True
+            thread.start()
+        logger.info('Coordinator listening on %s:%s', *self.address)
+
+    def stop(self):
+        self.running = False
+        self.state_changed.set()
+        try:
+            # Wakes the thread blocked in accept.
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        with self.lock:
+            peers = list(self.nodes.values())
+        for peer in peers:
+            peer.close()
+
+    def request_capture(self, camera, kind):
+        """Ask a node for a photo or gif.
+
+        Returns:
+            (Future): Resolves to the path of the received media.
+        """
+        future = Future()
+        with self.lock:
+            peer = self.nodes.get(camera.node)
+            request_id = next(self.request_ids)
+            self.requests[request_id] = (camera.node, future)
+        try:
+            if peer is None:
+                raise ClusterError('Node {0} is offline'.format(camera.node))
+            peer.send({'type': 'capture', 'camera': camera.camera, 'kind': kind, 'request': request_id})
+        except (ClusterError, OSError) as exc:
+            with self.lock:
+                self.requests.pop(request_id, None)
+            future.set_exception(exc)
+        return future
+
+    def _accept(self):
+        logger.info("thread running")
+        while self.running:
+            try:
+                sock, address = self.listener.accept()
+            except OSError:
+                return
+            thread = Thread(name='coordinator_node', target=self._serve, args=(sock, address))
+            thread.daemon = True
+            thread.start()
+
+    def _heartbeat(self):
+        logger.info("thread running")
+        while self.running:
+            # State changes go out at once, otherwise once per interval.
+            self.state_changed.wait(self.heartbeat_interval)
+            self.state_changed.clear()
+            header = {'type': 'heartbeat', 'state': self.network.state.current}
+            with self.lock:
+                peers = list(self.nodes.values())
+            for peer in peers:
+                try:
+                    peer.send(header)
+                except (ClusterError, OSError):
+                    peer.close()
+
+    def _serve(self, sock, address):
+        sock.settimeout(self.heartbeat_timeout)
+        peer = Peer(sock)
+        name = None
+        uploads = {}
+        try:
+            header, _ = recv_frame(sock)
+            if header.get('type') != 'hello' or not hmac.compare_digest(
+                    str(header.get('token', '')).encode('utf-8'), self.token.encode('utf-8')):
+                peer.send({'type': 'error', 'error': 'Not authorised'})
+                logger.warning('Rejected node connection from %s', address[0])
+                return
+            name = str(header['node'])
+            if not CAMERA_NAME_PATTERN.match(name):
+                peer.send({'type': 'error', 'error': 'Invalid node name'})
+                return
+            with self.lock:
+                previous = self.nodes.get(name)
+                self.nodes[name] = peer
+            if previous is not None:
+                previous.close()
+            for camera in header.get('cameras', []):
+                self.cameras.add(RemoteCamera(self, name, camera, self.cameras.thumbnails))
+            peer.send({'type': 'welcome', 'state': self.network.state.current})
+            logger.info('Node %s connected from %s', name, address[0])
+            with self.lock:
+                was_offline = name in self.offline
+                self.offline.discard(name)
+            if was_offline:
+                self.network.state.notify('Node {0} is back online'.format(name))
+            while self.running:
+                header, body = recv_frame(sock)
+                self._handle(name, peer, uploads, header, body)
+        except socket.timeout:
+            logger.warning('Node %s stopped sending heartbeats', name or address[0])
+        except (ClusterError, OSError, ValueError, KeyError) as exc:
+            logger.warning('Node %s disconnected: %s', name or address[0], exc)
+        finally:
+            for upload in uploads.values():
+                upload.file.close()
+            with self.lock:
+                lost = name is not None and self.nodes.get(name) is peer
+                pending = []
+                if lost:
+                    del self.nodes[name]
+                    for request_id, (node, future) in list(self.requests.items()):
+                        if node == name:
+                            del self.requests[request_id]
+                            pending.append(future)
+                    if self.running:
+                        self.offline.add(name)
+            peer.close()
+            for future in pending:
+                future.set_exception(ClusterError('Node {0} disconnected'.format(name)))
+            if lost and self.running:
+                self.network.state.notify('Node {0} is offline'.format(name))
+
+    def _handle(self, name, peer, uploads, header, body):
+        kind = header.get('type')
+        if kind == 'heartbeat':
+            return
+        if kind == 'motion':
+            logger.info('Motion detected on %s-%s', name, header.get('camera'))
+        elif kind == 'media_begin':
+            media_id = str(header['id'])
+            if media_id in uploads:
+                uploads.pop(media_id).file.close()
+            path = os.path.join(
+                self.media_directory,
+                '{0}-{1}'.format(name, os.path.basename(header['name']))
+            )
+            upload = Upload(path, int(header['size']), header.get('camera'), header.get('request'))
+            uploads[media_id] = upload
+            peer.send({'type': 'media_offset', 'id': media_id, 'offset': upload.offset})
+        elif kind == 'media_chunk':
+            upload = uploads.get(str(header['id']))
+            # Chunks that don't follow on are dropped, media_end tells the
+            # node where to carry on from.
+            if upload is not None and header.get('offset') == upload.offset:
+                upload.file.write(body)
+                upload.offset += len(body)
+        elif kind == 'media_end':
+            media_id = str(header['id'])
+            upload = uploads.get(media_id)
+            if upload is None:
+                peer.send({'type': 'media_offset', 'id': media_id, 'offset': 0})
+            elif upload.offset != upload.size:
+                upload.file.flush()
+                peer.send({'type': 'media_offset', 'id': media_id, 'offset': upload.offset})
+            else:
+                del uploads[media_id]
+                upload.file.close()
+                os.replace(upload.path + '.part', upload.path)
+                peer.send({'type': 'media_ack', 'id': media_id})
+                self._received(name, upload)
+        elif kind == 'capture_failed':
+            with self.lock:
+                _, future = self.requests.pop(header.get('request'), (None, None))
+            if future is not None:
+                future.set_exception(ClusterError(header.get('error')))
+        else:
+            logger.warning('Ignoring unknown message %s from node %s', kind, name)
+
+    def _received(self, name, upload):
+        logger.debug('Received %s from node %s', upload.path, name)
+        if upload.request is not None:
+            with self.lock:
+                _, future = self.requests.pop(upload.request, (None, None))
+            if future is not None:
+                future.set_result(upload.path)
+            return
+        try:
+            camera = self.cameras.get('{0}-{1}'.format(name, upload.camera))
+        except KeyError:
+            camera = self.cameras.add(RemoteCamera(self, name, upload.camera, self.cameras.thumbnails))
+        camera.queue.put(upload.path)
+
+
+class NodeState(State):
+    """Follows the coordinator's state, notifications are the coordinator's job."""
+
+    def notify(self, message):
+        logger.debug('Not notifying on a node: %s', message)
+
+
+class Node(object):
+    """Runs the cameras of one Pi for a coordinator.
+
+    Connects to the first of `coordinators` that answers and fails over to
+    the next when it stops sending heartbeats. The alarm state follows the
+    coordinator, motion detection keeps going with the last known state
+    while disconnected and media is held in an outbox until it's uploaded.
+    """
+
+    def __init__(
+            self,
+            name,
+            cameras,
+            coordinators,
+            token='',
+            heartbeat_interval=1.0,
+            heartbeat_timeout=5.0,
+            chunk_size=CHUNK_SIZE,
+            max_outbox=MAX_OUTBOX
+    ):
+        self.name = name.lower()
+        self.cameras = cameras
+        self.coordinators = list(coordinators)
+        self.token = token
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.chunk_size = chunk_size
+        self.max_outbox = max_outbox
+        self.state = NodeState(self)
+        self.outbox = OrderedDict()
+        self.outbox_ready = Condition()
+        self.replies = {}
+        self.replies_lock = Lock()
+        self.peer = None
+        self.coordinator = None
+        self.connected = Event()
+        self.running = False
+
+    @classmethod
+    def from_settings(cls, settings, cameras):
+        return cls(
+            settings.node_name or socket.gethostname(),
+            cameras,
+            [parse_address(address) for address in settings.coordinators],
+            token=settings.cluster_token,
+            heartbeat_interval=settings.heartbeat_interval,
+            heartbeat_timeout=settings.heartbeat_timeout
+        )
+
+    def start(self):
+        self.running = True
+        for name, target in (('node', self._run), ('node_collect', self._collect)):
+            thread = Thread(name=name, target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        peer = self.peer
+        if peer is not None:
+            peer.close()
+        with self.outbox_ready:
+            self.outbox_ready.notify_all()
+
+    def send_motion(self, camera):
+        """Tell the coordinator about motion ahead of the media."""
+        peer = self.peer
+        if peer is None:
+            return
+        try:
+            peer.send({'type': 'motion', 'camera': camera.name, 'time': time.time()})
+        except (ClusterError, OSError) as exc:
+            logger.warning('Failed to send motion event: %s', exc)
+
+    def queue_media(self, path, camera, request=None):
+        media = Media(os.path.basename(path), path, camera, request)
+        with self.outbox_ready:
+            self.outbox[media.id] = media
+            while len(self.outbox) > self.max_outbox:
+                _, dropped = self.outbox.popitem(last=False)
+                logger.warning('Outbox full, not sending %s', dropped.path)
+            self.outbox_ready.notify_all()
+
+    def _collect(self):
+        logger.info("thread running")
+        while self.running:
+            for camera in self.cameras:
+                while not camera.queue.empty():
+                    path = camera.queue.get()
+                    camera.queue.task_done()
+                    if path is not None:
+                        self.queue_media(path, camera.name)
+            time.sleep(0.1)
+
+    def _run(self):
+        logger.info("thread running")
+        index = 0
+        while self.running:
+            address = self.coordinators[index % len(self.coordinators)]
+            try:
+                sock = socket.create_connection(address, timeout=self.heartbeat_timeout)
+            except OSError as exc:
+                logger.debug('Unable to connect to coordinator %s:%s: %s', address[0], address[1], exc)
+                index += 1
+                if index % len(self.coordinators) == 0:
+                    time.sleep(self.heartbeat_interval)
+                continue
+            self._session(sock, address)
+            # Try the next coordinator first after losing one.
+            index += 1
+
+    def _session(self, sock, address):
+        sock.settimeout(self.heartbeat_timeout)
+        peer = Peer(sock)
+        try:
+            peer.send({
+                'type': 'hello',
+                'node': self.name,
+                'cameras': self.cameras.names(),
+                'token': self.token
+            })
+            header, _ = recv_frame(sock)
+            if header.get('type') != 'welcome':
+                logger.error('Coordinator %s refused the connection: %s', address[0], header.get('error'))
+                time.sleep(self.heartbeat_timeout)
+                return
+            self._apply_state(header.get('state'))
+            self.peer = peer
+            self.coordinator = address
+            self.connected.set()
+            logger.info('Connected to coordinator %s:%s', address[0], address[1])
+            for name, target in (('node_heartbeat', self._heartbeat), ('node_upload', self._upload_loop)):
+                thread = Thread(name=name, target=target, args=(peer,))
+                thread.daemon = True
+                thread.start()
+            while self.running:
+                header, body = recv_frame(sock)
+                self._handle(peer, header)
+        except socket.timeout:
+            logger.warning('Coordinator %s stopped sending heartbeats', address[0])
+        except (ClusterError, OSError, ValueError) as exc:
+            logger.warning('Lost coordinator %s: %s', address[0], exc)
+        finally:
+            self.connected.clear()
+            self.peer = None
+            peer.close()
+            with self.replies_lock:
+                replies = list(self.replies.values())
+                self.replies.clear()
+            for future in replies:
+                if not future.done():
+                    future.set_exception(ClusterError('Connection lost'))
+            with self.outbox_ready:
+                self.outbox_ready.notify_all()
+
+    def _apply_state(self, state):
+        if state in STATES and state != self.state.current:
+            self.state.update_state(state)
+
+    def _handle(self, peer, header):
+        kind = header.get('type')
+        if kind == 'heartbeat':
+            self._apply_state(header.get('state'))
+        elif kind in ('media_offset', 'media_ack'):
+            with self.replies_lock:
+                future = self.replies.pop(header.get('id'), None)
+            if future is not None:
+                future.set_result(header)
+        elif kind == 'capture':
+            self._capture(peer, header)
+        else:
+            logger.warning('Ignoring unknown message %s from coordinator', kind)
+
+    def _capture(self, peer, header):
+        request = header.get('request')
+        try:
+            camera = self.cameras.get(header.get('camera'))
+            if header.get('kind') == 'gif':
+                future = camera.take_gif()
+            else:
+                future = camera.take_photo()
+        except KeyError as exc:
+            peer.send({'type': 'capture_failed', 'request': request, 'error': exc.args[0]})
+            return
+
+        def captured(future):
+            try:
+                path = future.result()
+                if path is None:
+                    raise ClusterError('Failed to capture from {0}'.format(camera.name))
+            except Exception as exc:
+                try:
+                    peer.send({'type': 'capture_failed', 'request': request, 'error': str(exc)})
+                except (ClusterError, OSError):
+                    pass
+            else:
+                self.queue_media(path, camera.name, request)
+
+        future.add_done_callback(captured)
+
+    def _heartbeat(self, peer):
+        while not peer.closed:
+            try:
+                peer.send({'type': 'heartbeat'})
+            except (ClusterError, OSError):
+                return
+            time.sleep(self.heartbeat_interval)
+
+    def _upload_loop(self, peer):
+        while not peer.closed:
+            with self.outbox_ready:
+                if not self.outbox:
+                    self.outbox_ready.wait(self.heartbeat_interval)
+                    continue
+                media = next(iter(self.outbox.values()))
+            try:
+                if not os.path.isfile(media.path):
+                    raise ValueError('File not found')
+                self._upload(peer, media)
+            except ValueError as exc:
+                logger.error('Not sending %s: %s', media.path, exc)
+            except (ClusterError, OSError, FutureTimeoutError) as exc:
+                logger.warning('Upload of %s interrupted: %s', media.path, exc)
+                peer.close()
+                return
+            with self.outbox_ready:
+                if self.outbox.get(media.id) is media:
+                    del self.outbox[media.id]
+
+    def _request(self, peer, header):
+        future = Future()
+        with self.replies_lock:
+            self.replies[header['id']] = future
+        peer.send(header)
+        return future.result(timeout=REPLY_TIMEOUT)
+
+    def _upload(self, peer, media):
+        with open(media.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # media_begin tells us how much the coordinator already has, from
+            # an earlier connection or a previous attempt.
+            for attempt in range(UPLOAD_ATTEMPTS):
+                reply = self._request(peer, {
+                    'type': 'media_begin',
+                    'id': media.id,
+                    'name': os.path.basename(media.path),
+                    'camera': media.camera,
+                    'size': size,
+                    'request': media.request
+                })
+                offset = reply['offset']
+                f.seek(offset)
+                while offset < size:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        raise ValueError('File shrank while uploading')
+                    peer.send({'type': 'media_chunk', 'id': media.id, 'offset': offset}, chunk)
+                    offset += len(chunk)
+                reply = self._request(peer, {'type': 'media_end', 'id': media.id})
+                if reply['type'] == 'media_ack':
+                    logger.debug('Sent %s to the coordinator', media.path)
+                    return
+        raise ValueError('Coordinator did not accept it after {0} attempts'.format(UPLOAD_ATTEMPTS))
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import selectors
+import socket
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, Thread
+
+from .profiler import DEFAULT_INTERVAL, DEFAULT_SECONDS, profile as run_profile
+
+logger = logging.getLogger()
+
+DEFAULT_SOCKET = '/run/rpi-security.sock'
+
+# Requests longer than this are rejected and the connection closed.
+MAX_REQUEST_SIZE = 64 * 1024
+
+# Stop reading requests from a client with this many bytes of responses
+# it hasn't read yet.
+MAX_RESPONSE_BUFFER = 1024 * 1024
+
+
+class ControlError(Exception):
+    """An error returned to the client."""
+
+
+class Connection(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.closed = False
+
+
+class ControlServer(object):
+    """Local control API on a Unix socket.
+
+    Clients send one JSON object per line, `{"command": "status"}` with
+    optional `"args"` and `"id"`, and get one JSON object per line back,
+    `{"ok": true, "result": ...}` or `{"ok": false, "error": "..."}`. The id
+    is echoed so clients can pipeline requests.
+
+    A single selector loop handles every client. Commands registered as
+    blocking run on a small thread pool and commands that return a Future
+    are answered when it resolves, so a slow command never holds up status
+    queries.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, workers=2):
+        self.path = path
+        self.handlers = {}
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.completed = deque()
+        self.completed_lock = Lock()
+        self.running = False
+        self.thread = None
+        self.listener = None
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.register('help', self.help)
+
+    def register(self, command, func, blocking=False):
+        """Add a command.
+
+        Args:
+            command (str): The command name.
+            func (callable): Called with the request args as keyword
+                arguments. Returns a JSON serialisable result or a Future.
+            blocking (bool): Run `func` on the thread pool.
+        """
+        if blocking:
+            def handler(**kwargs):
+                return self.executor.submit(func, **kwargs)
+            handler.__doc__ = func.__doc__
+        else:
+            handler = func
+        self.handlers[command] = handler
+
+    def help(self):
+        """List the available commands."""
+        return dict(
+            (name, (handler.__doc__ or '').strip().split('\n')[0])
+            for name, handler in self.handlers.items()
+        )
+
+    def start(self):
+        """Listen on the socket and serve on a background thread."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        os.chmod(self.path, 0o660)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, 'listener')
+        self.selector.register(self.wake_r, selectors.EVENT_READ, 'wake')
+        self.running = True
+        self.thread = Thread(name='control_server', target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info('Control API listening on %s', self.path)
+
+    def stop(self):
+        self.running = False
+        self._wake()
+        if self.thread is not None:
+            self.thread.join(5)
+        for key in list(self.selector.get_map().values()):
+            if isinstance(key.data, Connection):
+                self._close(key.data)
+        self.selector.close()
+        self.listener.close()
+        self.wake_r.close()
+        self.wake_w.close()
+        self.executor.shutdown(wait=False)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def serve(self):
+        logger.info("thread running")
+        while self.running:
+            for key, mask in self.selector.select(timeout=1):
+                if key.data == 'listener':
+                    self._accept()
+                elif key.data == 'wake':
+                    self._drain_completed()
+                else:
+                    if mask & selectors.EVENT_READ:
+                        self._read(key.data)
+                    if mask & selectors.EVENT_WRITE and not key.data.closed:
+                        self._flush(key.data)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, Connection(sock))
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+        conn.inbuf.extend(data)
+        while not conn.closed:
+            end = conn.inbuf.find(b'\n')
+            if end < 0:
+                break
+            line = bytes(conn.inbuf[:end])
+            del conn.inbuf[:end + 1]
+            if line.strip():
+                self._dispatch(conn, line)
+        if len(conn.inbuf) > MAX_REQUEST_SIZE:
+            self._respond(conn, None, error='Request too large')
+            self._flush(conn)
+            self._close(conn)
+
+    def _dispatch(self, conn, line):
+        request_id = None
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ControlError('Request must be a JSON object')
+            request_id = request.get('id')
+            command = request.get('command')
+            if command not in self.handlers:
+                raise ControlError('Unknown command: {0}'.format(command))
+            args = request.get('args') or {}
+            if not isinstance(args, dict):
+                raise ControlError('args must be a JSON object')
+            result = self.handlers[command](**args)
+        except (ValueError, TypeError, ControlError) as exc:
+            self._respond(conn, request_id, error=str(exc))
+            return
+        except Exception as exc:
+            logger.exception('Control command failed')
+            self._respond(conn, request_id, error=repr(exc))
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._complete(conn, request_id, future))
+        else:
+            self._respond(conn, request_id, result=result)
+
+    def _complete(self, conn, request_id, future):
+        # Called from other threads, the response is handed to the loop.
+        with self.completed_lock:
+            self.completed.append((conn, request_id, future))
+        self._wake()
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain_completed(self):
+        try:
+            while self.wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        with self.completed_lock:
+            completed = list(self.completed)
+            self.completed.clear()
+        for conn, request_id, future in completed:
+            if conn.closed:
+                continue
+            try:
+                result = future.result()
+            except Exception as exc:
+                self._respond(conn, request_id, error=repr(exc))
+            else:
+                self._respond(conn, request_id, result=result)
+
+    def _respond(self, conn, request_id, result=None, error=None):
+        if error is None:
+            response = {'ok': True, 'result': result}
+        else:
+            response = {'ok': False, 'error': error}
+        if request_id is not None:
+            response['id'] = request_id
+        try:
+            data = json.dumps(response, default=str)
+        except (TypeError, ValueError) as exc:
+            data = json.dumps({'ok': False, 'error': repr(exc), 'id': request_id})
+        conn.outbuf.extend(data.encode('utf-8') + b'\n')
+        self._flush(conn)
+
+    def _flush(self, conn):
+        if conn.closed:
+            return
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._close(conn)
+            return
+        del conn.outbuf[:sent]
+        events = 0
+        if len(conn.outbuf) < MAX_RESPONSE_BUFFER:
+            events |= selectors.EVENT_READ
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(conn.sock, events, conn)
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+
+def register_state_commands(server, network, cameras=None):
+    """Expose the `State` methods and other commands the Telegram bot has."""
+
+    def status():
+        """Current alarm state."""
+        return network.state.status()
+
+    def status_text():
+        """Status report as sent by the Telegram bot."""
+        return network.state.generate_status_text()
+
+    def enable():
+        """Enable the alarm after it has been disabled."""
+        network.state.update_state('disarmed')
+        return network.state.status()
+
+    def disable():
+        """Disable the alarm until enabled."""
+        network.state.update_state('disabled')
+        return network.state.status()
+
+    def profile(seconds=DEFAULT_SECONDS, interval=DEFAULT_INTERVAL):
+        """Sample every thread's stack, returns the busiest and collapsed stacks."""
+        return run_profile(seconds, interval).as_dict()
+
+    server.register('status', status)
+    server.register('status_text', status_text)
+    server.register('enable', enable)
+    server.register('disable', disable)
+    server.register('profile', profile, blocking=True)
+
+    if cameras is not None:
+        def get_camera(name):
+            try:
+                return cameras.get(name)
+            except KeyError as exc:
+                raise ControlError(exc.args[0])
+
+        def list_cameras():
+            """Names of the cameras."""
+            return cameras.names()
+
+        def photo(camera=None):
+            """Capture a photo and return its path, from the first camera by default."""
+            return get_camera(camera).take_photo()
+
+        def gif(camera=None):
+            """Capture a gif and return its path, from the first camera by default."""
+            return get_camera(camera).take_gif()
+
+        server.register('cameras', list_cameras)
+        server.register('photo', photo)
+        server.register('gif', gif)
+
+
+def request(command, args=None, path=DEFAULT_SOCKET, timeout=30):
+    """Send a single command to a running daemon.
+
+    Returns:
+        (dict): The decoded response.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        payload = {'command': command}
+        if args:
+            payload['args'] = args
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        data = bytearray()
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ControlError('Connection closed by daemon')
+            data.extend(chunk)
+    finally:
+        sock.close()
+    return json.loads(data.decode('utf-8'))
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Drops photos that look almost the same as ones sent recently.
+
+A dHash of each photo is worked out from a 17x16 greyscale copy, one bit
+per pixel set if it's brighter than the pixel to its right. Photos of the
+same scene differ in a few of the 256 bits whatever the sensor noise,
+exposure or JPEG quality, while someone walking in changes a dozen or
+more. The hashes of photos sent in the last `window` seconds are kept in a
+small ring per camera, and a photo within `distance` bits of one of them,
+or of one earlier in the same event, isn't sent. A hash is only added to
+the ring once its photo has been sent, so a photo that failed to send
+doesn't hold back the next one like it.
+"""
+
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+# The hash is HASH_SIZE x HASH_SIZE bits. At 8, the usual size, a person
+# is often only a couple of bits.
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Hashes kept per camera, older ones are forgotten before `window` is up
+# if more photos than this are sent.
+INDEX_SIZE = 256
+HASHED_EXTENSIONS = ('.jpg', '.jpeg', '.gif')
+
+
+def hash_array(pixels):
+    """Return the dHash of a (HASH_SIZE, HASH_SIZE + 1) greyscale array."""
+    import numpy as np
+
+    bits = pixels[:, :-1] > pixels[:, 1:]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def dhash(path):
+    """Return the dHash of an image, the first frame of a GIF.
+
+    Runs in a worker process. JPEGs are scaled down while decoding.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    return hash_array(np.asarray(image, dtype=np.int16))
+
+
+class HashIndex(object):
+    """The hashes of the last `size` photos sent by one camera."""
+
+    def __init__(self, size=INDEX_SIZE):
+        import numpy as np
+
+        self.hashes = np.zeros((size, HASH_BITS // 8), dtype=np.uint8)
+        self.times = np.full(size, -np.inf)
+        self.added = 0
+
+    def nearest(self, value, now, window):
+        """Return the fewest bits `value` differs by from the hashes added in
+        the last `window` seconds, or None if there aren't any.
+        """
+        import numpy as np
+
+        recent = self.hashes[self.times >= now - window]
+        if not len(recent):
+            return None
+        value = np.frombuffer(value.to_bytes(self.hashes.shape[1], 'big'), dtype=np.uint8)
+        return int(np.unpackbits(recent ^ value, axis=1).sum(axis=1).min())
+
+    def add(self, value, now):
+        import numpy as np
+
+        i = self.added % len(self.hashes)
+        self.hashes[i] = np.frombuffer(value.to_bytes(self.hashes.shape[1], 'big'), dtype=np.uint8)
+        self.times[i] = now
+        self.added += 1
+
+
+class Deduplicator(object):
+    """Filters the photos of each event against those sent recently.
+
+    `pool` hashes the photos in worker processes, usually the cameras'
+    ThumbnailPool. Without one they're hashed in the calling thread.
+    """
+
+    def __init__(self, pool=None, size=INDEX_SIZE):
+        self.pool = pool
+        self.size = size
+        self.indexes = {}
+        # camera: {photo: hash} of the photos kept from its last event
+        self.unsent = {}
+
+    def _hashes(self, paths):
+        if self.pool is None:
+            futures = None
+        else:
+            futures = [self.pool.run(dhash, path) for path in paths]
+        hashes = {}
+        for n, path in enumerate(paths):
+            try:
+                hashes[path] = dhash(path) if futures is None else futures[n].result()
+            except Exception as exc:
+                logger.error('Failed to hash {0}: {1}'.format(path, repr(exc)))
+        return hashes
+
+    def filter(self, camera, photos, window, distance, now=None):
+        """Split the photos of one event into those to send and near-duplicates.
+
+        Photos that can't be hashed, and videos, are always sent. Call
+        `sent` for each kept photo that is sent so later ones are compared
+        with it.
+
+        Args:
+            camera (str): The camera's name, each has its own index.
+            photos (list): The event's captures in order.
+            window (float): Seconds sent photos are remembered for.
+            distance (int): Most bits a photo can differ by and be dropped.
+        Returns:
+            (tuple): The (kept, dropped) photos, in order.
+        """
+        now = time.time() if now is None else now
+        hashes = self._hashes([
+            photo for photo in photos if os.path.splitext(photo)[1] in HASHED_EXTENSIONS
+        ])
+        index = self.indexes.get(camera)
+        if index is None:
+            index = self.indexes[camera] = HashIndex(self.size)
+        event = HashIndex(max(len(hashes), 1))
+        unsent = self.unsent[camera] = {}
+        kept, dropped = [], []
+        for photo in photos:
+            value = hashes.get(photo)
+            if value is not None:
+                nearest = (index.nearest(value, now, window), event.nearest(value, now, window))
+                if any(n is not None and n <= distance for n in nearest):
+                    dropped.append(photo)
+                    continue
+                event.add(value, now)
+                unsent[photo] = value
+            kept.append(photo)
+        return kept, dropped
+
+    def sent(self, camera, photo, now=None):
+        """Remember a photo `filter` kept, now that it has been sent."""
+        value = self.unsent.get(camera, {}).pop(photo, None)
+        if value is not None:
+            self.indexes[camera].add(value, time.time() if now is None else now)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Logging that doesn't hold up the threads that log.
+
+Records are put on a bounded queue and formatted and written to syslog and
+stdout by a listener thread, so a debug line in the sniff callback or the
+motion analysis costs a queue put rather than a format and a socket write.
+When the queue is full records are dropped and counted rather than waited
+for. Debug and info lines from one place in the code are rate limited,
+with the number left out added to the next one let through.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import time
+from queue import SimpleQueue
+from threading import Lock
+
+logger = logging.getLogger()
+
+# Records waiting for the listener before more are dropped.
+QUEUE_SIZE = 1000
+# Debug and info records a second from one line of code, with bursts of
+# up to BURST.
+RATE = 5
+BURST = 20
+
+SYSLOG_FORMAT = logging.Formatter(
+    "%(filename)s:%(threadName)s %(message)s",
+    "%Y-%m-%d %H:%M:%S"
+)
+DEBUG_FORMAT = logging.Formatter(
+    "%(asctime)s %(levelname)-7s %(filename)s:%(lineno)-12s %(threadName)-25s %(message)s",
+    "%Y-%m-%d %H:%M:%S"
+)
+ERROR_FORMAT = logging.Formatter("ERROR: %(message)s")
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through `rate` records a second from each line of code, with
+    bursts of up to `burst`. Warnings and above always get through.
+    """
+
+    def __init__(self, rate=RATE, burst=BURST):
+        super(RateLimitFilter, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        # (path, line): [tokens, last refill, suppressed since one got through]
+        self.sites = {}
+        self.suppressed = 0
+        self.lock = Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None:
+                site = self.sites[key] = [self.burst, now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+            site[0] -= 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = '{0} [{1} similar suppressed]'.format(record.msg, suppressed)
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records when `size` are waiting.
+
+    The queue is a SimpleQueue, a put is a tenth of the cost of one on a
+    bounded Queue, and the size is checked first. Threads racing past the
+    check can take it a record or two over `size`.
+
+    Records are queued as they are and formatted by the listener, so
+    arguments should be values that won't change before it gets to them.
+    """
+
+    def __init__(self, queue, size=QUEUE_SIZE):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.size = size
+        self.dropped = 0
+        self.dropped_lock = Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() < self.size:
+            self.queue.put(record)
+        else:
+            with self.dropped_lock:
+                self.dropped += 1
+
+
+class LogPipeline(object):
+    """Queues records from the root logger for `handlers` on a listener
+    thread, dropping them when `queue_size` are waiting.
+    """
+
+    def __init__(self, handlers, queue_size=QUEUE_SIZE, rate=RATE, burst=BURST):
+        self.handlers = handlers
+        self.queue = SimpleQueue()
+        self.handler = DroppingQueueHandler(self.queue, queue_size)
+        self.limiter = RateLimitFilter(rate, burst)
+        self.handler.addFilter(self.limiter)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.started = False
+
+    def start(self, target=None):
+        """Send the records of `target`, the root logger by default, through
+        the queue. Queued records are written at exit.
+        """
+        target = logging.getLogger() if target is None else target
+        target.addHandler(self.handler)
+        self.update_level(target)
+        self.listener.start()
+        self.started = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.started:
+            self.started = False
+            self.listener.stop()
+            if self.handler.dropped:
+                for handler in self.handlers:
+                    handler.handle(logging.makeLogRecord({
+                        'msg': 'Dropped {0} log records'.format(self.handler.dropped),
+                        'levelno': logging.WARNING,
+                        'levelname': 'WARNING',
+                    }))
+
+    def update_level(self, target=None):
+        """Set `target`'s level to the lowest of the handlers', so records
+        none of them would write aren't created.
+        """
+        target = logging.getLogger() if target is None else target
+        target.setLevel(min(handler.level for handler in self.handlers))
+
+    def stats(self):
+        """Records waiting, dropped and rate limited by the log pipeline."""
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'suppressed': self.limiter.suppressed,
+        }
+
+
+def setup_logging(debug_mode, log_to_stdout):
+    """Log to syslog, at debug level with `debug_mode`, and to stdout, all
+    of it with `log_to_stdout` and only critical errors otherwise.
+
+    Returns:
+        (LogPipeline): The started pipeline. Its `handlers` are the syslog
+            then the stdout handler.
+    """
+    syslog_handler = logging.handlers.SysLogHandler(address='/dev/log')
+    syslog_handler.setFormatter(SYSLOG_FORMAT)
+    syslog_handler.setLevel(logging.DEBUG if debug_mode else logging.INFO)
+
+    stdout_handler = logging.StreamHandler()
+    if log_to_stdout:
+        stdout_handler.setLevel(logging.DEBUG)
+        stdout_handler.setFormatter(DEBUG_FORMAT)
+    else:
+        stdout_handler.setLevel(logging.CRITICAL)
+        stdout_handler.setFormatter(ERROR_FORMAT)
+
+    pipeline = LogPipeline([syslog_handler, stdout_handler])
+    pipeline.start()
+    return pipeline
+
+
+def set_debug(pipeline, debug_mode):
+    """Turn debug logging to syslog on or off."""
+    pipeline.handlers[0].setLevel(logging.DEBUG if debug_mode else logging.INFO)
+    pipeline.update_level()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Motion vector analysis, kept apart from picamera so it can run anywhere."""
+
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger()
+
+# The per macroblock motion data written by the H.264 encoder, as in
+# picamera.array.motion_dtype.
+MOTION_DTYPE = np.dtype([
+    ('x', 'i1'),
+    ('y', 'i1'),
+    ('sad', 'u2'),
+])
+
+
+def motion_grid(size):
+    """Return the (rows, columns) of the motion data for a stream of `size`.
+
+    The encoder gives one element per 16x16 macroblock plus an extra column.
+    """
+    width, height = size
+    return (height + 15) // 16, (width + 15) // 16 + 1
+
+
+def scale_thresholds(setting, size, analysis_size):
+    """Scale a (magnitude, vectors) threshold for a stream of `size` to one
+    of `analysis_size`.
+
+    Vectors are measured in pixels of the analysed stream, so `magnitude`
+    scales with the width. A moving object covers fewer macroblocks, so
+    `vectors` scales with their number, leaving at least one.
+    """
+    magnitude, vectors = setting
+    rows, cols = motion_grid(size)
+    analysis_rows, analysis_cols = motion_grid(analysis_size)
+    blocks = float(analysis_rows * (analysis_cols - 1)) / (rows * (cols - 1))
+    return (
+        max(1, int(round(magnitude * float(analysis_size[0]) / size[0]))),
+        max(1, int(round(vectors * blocks)))
+    )
+
+
+def count_motion_vectors(a, magnitude):
+    """Count the motion vectors longer than `magnitude`.
+
+    Args:
+        a (numpy.ndarray): Motion data with `x` and `y` fields, one
+            element per macroblock.
+        magnitude (int): The length a vector must exceed to count.
+    Returns:
+        (int): The number of vectors.
+    """
+    x = a['x'].astype(np.int32)
+    y = a['y'].astype(np.int32)
+    return int(np.count_nonzero(x * x + y * y > magnitude * magnitude))
+
+
+class MotionAnalyser(object):
+    """Decides whether a frame of motion vectors shows motion.
+
+    Frames in the first `settle_time` seconds after `start` are ignored
+    while the camera's exposure settles. `now` is the time of the frame,
+    the current time if None, so recorded streams can be replayed faster
+    than real time.
+
+    With a `gate`, such as PIRSensor.active, frames only count while
+    `gate(now)` is True and aren't analysed otherwise.
+    """
+
+    def __init__(self, magnitude=60, vectors=10, settle_time=1, gate=None):
+        self.magnitude = magnitude
+        self.vectors = vectors
+        self.settle_time = settle_time
+        self.gate = gate
+        self.started = 0
+
+    def start(self, now=None):
+        self.started = time.time() if now is None else now
+
+    def analyse(self, a, now=None):
+        """Return True if more than `vectors` vectors are longer than `magnitude`."""
+        now = time.time() if now is None else now
+        if now - self.started < self.settle_time:
+            logger.debug('Ignoring initial motion due to settle time')
+            return False
+        if self.gate is not None and not self.gate(now):
+            return False
+        vector_count = count_motion_vectors(a, self.magnitude)
+        if vector_count > self.vectors:
+            logger.info(
+                'Motion detected. Vector count: %s. Threshold: %s',
+                vector_count,
+                self.vectors
+            )
+            return True
+        return False
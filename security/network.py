@@ -4,61 +4,58 @@ import logging
 import os
 import sys
 import time
-from configparser import SafeConfigParser
+from threading import Lock
 
 import yaml
-from netaddr import IPNetwork
-from scapy.all import ARP, Ether, srp
-from telegram import Bot as TelegramBot
 
-from netifaces import ifaddresses
-
-from .exit_clean import exit_error
-from .security.state import State
+from .settings import RESTART_REQUIRED, Settings, SettingsError
+from .state import State
+from .store import write_atomic
+from .supervisor import heartbeat
+from .uplink import UplinkEstimator
+from .util import exit_error
 
 logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
 
 
-
 logger = logging.getLogger()
 
 
 class Network(object):
     """Reads and processed configuration, checks system settings."""
-    default_config = {
-        'camera_save_path': '/var/tmp',
-        'network_interface': 'mon0',
-        'packet_timeout': '700',
-        'debug_mode': 'False',
-        'pir_pin': '14',
-        'camera_vflip': 'False',
-        'camera_hflip': 'False',
-        'photo_size': '1024x768',
-        'gif_size': '1024x768',
-        'motion_size': '1024x768',
-        'motion_detection_setting': '60x10',
-        'camera_mode': 'gif',
-        'camera_capture_length': '3'
-    }
-
     def __init__(self, config_file, data_file):
         self.config_file = config_file
         self.data_file = data_file
         self.saved_data = self._read_data_file()
-        self._parse_config_file()
+        self.settings = Settings.from_file(config_file)
         self._check_system()
         self.state = State(self)
-
-        try:
-            self.bot = TelegramBot(token=self.telegram_bot_token)
-        except Exception as exc:
-            raise Exception('Failed to connect to Telegram with error: {0}'.format(repr(exc)))
+        self.uplink = UplinkEstimator()
+        self._bot = None
+        self._bot_lock = Lock()
+        self._data_lock = Lock()
 
         logger.debug('Initialised: {0}'.format(vars(self)))
 
+    @property
+    def bot(self):
+        """The Telegram bot, created on first use.
+
+        Importing telegram is slow on a Pi so it's left until the first
+        message rather than holding up the camera at startup.
+        """
+        with self._bot_lock:
+            if self._bot is None:
+                from telegram import Bot as TelegramBot
+                try:
+                    self._bot = TelegramBot(token=self.settings.telegram_bot_token)
+                except Exception as exc:
+                    raise Exception('Failed to connect to Telegram with error: {0}'.format(repr(exc)))
+            return self._bot
+
     def _read_data_file(self):
-        """Reads a data file from disk."""
-        result = None
+        """Reads a data file from disk, an empty dict if it can't be read."""
+        result = {}
         try:
             with open(self.data_file, 'r') as stream:
                 result = yaml.load(stream) or {}
@@ -71,8 +68,11 @@ class Network(object):
     def arp_ping_macs(self, repeat=4):
         """Performs an ARP scan of a destination MAC address
 
-        Determines if the MAC addresses are present on the network.
+        Determines if the MAC addresses are present on the network. Each
+        ping can take a second and there are `repeat` rounds of them, so
+        it heartbeats between pings for the supervised thread calling it.
         """
+        from scapy.all import ARP, Ether, srp
 
         def _arp_ping(mac_address):
             result = False
@@ -85,8 +85,10 @@ class Network(object):
                         result.append(str(reply[1].psrc))
                         result = ', '.join(result)
             return result
+        mac_addresses = self.settings.mac_addresses
         while repeat > 0:
-            for mac_address in self.mac_addresses:
+            for mac_address in mac_addresses:
+                heartbeat()
                 result = _arp_ping(mac_address)
                 if result:
                     logger.debug(
@@ -105,12 +107,16 @@ class Network(object):
             repeat -= 1
 
     def save_telegram_chat_id(self, chat_id):
-        """Saves the telegram chat ID to the data file."""
+        """Saves the telegram chat ID to the data file.
+
+        The file is replaced atomically, so a crash while writing it can't
+        lose the chat ID already saved.
+        """
         try:
-            # Use a lock here?
-            self.saved_data['telegram_chat_id'] = chat_id
-            with open(self.data_file, 'w') as f:
-                yaml.dump({'telegram_chat_id': chat_id}, f, default_flow_style=False)
+            with self._data_lock:
+                self.saved_data['telegram_chat_id'] = chat_id
+                data = yaml.dump(dict(self.saved_data), default_flow_style=False)
+                write_atomic(self.data_file, data.encode('utf-8'))
         except Exception as exc:
             logger.error(
                 'Failed to write state file %s: %s',
@@ -120,28 +126,29 @@ class Network(object):
         else:
             logger.debug('State file written: %s', self.data_file)
 
-    def _parse_config_file(self):
-        def _str2bool(v):
-            return v.lower() in ("yes", "true", "t", "1")
-
-        cfg = SafeConfigParser(defaults=self.default_config)
-        cfg.read(self.config_file)
+    def reload_settings(self):
+        """Re-read the config file and swap in the new settings.
 
-        for k, v in cfg.items('main'):
-            setattr(self, k, v)
+        The old settings are kept if the file is invalid.
 
-        self.debug_mode = _str2bool(self.debug_mode)
-        self.camera_vflip = _str2bool(self.camera_vflip)
-        self.camera_hflip = _str2bool(self.camera_hflip)
-        self.pir_pin = int(self.pir_pin)
-        self.photo_size = tuple([int(x) for x in self.photo_size.split('x')])
-        self.gif_size = tuple([int(x) for x in self.gif_size.split('x')])
-        self.motion_size = tuple([int(x) for x in self.motion_size.split('x')])
-        self.motion_detection_setting = tuple([int(x) for x in self.motion_detection_setting.split('x')])
-        self.camera_capture_length = int(self.camera_capture_length)
-        self.camera_mode = self.camera_mode.lower()
-        self.packet_timeout = int(self.packet_timeout)
-        self.mac_addresses = self.mac_addresses.lower().split(',')
+        Returns:
+            (set): The names of the settings that changed, None on error.
+        """
+        try:
+            settings = Settings.from_file(self.config_file)
+        except SettingsError as exc:
+            logger.error('Not reloading config file %s: %s', self.config_file, exc)
+            return None
+        changed = self.settings.changed(settings)
+        restart_required = changed & RESTART_REQUIRED
+        if restart_required:
+            logger.warning(
+                'Restart required for changes to: %s',
+                ', '.join(sorted(restart_required))
+            )
+        self.settings = settings
+        logger.info('Reloaded config file %s, changed: %s', self.config_file, ', '.join(sorted(changed)) or 'nothing')
+        return changed
 
     def _check_system(self):
         if not os.geteuid() == 0:
@@ -152,7 +159,7 @@ class Network(object):
                 'Monitor mode is not enabled for interface {0} '
                 'or interface does not exist'
             )
-            raise Exception(message.format(self.network_interface))
+            raise Exception(message.format(self.settings.network_interface))
 
         self._set_interface_mac_addr()
         self._set_network_address()
@@ -163,8 +170,8 @@ class Network(object):
         """
         result = False
         try:
-            type_file = open('/sys/class/net/{0}/type'.format(self.network_interface), 'r')
-            operdata_file = open('/sys/class/net/{0}/operstate'.format(self.network_interface), 'r')
+            type_file = open('/sys/class/net/{0}/type'.format(self.settings.network_interface), 'r')
+            operdata_file = open('/sys/class/net/{0}/operstate'.format(self.settings.network_interface), 'r')
         except:
             pass
         else:
@@ -177,20 +184,23 @@ class Network(object):
         Gets the MAC address of an interface
         """
         try:
-            with open('/sys/class/net/{0}/address'.format(self.network_interface), 'r') as f:
+            with open('/sys/class/net/{0}/address'.format(self.settings.network_interface), 'r') as f:
                 self.my_mac_address = f.read().strip()
         except FileNotFoundError:
-            raise Exception('Interface {0} does not exist'.format(self.network_interface))
+            raise Exception('Interface {0} does not exist'.format(self.settings.network_interface))
         except Exception:
-            raise Exception('Unable to get MAC address for interface {0}'.format(self.network_interface))
+            raise Exception('Unable to get MAC address for interface {0}'.format(self.settings.network_interface))
 
     def _set_network_address(self):
         """
         Finds the corresponding normal interface for a monitor interface and
         then calculates the subnet address of this interface
         """
+        from netaddr import IPNetwork
+        from netifaces import ifaddresses
+
         for interface in os.listdir('/sys/class/net'):
-            if interface in ['lo', self.network_interface]:
+            if interface in ['lo', self.settings.network_interface]:
                 continue
             try:
                 with open('/sys/class/net/{0}/address'.format(interface), 'r') as f:
@@ -215,7 +225,7 @@ class Network(object):
                     self.network_address = str(network_address)
         if not hasattr(self, 'network_address'):
             message = 'Unable to get network address for interface {0}'.format(
-                self.network_interface
+                self.settings.network_interface
             )
             raise Exception(message)
 
@@ -227,6 +237,7 @@ class Network(object):
                 'Send a message to the Telegram bot'
             )
             return False
+        started = time.perf_counter()
         try:
             self.bot.sendMessage(
                 chat_id=self.saved_data['telegram_chat_id'],
@@ -241,10 +252,11 @@ class Network(object):
                 e
             )
         else:
+            self.uplink.record(len(message.encode('utf-8')), time.perf_counter() - started)
             logger.info('Telegram message Sent: "%s"', message)
             return True
 
-    def telegram_send_file(self, file_path):
+    def telegram_send_file(self, file_path, caption=None):
         if 'telegram_chat_id' not in self.saved_data:
             logger.error(
                 'Telegram failed to send file %s because '
@@ -254,28 +266,34 @@ class Network(object):
             )
             return False
         filename, file_extension = os.path.splitext(file_path)
+        started = time.perf_counter()
         try:
             if file_extension == '.mp4':
                 self.bot.sendVideo(
                     chat_id=self.saved_data['telegram_chat_id'],
                     video=open(file_path, 'rb'),
+                    caption=caption,
                     timeout=30
                 )
-            elif file_extension == '.gif':
+            elif file_extension in ('.gif', '.folded'):
                 self.bot.sendDocument(
                     chat_id=self.saved_data['telegram_chat_id'],
                     document=open(file_path, 'rb'),
+                    caption=caption,
                     timeout=30
                 )
-            elif file_extension == '.jpeg':
+            elif file_extension in ('.jpg', '.jpeg'):
                 self.bot.sendPhoto(
                     chat_id=self.saved_data['telegram_chat_id'],
                     photo=open(file_path, 'rb'),
+                    caption=caption,
                     timeout=10
                 )
             else:
                 logger.error('Uknown file not sent: %s', file_path)
+                return False
         except Exception as exc:
+            self.uplink.record(os.path.getsize(file_path), time.perf_counter() - started, delivered=False)
             logger.error(
                 'Telegram failed to send file %s, exc: %s',
                 file_path,
@@ -283,5 +301,6 @@ class Network(object):
             )
             return False
         else:
+            self.uplink.record(os.path.getsize(file_path), time.perf_counter() - started)
             logger.info('Telegram file sent: %s', file_path)
             return True
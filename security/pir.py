@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""PIR motion sensors on a GPIO pin, read with edge interrupts.
+
+A PIR output goes high while it sees something warm moving. The sensor is
+active while the output is high and for `hold` seconds after it falls, to
+cover the gap between the PIR and the camera seeing the same movement.
+Cameras use it to gate motion vector analysis, so an alarm needs both.
+"""
+
+import logging
+import time
+from threading import Condition, Lock
+
+logger = logging.getLogger()
+
+# Milliseconds, edges closer together than this are contact bounce.
+BOUNCE_TIME = 50
+
+# Sensors by pin, a PIR can be shared by several cameras.
+_sensors = {}
+_sensors_lock = Lock()
+
+
+class PIRSensor(object):
+    """A PIR on `pin`, numbered as BCM.
+
+    Args:
+        pin (int): The GPIO pin.
+        hold (float): Seconds the sensor stays active after the output falls.
+        gpio (module): RPi.GPIO or something that works like it, imported
+            if None.
+        recorder (PIRRecorder): Records every edge if not None.
+    """
+
+    def __init__(self, pin, hold=5.0, gpio=None, recorder=None):
+        if gpio is None:
+            import RPi.GPIO as gpio
+        self.pin = pin
+        self.hold = hold
+        self.gpio = gpio
+        self.recorder = recorder
+        self.edges = 0
+        self.condition = Condition()
+        gpio.setmode(gpio.BCM)
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+        self.level = bool(gpio.input(pin))
+        # When the output last changed, 0 if it hasn't.
+        self.changed = 0
+        gpio.add_event_detect(pin, gpio.BOTH, callback=self._interrupt, bouncetime=BOUNCE_TIME)
+
+    @classmethod
+    def from_settings(cls, settings, gpio=None):
+        """Return the sensor on `pir_pin`, shared between cameras, or None
+        if `pir_mode` isn't set.
+        """
+        if not settings.pir_mode:
+            return None
+        with _sensors_lock:
+            sensor = _sensors.get(settings.pir_pin)
+            if sensor is None:
+                from .recorder import PIRRecorder
+
+                sensor = cls(
+                    settings.pir_pin,
+                    hold=settings.pir_hold,
+                    gpio=gpio,
+                    recorder=PIRRecorder.from_settings(settings)
+                )
+                _sensors[settings.pir_pin] = sensor
+        return sensor
+
+    def _interrupt(self, pin):
+        # Runs on the GPIO library's thread. The level is read again as the
+        # edge may have bounced back by now.
+        self.edge(bool(self.gpio.input(pin)))
+
+    def edge(self, level, now=None):
+        """Record the output changing to `level`, from the interrupt or a trace."""
+        now = time.time() if now is None else now
+        with self.condition:
+            if level == self.level:
+                return
+            self.level = level
+            self.changed = now
+            self.edges += 1
+            self.condition.notify_all()
+        if self.recorder is not None:
+            self.recorder.record((now, level))
+        logger.debug('PIR on pin %s went %s', self.pin, 'high' if level else 'low')
+
+    def active(self, now=None):
+        """Return True if the output is high or fell less than `hold` seconds ago."""
+        now = time.time() if now is None else now
+        return self.level or now - self.changed < self.hold
+
+    def wait(self, timeout=None):
+        """Wait until the sensor is active.
+
+        Returns:
+            (bool): False if it timed out.
+        """
+        with self.condition:
+            return self.condition.wait_for(self.active, timeout)
+
+    def close(self):
+        self.gpio.remove_event_detect(self.pin)
+        with _sensors_lock:
+            if _sensors.get(self.pin) is self:
+                del _sensors[self.pin]
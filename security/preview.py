@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import socket
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Condition, Thread
+
+logger = logging.getLogger()
+
+BOUNDARY = 'FRAME'
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+
+class FrameBuffer(object):
+    """Holds the most recent MJPEG frame from the camera.
+
+    Used as the `output` of a picamera recording. Every client reads from the
+    same buffer so the camera only encodes once however many are watching.
+    Only the latest frame is kept, a client that falls behind skips frames
+    rather than queueing them.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.frame = None
+        self.sequence = 0
+        self.closed = False
+        self.partial = bytearray()
+
+    def write(self, buf):
+        """Receive data from the encoder.
+
+        picamera normally writes one complete JPEG per call for MJPEG
+        recordings but frames split across writes are reassembled.
+        """
+        if buf.startswith(JPEG_START):
+            self.partial = bytearray()
+        self.partial.extend(buf)
+        if self.partial.endswith(JPEG_END):
+            self.publish(bytes(self.partial))
+            self.partial = bytearray()
+        return len(buf)
+
+    def flush(self):
+        pass
+
+    def publish(self, frame):
+        """Make `frame` the current frame and wake up waiting clients."""
+        with self.condition:
+            self.frame = frame
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def wait(self, after, timeout=None):
+        """Wait for a frame newer than `after`.
+
+        Args:
+            after (int): The sequence number of the last frame seen.
+            timeout (float): Seconds to wait.
+        Returns:
+            (tuple): (sequence, frame), frame is None on timeout or close.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.sequence > after or self.closed,
+                timeout
+            )
+            if self.closed or self.sequence <= after:
+                return after, None
+            return self.sequence, self.frame
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """Serves the MJPEG stream and a single snapshot."""
+
+    def log_message(self, format, *args):
+        logger.debug('Preview %s: %s', self.client_address[0], format % args)
+
+    def do_GET(self):
+        if self.path in ('/', '/stream.mjpg'):
+            self.send_stream()
+        elif self.path == '/snapshot.jpg':
+            self.send_snapshot()
+        else:
+            self.send_error(404)
+
+    def send_snapshot(self):
+        sequence, frame = self.server.frames.wait(0, self.server.frame_timeout)
+        if frame is None:
+            self.send_error(503, 'No frames available')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', len(frame))
+        self.end_headers()
+        self.wfile.write(frame)
+
+    def send_stream(self):
+        if not self.server.add_client():
+            self.send_error(503, 'Too many viewers')
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Age', 0)
+            self.send_header('Cache-Control', 'no-cache, private')
+            self.send_header('Pragma', 'no-cache')
+            self.send_header(
+                'Content-Type',
+                'multipart/x-mixed-replace; boundary={0}'.format(BOUNDARY)
+            )
+            self.end_headers()
+            # A client that can't keep up with `send_timeout` is dropped.
+            self.connection.settimeout(self.server.send_timeout)
+            sequence = 0
+            while not self.server.stopped:
+                sequence, frame = self.server.frames.wait(sequence, self.server.frame_timeout)
+                if frame is None:
+                    # A closed buffer won't have any more frames.
+                    if self.server.frames.closed:
+                        break
+                    continue
+                self.wfile.write(
+                    '--{0}\r\nContent-Type: image/jpeg\r\nContent-Length: {1}\r\n\r\n'.format(
+                        BOUNDARY,
+                        len(frame)
+                    ).encode('ascii')
+                )
+                self.wfile.write(frame)
+                self.wfile.write(b'\r\n')
+        except (socket.timeout, ConnectionError) as exc:
+            logger.debug('Preview client %s disconnected: %s', self.client_address[0], exc)
+        finally:
+            self.server.remove_client()
+
+
+class PreviewServer(ThreadingMixIn, HTTPServer):
+    """A local HTTP server for the live MJPEG preview.
+
+    Args:
+        frames (FrameBuffer): Source of frames.
+        address (tuple): (host, port) to listen on.
+        max_clients (int): Maximum number of concurrent stream viewers.
+        send_timeout (float): Seconds a client may block a write before it
+            is disconnected.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, frames, address=('', 8000), max_clients=4, send_timeout=5, frame_timeout=1):
+        self.frames = frames
+        self.max_clients = max_clients
+        self.send_timeout = send_timeout
+        self.frame_timeout = frame_timeout
+        self.clients = 0
+        self.clients_condition = Condition()
+        self.stopped = False
+        self.thread = None
+        HTTPServer.__init__(self, address, StreamHandler)
+
+    def add_client(self):
+        with self.clients_condition:
+            if self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            logger.info('Preview client connected, %s viewing', self.clients)
+            return True
+
+    def remove_client(self):
+        with self.clients_condition:
+            self.clients -= 1
+            logger.info('Preview client disconnected, %s viewing', self.clients)
+
+    def start(self):
+        """Serve on a background thread."""
+        self.thread = Thread(name='preview_server', target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info('Preview available on port %s', self.server_address[1])
+
+    def stop(self):
+        self.stopped = True
+        self.frames.close()
+        self.shutdown()
+        self.server_close()
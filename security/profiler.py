@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Sampling profiler to see which thread is using the CPU on a running box.
+
+The stacks of every thread are sampled with `sys._current_frames()` from a
+thread of the caller's, nothing is traced between samples. Threads that
+are waiting show up too, the CPU time of each thread is read from
+/proc so busy threads can be told from idle ones.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+logger = logging.getLogger()
+
+DEFAULT_INTERVAL = 0.01
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 300
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while one is running."""
+
+
+def thread_cpu_times():
+    """Return {native thread id: CPU seconds} from /proc, {} if unavailable."""
+    times = {}
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    try:
+        tasks = os.listdir('/proc/self/task')
+    except OSError:
+        return times
+    for task in tasks:
+        try:
+            with open('/proc/self/task/{0}/stat'.format(task)) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The thread name is in brackets and may contain spaces.
+        fields = stat[stat.rindex(')') + 2:].split()
+        times[int(task)] = (int(fields[11]) + int(fields[12])) / float(ticks)
+    return times
+
+
+class Profile(object):
+    """The stacks sampled over one run.
+
+    `samples` counts (thread name, stack) pairs, stacks are the code
+    objects from the outermost frame to the innermost.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.seconds = 0.0
+        self.cpu_seconds = {}
+        self.profiler_cpu_seconds = 0.0
+        self.labels = {}
+        self.names = {}
+
+    def sample(self):
+        """Record the current stack of every other thread.
+
+        Stacks are kept as code objects and only formatted for reports,
+        walking the frames is most of the cost of a sample.
+        """
+        names = self.names
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if ident not in names:
+                self.names = names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            self.samples[(names.get(ident, str(ident)), tuple(reversed(stack)))] += 1
+        self.sample_count += 1
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = '{0}:{1}'.format(os.path.basename(code.co_filename), name)
+            self.labels[code] = label
+        return label
+
+    def stacks(self):
+        """Return a Counter of (thread name, labels) pairs."""
+        stacks = Counter()
+        for (name, codes), count in self.samples.items():
+            stacks[(name, tuple(self._label(code) for code in codes))] += count
+        return stacks
+
+    def run(self, seconds):
+        names = dict((thread.native_id, thread.name) for thread in threading.enumerate())
+        cpu_before = thread_cpu_times()
+        started = time.perf_counter()
+        started_cpu = time.thread_time()
+        deadline = started + seconds
+        while True:
+            self.sample()
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(self.interval, deadline - now))
+        self.seconds = time.perf_counter() - started
+        self.profiler_cpu_seconds = time.thread_time() - started_cpu
+        for native_id, cpu in thread_cpu_times().items():
+            if native_id in names and native_id in cpu_before:
+                self.cpu_seconds[names[native_id]] = cpu - cpu_before[native_id]
+
+    def threads(self):
+        """Return {thread name: {'samples', 'cpu_percent', 'top'}}, busiest first.
+
+        `top` is the innermost frame of the most common stacks with the
+        share of the thread's samples they account for.
+        """
+        stacks = defaultdict(Counter)
+        for (name, stack), count in self.stacks().items():
+            stacks[name][stack[-1] if stack else '?'] += count
+        result = {}
+        for name, leaves in stacks.items():
+            total = sum(leaves.values())
+            cpu = self.cpu_seconds.get(name)
+            result[name] = {
+                'samples': total,
+                'cpu_percent': None if cpu is None else round(100 * cpu / self.seconds, 1),
+                'top': [
+                    [leaf, round(100.0 * count / total, 1)]
+                    for leaf, count in leaves.most_common(3)
+                ],
+            }
+        return dict(sorted(
+            result.items(),
+            key=lambda item: (-(item[1]['cpu_percent'] or 0), -item[1]['samples'])
+        ))
+
+    def collapsed(self):
+        """The samples in the collapsed stack format read by flamegraph.pl
+        and speedscope, one `thread;outer;...;inner count` line per stack.
+        """
+        lines = [
+            '{0} {1}'.format(';'.join((name,) + stack), count)
+            for (name, stack), count in sorted(self.stacks().items())
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """A short plain text report of the busiest threads."""
+        lines = ['{0} samples over {1:.1f}s, profiler used {2:.1f}% CPU'.format(
+            self.sample_count,
+            self.seconds,
+            100 * self.profiler_cpu_seconds / self.seconds
+        )]
+        for name, thread in self.threads().items():
+            cpu = thread['cpu_percent']
+            lines.append('{0}: {1}'.format(name, 'CPU unknown' if cpu is None else '{0}% CPU'.format(cpu)))
+            for leaf, share in thread['top']:
+                lines.append('  {0}% {1}'.format(share, leaf))
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {
+            'seconds': round(self.seconds, 3),
+            'interval': self.interval,
+            'samples': self.sample_count,
+            'profiler_cpu_percent': round(100 * self.profiler_cpu_seconds / self.seconds, 2),
+            'threads': self.threads(),
+            'collapsed': self.collapsed(),
+        }
+
+
+def profile(seconds=DEFAULT_SECONDS, interval=DEFAULT_INTERVAL):
+    """Sample every thread for `seconds`, blocking the calling thread.
+
+    Raises:
+        ProfilerBusy: If another profile is running.
+        ValueError: If `seconds` or `interval` is out of range.
+    Returns:
+        (Profile): The samples.
+    """
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError('seconds must be between 0 and {0}'.format(MAX_SECONDS))
+    if not 0 < interval <= seconds:
+        raise ValueError('interval must be positive and at most seconds')
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy('A profile is already running')
+    try:
+        logger.info('Profiling for %ss every %ss', seconds, interval)
+        result = Profile(interval)
+        result.run(seconds)
+        return result
+    finally:
+        _running.release()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Day and night camera profiles, picked from the brightness of the scene."""
+
+import logging
+from dataclasses import dataclass
+from typing import Tuple
+
+logger = logging.getLogger()
+
+# Size of the YUV frame the brightness is measured on. Multiples of 32x16
+# so the Y plane has no padding.
+LUMINANCE_SIZE = (64, 48)
+
+# Brightness is reported as the mean pixel value at this exposure, in
+# microseconds at unity gain, so readings don't depend on the profile.
+REFERENCE_EXPOSURE = 10000
+
+# Seconds for automatic exposure and white balance to settle before they
+# are locked for a profile.
+METERING_TIME = 2
+
+# Readings in a row past a threshold before switching, so headlights at
+# night don't switch to the day profile.
+CONFIRM_READINGS = 2
+
+# Exposure is metered again, without changing profile, when the brightness
+# has changed by this factor since it was last metered. A frame that is
+# saturated at the locked exposure underestimates the brightness, metering
+# again is what lets the night profile see the dawn.
+REMETER_RATIO = 2.0
+
+
+@dataclass(frozen=True)
+class CameraProfile(object):
+    """Exposure and motion detection settings for one lighting condition.
+
+    `framerate` 0 keeps the camera's own framerate, `iso` 0 is automatic
+    and `shutter_speed` 0 is metered in `exposure_mode` then locked.
+    """
+    name: str
+    framerate: int = 0
+    iso: int = 0
+    shutter_speed: int = 0
+    exposure_mode: str = 'auto'
+    motion_detection_setting: Tuple[int, int] = (60, 10)
+
+    @classmethod
+    def day(cls, settings):
+        return cls('day', motion_detection_setting=settings.motion_detection_setting)
+
+    @classmethod
+    def night(cls, settings):
+        return cls(
+            'night',
+            framerate=settings.night_framerate,
+            iso=settings.night_iso,
+            shutter_speed=settings.night_shutter_speed,
+            exposure_mode='night',
+            motion_detection_setting=settings.night_motion_detection_setting
+        )
+
+
+def luminance(y_plane, exposure_speed=REFERENCE_EXPOSURE, gain=1):
+    """Return the brightness of the scene from the Y plane of a YUV frame.
+
+    The mean pixel value is scaled to what it would be at REFERENCE_EXPOSURE
+    and unity gain, so it can go above 255 in daylight.
+
+    Args:
+        y_plane (bytes): At least LUMINANCE_SIZE pixels of 8 bit luma.
+        exposure_speed (int): The frame's exposure in microseconds.
+        gain (float): The frame's analog gain times its digital gain.
+    """
+    import numpy as np
+
+    width, height = LUMINANCE_SIZE
+    mean = float(np.frombuffer(y_plane, dtype=np.uint8, count=width * height).mean())
+    if exposure_speed <= 0 or gain <= 0:
+        return mean
+    return mean * REFERENCE_EXPOSURE / (exposure_speed * float(gain))
+
+
+class ProfileSwitcher(object):
+    """Chooses the day or night profile from brightness readings.
+
+    Switches to night below `night_luminance` and back to day above
+    `day_luminance`, after CONFIRM_READINGS readings in a row. Starts in
+    the day profile.
+    """
+
+    def __init__(self, settings):
+        self.apply_settings(settings)
+        self.current = self.day
+        self.metered_at = None
+        self.readings = 0
+
+    def apply_settings(self, settings):
+        self.day = CameraProfile.day(settings)
+        self.night = CameraProfile.night(settings)
+        self.night_luminance = settings.night_luminance
+        self.day_luminance = settings.day_luminance
+        if getattr(self, 'current', None) is not None:
+            self.current = self.night if self.current.name == 'night' else self.day
+
+    def update(self, value):
+        """Take a brightness reading.
+
+        Returns:
+            (CameraProfile): The profile to apply if it changed or exposure
+                should be metered again, otherwise None.
+        """
+        if self.current.name == 'day':
+            other, past = self.night, value < self.night_luminance
+        else:
+            other, past = self.day, value > self.day_luminance
+        self.readings = self.readings + 1 if past else 0
+        if self.readings >= CONFIRM_READINGS:
+            logger.info('Brightness %.0f, switching to the %s profile', value, other.name)
+            self.current = other
+            self.readings = 0
+            self.metered_at = value
+            return other
+        if self.metered_at is None or (not self.readings and self._drifted(value)):
+            logger.debug('Brightness %.0f, metering the %s profile again', value, self.current.name)
+            self.metered_at = value
+            return self.current
+        return None
+
+    def _drifted(self, value):
+        # Readings of a black frame are 0.
+        ratio = max(value, 0.01) / max(self.metered_at, 0.01)
+        return not 1 / REMETER_RATIO <= ratio <= REMETER_RATIO
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""Recording of motion vectors and packets for tuning and replaying offline.
+
+Motion traces start with a HEADER, then hold one fixed size record per
+frame: the frame time as a little-endian double followed by the motion
+vectors. The frame count follows from the file size, a record cut short
+by a crash is ignored. Uncompressed traces can be memory-mapped as they
+are. In compressed traces the records are in zlib chunks, each preceded by
+CHUNK_HEADER giving its frame count and compressed length.
+
+Packets are written to pcap files which scapy, tcpdump and Wireshark read.
+PIR traces are text, a line of `<time> <level>` per edge of the output.
+"""
+
+import abc
+import atexit
+import bisect
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from queue import Full, Queue
+from threading import Thread
+
+logger = logging.getLogger()
+
+MAGIC = b'RPITRACE'
+VERSION = 1
+# Magic, version, macroblock rows, macroblock columns, flags.
+HEADER = struct.Struct('<8sHHHH')
+CHUNK_HEADER = struct.Struct('<II')
+COMPRESSED = 0x1
+
+# Frames per compressed chunk, about 0.7 MB of vectors at 1280x720.
+CHUNK_FRAMES = 50
+MAX_PENDING = 100
+# Seconds to wait at exit for what is queued to be written.
+CLOSE_TIMEOUT = 5
+
+
+def trace_path(directory, prefix, suffix):
+    """Return `<directory>/<prefix>-<timestamp><suffix>`."""
+    timestamp = datetime.now().strftime('%Y-%m-%d-%H%M%S')
+    return os.path.join(directory, '{0}-{1}{2}'.format(prefix, timestamp, suffix))
+
+
+def record_dtype(rows, cols):
+    """The numpy dtype of one frame record."""
+    import numpy as np
+
+    from .motion import MOTION_DTYPE
+
+    return np.dtype([
+        ('time', '<f8'),
+        ('vectors', MOTION_DTYPE.newbyteorder('<'), (rows, cols)),
+    ])
+
+
+class TraceWriter(abc.ABC):
+    """Writes records to a file on a background thread.
+
+    `record` only puts the record on a queue so the live path never waits
+    on the disk. When `max_pending` records are waiting, new ones are
+    dropped and counted in `dropped`. The file is flushed whenever the
+    queue runs empty, and closed at exit if `close` hasn't been called.
+    """
+
+    def __init__(self, path, max_pending=MAX_PENDING):
+        self.path = path
+        self.queue = Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self.closed = False
+        self.thread = Thread(
+            name='trace_writer_{0}'.format(os.path.basename(path)),
+            target=self._run,
+            daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close, CLOSE_TIMEOUT)
+
+    def record(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            self.dropped += 1
+
+    def close(self, timeout=None):
+        """Write what is queued and close the file."""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        logger.info('Recording to %s', self.path)
+        self._open()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                try:
+                    self._write(item)
+                    self.written += 1
+                except Exception as exc:
+                    logger.error('Failed to write to {0}: {1}'.format(self.path, repr(exc)))
+                if self.queue.empty():
+                    self._flush()
+        finally:
+            self._close()
+            if self.dropped:
+                logger.warning('Dropped %s records for %s, the disk is too slow', self.dropped, self.path)
+
+    @abc.abstractmethod
+    def _open(self):
+        """Open the file, on the writer thread."""
+
+    @abc.abstractmethod
+    def _write(self, item):
+        """Write one record."""
+
+    @abc.abstractmethod
+    def _flush(self):
+        """Flush what has been written to the file."""
+
+    @abc.abstractmethod
+    def _close(self):
+        """Write anything held back and close the file."""
+
+
+class MotionRecorder(TraceWriter):
+    """Records the motion vectors of every frame the detector analyses.
+
+    The header is written with the first frame, as that's when the number
+    of macroblocks is known. Frames of a different size are dropped. With
+    `compress` up to `chunk_frames` frames are held in memory, they are
+    lost if the daemon dies.
+    """
+
+    def __init__(self, path, compress=False, chunk_frames=CHUNK_FRAMES, max_pending=MAX_PENDING):
+        self.compress = compress
+        self.chunk_frames = chunk_frames
+        self.file = None
+        self.shape = None
+        self.dtype = None
+        self.chunk = []
+        super(MotionRecorder, self).__init__(path, max_pending)
+
+    @classmethod
+    def from_settings(cls, settings, name):
+        """Return a recorder for camera `name`, None if `trace_directory` isn't set."""
+        if not settings.trace_directory:
+            return None
+        return cls(
+            trace_path(settings.trace_directory, name, '.motion'),
+            compress=settings.trace_compress
+        )
+
+    def record(self, a, now=None):
+        """Queue a copy of `a`, the encoder reuses its buffer."""
+        super(MotionRecorder, self).record((time.time() if now is None else now, a.copy()))
+
+    def _open(self):
+        self.file = open(self.path, 'wb')
+
+    def _write(self, item):
+        import numpy as np
+
+        now, a = item
+        if self.shape is None:
+            self.shape = a.shape
+            self.dtype = record_dtype(*a.shape)
+            self.file.write(HEADER.pack(MAGIC, VERSION, a.shape[0], a.shape[1], COMPRESSED if self.compress else 0))
+        if a.shape != self.shape:
+            raise ValueError('frame is {0}, the trace is {1}'.format(a.shape, self.shape))
+        record = np.zeros((), dtype=self.dtype)
+        record['time'] = now
+        record['vectors'] = a
+        if not self.compress:
+            self.file.write(record.tobytes())
+            return
+        self.chunk.append(record.tobytes())
+        if len(self.chunk) >= self.chunk_frames:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        data = zlib.compress(b''.join(self.chunk), 1)
+        self.file.write(CHUNK_HEADER.pack(len(self.chunk), len(data)))
+        self.file.write(data)
+        self.chunk = []
+
+    def _flush(self):
+        self.file.flush()
+
+    def _close(self):
+        if self.chunk:
+            self._write_chunk()
+        self.file.close()
+
+
+class PacketRecorder(TraceWriter):
+    """Records the packets the sniffer passes to `update_time` as pcap."""
+
+    def __init__(self, path, max_pending=MAX_PENDING):
+        self.writer = None
+        super(PacketRecorder, self).__init__(path, max_pending)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a recorder, None if `trace_directory` isn't set."""
+        if not settings.trace_directory:
+            return None
+        return cls(trace_path(settings.trace_directory, 'packets', '.pcap'))
+
+    def _open(self):
+        from scapy.utils import PcapWriter
+
+        self.writer = PcapWriter(self.path, sync=False)
+
+    def _write(self, packet):
+        self.writer.write(packet)
+
+    def _flush(self):
+        self.writer.flush()
+
+    def _close(self):
+        self.writer.close()
+
+
+class PIRRecorder(TraceWriter):
+    """Records the edges of a PIR sensor's output."""
+
+    def __init__(self, path, max_pending=MAX_PENDING):
+        self.file = None
+        super(PIRRecorder, self).__init__(path, max_pending)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a recorder, None if `trace_directory` isn't set."""
+        if not settings.trace_directory:
+            return None
+        return cls(trace_path(settings.trace_directory, 'pir{0}'.format(settings.pir_pin), '.pir'))
+
+    def _open(self):
+        self.file = open(self.path, 'w')
+
+    def _write(self, edge):
+        now, level = edge
+        self.file.write('{0:.3f} {1:d}\n'.format(now, level))
+
+    def _flush(self):
+        self.file.flush()
+
+    def _close(self):
+        self.file.close()
+
+
+def read_pir_trace(path):
+    """Return the (time, level) edges recorded by a PIRRecorder."""
+    edges = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            # The last line may have been cut short by a crash.
+            if len(fields) == 2:
+                edges.append((float(fields[0]), fields[1] == '1'))
+    return edges
+
+
+class MotionTrace(object):
+    """A motion trace opened for reading.
+
+    The file is memory-mapped rather than read, frames are only paged in
+    as they are used. Frames of compressed traces are decompressed a chunk
+    at a time. Indexing and iterating give (time, vectors) tuples, for an
+    uncompressed trace `records` is the whole trace as a structured array.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError('{0} is not a motion trace'.format(path))
+            magic, version, rows, cols, flags = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError('{0} is not a motion trace'.format(path))
+            if version != VERSION:
+                raise ValueError('{0} has unsupported version {1}'.format(path, version))
+            self.shape = (rows, cols)
+            self.dtype = record_dtype(rows, cols)
+            self.compressed = bool(flags & COMPRESSED)
+            size = os.fstat(f.fileno()).st_size
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > HEADER.size else None
+        self.records = None
+        # (first frame, frame count, data offset, data length) per chunk.
+        self.chunks = []
+        self.starts = []
+        self.cached = None
+        if not self.compressed:
+            self.records = self._records(self.map, HEADER.size, (size - HEADER.size) // self.dtype.itemsize)
+            return
+        offset = HEADER.size
+        frames = 0
+        while offset + CHUNK_HEADER.size <= size:
+            count, length = CHUNK_HEADER.unpack_from(self.map, offset)
+            offset += CHUNK_HEADER.size
+            if offset + length > size:
+                break
+            self.chunks.append((frames, count, offset, length))
+            frames += count
+            offset += length
+        self.starts = [chunk[0] for chunk in self.chunks]
+
+    def _records(self, buf, offset, count):
+        import numpy as np
+
+        if count == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.frombuffer(buf, dtype=self.dtype, count=count, offset=offset)
+
+    def __len__(self):
+        if self.records is not None:
+            return len(self.records)
+        if not self.chunks:
+            return 0
+        first, count, _, _ = self.chunks[-1]
+        return first + count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('frame {0} is out of range'.format(i))
+        if self.records is not None:
+            record = self.records[i]
+        else:
+            n = bisect.bisect_right(self.starts, i) - 1
+            record = self._chunk(n)[i - self.chunks[n][0]]
+        return float(record['time']), record['vectors']
+
+    def __iter__(self):
+        if self.records is not None:
+            for record in self.records:
+                yield float(record['time']), record['vectors']
+            return
+        for n in range(len(self.chunks)):
+            for record in self._chunk(n):
+                yield float(record['time']), record['vectors']
+
+    def _chunk(self, n):
+        if self.cached is None or self.cached[0] != n:
+            _, count, offset, length = self.chunks[n]
+            data = zlib.decompress(self.map[offset:offset + length])
+            self.cached = (n, self._records(data, 0, count))
+        return self.cached[1]
+
+    def close(self):
+        # Arrays still pointing into the map keep it open until they're gone.
+        self.records = None
+        self.cached = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
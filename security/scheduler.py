@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+logger = logging.getLogger()
+
+PRIORITY_ALARM = 0
+PRIORITY_ON_DEMAND = 10
+# Metering and profile changes wait for any captures.
+PRIORITY_MAINTENANCE = 20
+
+
+class CaptureJob(object):
+    """A single unit of work for the camera."""
+
+    def __init__(self, key, func, priority):
+        self.key = key
+        self.func = func
+        self.priority = priority
+        self.future = Future()
+        self.running = False
+
+
+class CaptureScheduler(object):
+    """Serializes access to the camera.
+
+    Jobs are run one at a time on a single worker thread, lowest priority
+    value first. A job submitted with the same key as one that is already
+    pending or running is coalesced into it and shares its future, so ten
+    people asking for a /photo at once results in one capture.
+    """
+
+    def __init__(self, name='capture_scheduler'):
+        self.name = name
+        self.condition = Condition()
+        self.counter = itertools.count()
+        self.heap = []
+        self.jobs = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the worker thread."""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = Thread(name=self.name, target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker thread after the current job finishes.
+
+        Pending jobs are cancelled.
+        """
+        with self.condition:
+            self.running = False
+            pending = [job for job in self.jobs.values() if not job.running]
+            for job in pending:
+                del self.jobs[job.key]
+            self.heap = []
+            self.condition.notify_all()
+        for job in pending:
+            job.future.cancel()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def submit(self, key, func, priority=PRIORITY_ON_DEMAND):
+        """Queue `func` to run on the camera thread.
+
+        Args:
+            key (hashable): Identifies the job for coalescing.
+            func (callable): Called with no arguments on the worker thread.
+            priority (int): Lower values run first.
+        Returns:
+            (Future): Resolves to the return value of `func`.
+        """
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is not None:
+                if not job.running and priority < job.priority:
+                    # Re-queue at the higher priority, the stale heap entry
+                    # is skipped by the worker.
+                    job.priority = priority
+                    heapq.heappush(self.heap, (priority, next(self.counter), job))
+                    self.condition.notify()
+                logger.debug('Coalesced capture job %s', key)
+                return job.future
+            job = CaptureJob(key, func, priority)
+            self.jobs[key] = job
+            heapq.heappush(self.heap, (priority, next(self.counter), job))
+            self.condition.notify()
+        return job.future
+
+    def pending(self):
+        """Return the number of jobs waiting to run."""
+        with self.condition:
+            return sum(1 for job in self.jobs.values() if not job.running)
+
+    def _next_job(self):
+        with self.condition:
+            while self.running:
+                while self.heap:
+                    priority, _, job = heapq.heappop(self.heap)
+                    if self.jobs.get(job.key) is job and priority == job.priority and not job.running:
+                        job.running = True
+                        return job
+                self.condition.wait()
+        return None
+
+    def _run(self):
+        logger.info("thread running")
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                self._finish(job)
+                continue
+            try:
+                result = job.func()
+            except BaseException as exc:
+                logger.error('Capture job %s failed: %s', job.key, exc)
+                self._finish(job)
+                job.future.set_exception(exc)
+            else:
+                self._finish(job)
+                job.future.set_result(result)
+
+    def _finish(self, job):
+        with self.condition:
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+from configparser import ConfigParser, Error as ConfigParserError
+from dataclasses import dataclass, field, fields, replace
+from typing import Tuple
+
+logger = logging.getLogger()
+
+Size = Tuple[int, int]
+MacAddresses = Tuple[str, ...]
+Names = Tuple[str, ...]
+CameraOverrides = Tuple[Tuple[str, Tuple[Tuple[str, object], ...]], ...]
+
+MAC_ADDRESS_PATTERN = re.compile(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$')
+CAMERA_NAME_PATTERN = re.compile(r'^[a-z0-9_-]+$')
+CAMERA_MODES = ('photo', 'gif')
+CLUSTER_ROLES = ('', 'coordinator', 'node')
+# `gate` only counts motion vectors while the PIR is active, `wake` also
+# stops recording while it's idle.
+PIR_MODES = ('', 'gate', 'wake')
+# Widest motion analysis stream when motion_analysis_size isn't set.
+MAX_ANALYSIS_WIDTH = 320
+
+# Sections named `camera:<name>` override these for one camera.
+CAMERA_SECTION_PREFIX = 'camera:'
+CAMERA_SETTINGS = frozenset([
+    'camera_num',
+    'camera_save_path',
+    'camera_vflip',
+    'camera_hflip',
+    'camera_mode',
+    'camera_capture_length',
+    'photo_size',
+    'gif_size',
+    'motion_size',
+    'motion_analysis_size',
+    'motion_detection_setting',
+    'pir_pin',
+    'pir_mode',
+    'pir_hold',
+    'preview_port',
+    'preview_size',
+    'night_mode',
+    'night_luminance',
+    'day_luminance',
+    'night_framerate',
+    'night_iso',
+    'night_shutter_speed',
+    'night_motion_detection_setting',
+    'profile_interval',
+    'verify_threshold',
+    'dedupe_window',
+    'dedupe_distance',
+])
+
+# Settings that are only read at startup, changing them needs a restart.
+RESTART_REQUIRED = frozenset([
+    'telegram_bot_token',
+    'network_interface',
+    'pir_pin',
+    'pir_mode',
+    'pir_hold',
+    'cameras',
+    'camera_num',
+    'motion_size',
+    'motion_analysis_size',
+    'preview_port',
+    'preview_size',
+    'preview_max_clients',
+    'thumbnail_workers',
+    'control_socket',
+    'state_file',
+    'state_max_age',
+    'cluster_role',
+    'cluster_address',
+    'cluster_token',
+    'node_name',
+    'coordinators',
+    'heartbeat_interval',
+    'heartbeat_timeout',
+    'trace_directory',
+    'trace_compress',
+])
+
+
+class SettingsError(ValueError):
+    """Raised when the config file is invalid."""
+
+
+def _parse_bool(value):
+    value = value.strip().lower()
+    if value in ('yes', 'true', 't', '1', 'on'):
+        return True
+    if value in ('no', 'false', 'f', '0', 'off'):
+        return False
+    raise ValueError('expected true or false, got {0!r}'.format(value))
+
+
+def _parse_size(value):
+    parts = value.lower().split('x')
+    if len(parts) != 2:
+        raise ValueError('expected WIDTHxHEIGHT, got {0!r}'.format(value))
+    return tuple(int(x) for x in parts)
+
+
+def _parse_optional_size(value):
+    return _parse_size(value) if value.strip() else ()
+
+
+def _parse_lower(value):
+    return value.strip().lower()
+
+
+def _parse_list(value):
+    return tuple(x.strip().lower() for x in value.split(',') if x.strip())
+
+
+def _parse_camera_overrides(value):
+    raise ValueError('set in [camera:<name>] sections')
+
+
+PARSERS = {
+    str: str.strip,
+    int: int,
+    float: float,
+    bool: _parse_bool,
+    Size: _parse_size,
+    MacAddresses: _parse_list,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Settings(object):
+    """Validated, immutable settings read from the config file.
+
+    A new instance is created on reload and swapped in whole, so readers
+    that take a reference see a consistent set of values.
+    """
+    mac_addresses: MacAddresses = ()
+    telegram_bot_token: str = ''
+    network_interface: str = 'mon0'
+    packet_timeout: int = 700
+    debug_mode: bool = False
+    pir_pin: int = 14
+    pir_mode: str = field(default='', metadata={'parse': _parse_lower})
+    pir_hold: float = 5.0
+    cameras: Names = ()
+    camera_num: int = 0
+    camera_save_path: str = '/var/tmp'
+    camera_vflip: bool = False
+    camera_hflip: bool = False
+    camera_mode: str = field(default='gif', metadata={'parse': _parse_lower})
+    camera_capture_length: int = 3
+    photo_size: Size = (1024, 768)
+    gif_size: Size = (1024, 768)
+    motion_size: Size = (1024, 768)
+    # Empty for the size `analysis_size` works out from motion_size.
+    motion_analysis_size: Size = field(default=(), metadata={'parse': _parse_optional_size})
+    motion_detection_setting: Size = (60, 10)
+    night_mode: bool = False
+    night_luminance: int = 40
+    day_luminance: int = 60
+    night_framerate: int = 2
+    night_iso: int = 800
+    night_shutter_speed: int = 0
+    night_motion_detection_setting: Size = (60, 20)
+    profile_interval: int = 60
+    preview_port: int = 0
+    preview_size: Size = (640, 480)
+    preview_max_clients: int = 4
+    thumbnail_size: Size = (1024, 768)
+    thumbnail_quality: int = 80
+    thumbnail_workers: int = 1
+    send_originals: bool = False
+    verify_threshold: float = 0.0
+    verify_budget_ms: int = 100
+    dedupe_window: int = 0
+    dedupe_distance: int = 8
+    upload_target: float = 0.0
+    control_socket: str = '/run/rpi-security.sock'
+    state_file: str = '/var/lib/rpi-security/state.json'
+    state_max_age: int = 600
+    cluster_role: str = field(default='', metadata={'parse': _parse_lower})
+    cluster_address: str = ':7300'
+    cluster_token: str = ''
+    node_name: str = ''
+    coordinators: Names = ()
+    heartbeat_interval: float = 1.0
+    heartbeat_timeout: float = 5.0
+    trace_directory: str = ''
+    trace_compress: bool = False
+    camera_overrides: CameraOverrides = field(
+        default=(),
+        metadata={'parse': _parse_camera_overrides}
+    )
+
+    def __post_init__(self):
+        errors = list(self._validate())
+        if errors:
+            raise SettingsError('Invalid settings: {0}'.format('; '.join(errors)))
+
+    def _validate(self):
+        # Nodes leave presence detection and Telegram to the coordinator.
+        if self.cluster_role != 'node':
+            if not self.mac_addresses:
+                yield 'mac_addresses must not be empty'
+            if not self.telegram_bot_token:
+                yield 'telegram_bot_token must be set'
+        for mac_address in self.mac_addresses:
+            if not MAC_ADDRESS_PATTERN.match(mac_address):
+                yield 'mac_addresses: invalid MAC address {0!r}'.format(mac_address)
+        if not self.network_interface:
+            yield 'network_interface must be set'
+        if self.packet_timeout <= 0:
+            yield 'packet_timeout must be positive'
+        if self.camera_mode not in CAMERA_MODES:
+            yield 'camera_mode must be one of {0}'.format(', '.join(CAMERA_MODES))
+        if not 0 <= self.pir_pin <= 27:
+            yield 'pir_pin must be a GPIO pin between 0 and 27'
+        if self.pir_mode not in PIR_MODES:
+            yield 'pir_mode must be empty or one of {0}'.format(', '.join(PIR_MODES[1:]))
+        if self.pir_hold < 0:
+            yield 'pir_hold must not be negative'
+        if self.camera_capture_length < 1:
+            yield 'camera_capture_length must be at least 1'
+        for name in (
+                'photo_size', 'gif_size', 'motion_size', 'preview_size',
+                'motion_detection_setting', 'night_motion_detection_setting'):
+            if min(getattr(self, name)) <= 0:
+                yield '{0} must be positive'.format(name)
+        if self.motion_analysis_size:
+            if min(self.motion_analysis_size) <= 0:
+                yield 'motion_analysis_size must be positive'
+            if any(a > m for a, m in zip(self.motion_analysis_size, self.motion_size)):
+                yield 'motion_analysis_size must not be larger than motion_size'
+        if not 0 <= self.night_luminance < self.day_luminance:
+            yield 'night_luminance must not be negative and must be below day_luminance'
+        if self.night_framerate < 1:
+            yield 'night_framerate must be at least 1'
+        if not 0 <= self.night_iso <= 1600:
+            yield 'night_iso must be between 0 and 1600'
+        if self.night_shutter_speed < 0:
+            yield 'night_shutter_speed must not be negative'
+        if self.profile_interval < 1:
+            yield 'profile_interval must be at least 1'
+        if not 0 <= self.preview_port <= 65535:
+            yield 'preview_port must be between 0 and 65535'
+        if self.preview_max_clients < 1:
+            yield 'preview_max_clients must be at least 1'
+        if not 1 <= self.thumbnail_quality <= 95:
+            yield 'thumbnail_quality must be between 1 and 95'
+        if self.thumbnail_workers < 1:
+            yield 'thumbnail_workers must be at least 1'
+        if min(self.thumbnail_size) < 0:
+            yield 'thumbnail_size must not be negative'
+        if not 0 <= self.verify_threshold <= 1:
+            yield 'verify_threshold must be between 0 and 1'
+        if self.verify_budget_ms < 1:
+            yield 'verify_budget_ms must be at least 1'
+        if self.dedupe_window < 0:
+            yield 'dedupe_window must not be negative'
+        if not 0 <= self.dedupe_distance <= 256:
+            yield 'dedupe_distance must be between 0 and 256'
+        if self.upload_target < 0:
+            yield 'upload_target must not be negative'
+        if self.state_max_age < 0:
+            yield 'state_max_age must not be negative'
+        if self.camera_num < 0:
+            yield 'camera_num must not be negative'
+        for name in self.cameras:
+            if not CAMERA_NAME_PATTERN.match(name):
+                yield 'cameras: invalid name {0!r}, use letters, digits, - and _'.format(name)
+        if len(set(self.cameras)) != len(self.cameras):
+            yield 'cameras must not contain duplicates'
+        for name, _ in self.camera_overrides:
+            if name not in self.cameras:
+                yield '[camera:{0}] is not listed in cameras'.format(name)
+        preview_ports = []
+        for name in self.cameras:
+            try:
+                port = self.for_camera(name).preview_port
+            except SettingsError as exc:
+                yield '[camera:{0}] {1}'.format(name, exc)
+            else:
+                if port:
+                    preview_ports.append(port)
+        if len(set(preview_ports)) != len(preview_ports):
+            yield 'each camera needs its own preview_port'
+        if self.cluster_role not in CLUSTER_ROLES:
+            yield 'cluster_role must be empty, coordinator or node'
+        if self.cluster_role and not self.cluster_token:
+            yield 'cluster_token must be set when cluster_role is set'
+        if self.cluster_role == 'node' and not self.coordinators:
+            yield 'coordinators must be set on a node'
+        if self.heartbeat_interval <= 0:
+            yield 'heartbeat_interval must be positive'
+        if self.heartbeat_timeout <= self.heartbeat_interval:
+            yield 'heartbeat_timeout must be longer than heartbeat_interval'
+
+    @classmethod
+    def from_dict(cls, values):
+        """Create settings from a mapping of strings, as in the config file.
+
+        Raises:
+            SettingsError: If a value can't be parsed or fails validation.
+        """
+        kwargs, errors = cls._parse(values)
+        if kwargs.get('cluster_role') != 'node':
+            for name in ('mac_addresses', 'telegram_bot_token'):
+                if name not in values:
+                    errors.append('{0} must be set'.format(name))
+        if errors:
+            raise SettingsError('Invalid settings: {0}'.format('; '.join(errors)))
+        return cls(**kwargs)
+
+    @classmethod
+    def _parse(cls, values, allowed=None):
+        known = {f.name: f for f in fields(cls)}
+        kwargs = {}
+        errors = []
+        for name, value in values.items():
+            if name not in known:
+                logger.warning('Ignoring unknown setting %s', name)
+                continue
+            if allowed is not None and name not in allowed:
+                errors.append('{0} can not be set per camera'.format(name))
+                continue
+            try:
+                parse = known[name].metadata.get('parse') or PARSERS[known[name].type]
+                kwargs[name] = parse(value)
+            except ValueError as exc:
+                errors.append('{0}: {1}'.format(name, exc))
+        return kwargs, errors
+
+    @classmethod
+    def from_file(cls, path, section='main'):
+        """Read and validate the `main` section of a config file.
+
+        Sections named `camera:<name>` override settings for the cameras
+        listed in `cameras`, see `for_camera`.
+        """
+        cfg = ConfigParser()
+        try:
+            if not cfg.read(path):
+                raise SettingsError('Unable to read config file {0}'.format(path))
+        except ConfigParserError as exc:
+            raise SettingsError('Unable to parse config file {0}: {1}'.format(path, exc))
+        if not cfg.has_section(section):
+            raise SettingsError('Config file {0} has no [{1}] section'.format(path, section))
+        settings = cls.from_dict(dict(cfg.items(section)))
+        overrides = []
+        errors = []
+        for name in cfg.sections():
+            if not name.lower().startswith(CAMERA_SECTION_PREFIX):
+                continue
+            camera = name[len(CAMERA_SECTION_PREFIX):].strip().lower()
+            kwargs, section_errors = cls._parse(dict(cfg.items(name)), allowed=CAMERA_SETTINGS)
+            errors.extend('[{0}] {1}'.format(name, error) for error in section_errors)
+            overrides.append((camera, tuple(sorted(kwargs.items()))))
+        if errors:
+            raise SettingsError('Invalid settings: {0}'.format('; '.join(errors)))
+        if not overrides:
+            return settings
+        return replace(settings, camera_overrides=tuple(overrides))
+
+    def for_camera(self, name):
+        """Return the settings for one camera with its section applied.
+
+        The result only lists that camera in `cameras`.
+        """
+        overrides = dict(self.camera_overrides).get(name)
+        if not overrides:
+            return self
+        return replace(self, cameras=(name,), camera_overrides=(), **dict(overrides))
+
+    @property
+    def analysis_size(self):
+        """The size motion vectors are analysed at.
+
+        `motion_analysis_size` if it's set, otherwise `motion_size` scaled
+        down to MAX_ANALYSIS_WIDTH wide if it's wider, keeping its aspect
+        ratio.
+        """
+        if self.motion_analysis_size:
+            return self.motion_analysis_size
+        width, height = self.motion_size
+        if width <= MAX_ANALYSIS_WIDTH:
+            return self.motion_size
+        return (MAX_ANALYSIS_WIDTH, max(1, int(round(height * MAX_ANALYSIS_WIDTH / float(width)))))
+
+    def changed(self, other):
+        """Return the names of settings that differ from `other`."""
+        return set(
+            f.name for f in fields(self)
+            if getattr(self, f.name) != getattr(other, f.name)
+        )
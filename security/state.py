@@ -2,45 +2,144 @@
 
 import logging
 import time
+from dataclasses import asdict, dataclass, replace
 from datetime import timedelta
+from queue import Empty, Full, Queue
 from threading import Lock
 
 logger = logging.getLogger()
 
+STATES = ('armed', 'disarmed', 'disabled')
+
+# Notifications waiting to be sent. Beyond this the oldest are dropped
+# rather than blocking the thread changing the state.
+MAX_NOTIFICATIONS = 100
+
+
+@dataclass(frozen=True, slots=True)
+class StateSnapshot(object):
+    """An immutable copy of the alarm state at one point in time."""
+    current: str
+    previous: str
+    start_time: float
+    last_change: float
+    last_packet: float
+    last_mac: str = None
+    triggered: bool = False
+
 
 class State(object):
-    """Contains state information about the alarm and handles updates"""
+    """Contains state information about the alarm and handles updates
+
+    Readers get `snapshot`, an immutable StateSnapshot, without taking a
+    lock. Writers build a new snapshot under `lock` and swap it in, which is
+    a single reference assignment. Notifications about state changes are put
+    on `notifications` to be sent by the notifier thread rather than from
+    inside the lock. Functions in `listeners` are called with the new
+    snapshot after each state change and must not block.
+    """
     def __init__(self, network):
         self.network = network
         self.lock = Lock()
-        self.start_time = time.time()
-        self.current = 'disarmed'
-        self.previous = 'Not running'
-        self.last_change = time.time()
-        self.last_packet = time.time()
-        self.last_mac = None
-        self.triggered = False
+        self.notifications = Queue(maxsize=MAX_NOTIFICATIONS)
+        self.listeners = []
+        # When each MAC address was last seen, kept out of the snapshot as
+        # it's only checkpointed.
+        self.last_seen = {}
+        now = time.time()
+        self.snapshot = StateSnapshot(
+            current='disarmed',
+            previous='Not running',
+            start_time=now,
+            last_change=now,
+            last_packet=now
+        )
+
+    @property
+    def current(self):
+        return self.snapshot.current
+
+    @property
+    def previous(self):
+        return self.snapshot.previous
+
+    @property
+    def start_time(self):
+        return self.snapshot.start_time
+
+    @property
+    def last_change(self):
+        return self.snapshot.last_change
+
+    @property
+    def last_packet(self):
+        return self.snapshot.last_packet
+
+    @property
+    def last_mac(self):
+        return self.snapshot.last_mac
+
+    @property
+    def triggered(self):
+        return self.snapshot.triggered
 
     def update_state(self, new_state):
-        assert new_state in ['armed', 'disarmed', 'disabled']
-        if new_state != self.current:
-            with self.lock:
-                self.previous = self.current
-                self.current = new_state
-                self.last_change = time.time()
-                self.network.telegram_send_message(
-                    "rpi-security is now {0}".format(self.current)
-                )
-                logger.info("rpi-security is now {0}".format(self.current))
+        assert new_state in STATES
+        if new_state == self.snapshot.current:
+            return
+        with self.lock:
+            snapshot = self.snapshot
+            if new_state == snapshot.current:
+                return
+            self.snapshot = replace(
+                snapshot,
+                previous=snapshot.current,
+                current=new_state,
+                last_change=time.time()
+            )
+        logger.info("rpi-security is now {0}".format(new_state))
+        self.notify("rpi-security is now {0}".format(new_state))
+        for listener in self.listeners:
+            listener(self.snapshot)
 
     def update_triggered(self, triggered):
         with self.lock:
-            self.triggered = triggered
+            self.snapshot = replace(self.snapshot, triggered=triggered)
 
     def update_last_mac(self, mac):
+        now = time.time()
+        with self.lock:
+            self.snapshot = replace(self.snapshot, last_mac=mac, last_packet=now)
+            self.last_seen[mac] = now
+
+    def restore(self, checkpoint):
+        """Carry on from a StateStore checkpoint, without notifying."""
+        if checkpoint['current'] not in STATES:
+            raise ValueError('unknown state {0!r}'.format(checkpoint['current']))
         with self.lock:
-            self.last_mac = mac
-            self.last_packet = time.time()
+            self.snapshot = replace(
+                self.snapshot,
+                current=checkpoint['current'],
+                previous=checkpoint['previous'],
+                last_change=float(checkpoint['last_change']),
+                last_packet=float(checkpoint['last_packet']),
+                last_mac=checkpoint['last_mac'],
+                triggered=bool(checkpoint['triggered'])
+            )
+            self.last_seen.update(checkpoint['last_seen'])
+
+    def notify(self, message):
+        """Queue a message for the notifier thread."""
+        while True:
+            try:
+                self.notifications.put_nowait(message)
+                return
+            except Full:
+                try:
+                    dropped = self.notifications.get_nowait()
+                except Empty:
+                    continue
+                logger.warning('Notification queue full, dropping: %s', dropped)
 
     def _get_readable_delta(self, then):
         td = timedelta(seconds=time.time() - then)
@@ -53,18 +152,21 @@ class State(object):
         return text
 
     def check(self):
-        if self.current == 'disabled':
+        snapshot = self.snapshot
+        if snapshot.current == 'disabled':
             return
         now = time.time()
-        if now - self.last_packet > (self.network.packet_timeout + 20):
+        packet_timeout = self.network.settings.packet_timeout
+        if now - snapshot.last_packet > (packet_timeout + 20):
             self.update_state('armed')
-        elif now - self.last_packet > self.network.packet_timeout:
+        elif now - snapshot.last_packet > packet_timeout:
             logger.debug("Running arp_ping_macs before arming...")
             self.network.arp_ping_macs()
         else:
             self.update_state('disarmed')
 
     def generate_status_text(self):
+        snapshot = self.snapshot
         return (
             "*rpi-security status*\n"
             "Current state: _{0}_ \n"
@@ -74,11 +176,15 @@ class State(object):
             "Last MAC detected: _{4} {5} ago_ \n"
             "Alarm triggered: _{6}_ \n"
         ).format(
-            self.current,
-            self.previous,
-            self._get_readable_delta(self.last_change),
-            self._get_readable_delta(self.start_time),
-            self.last_mac,
-            self._get_readable_delta(self.last_packet),
-            self.triggered
+            snapshot.current,
+            snapshot.previous,
+            self._get_readable_delta(snapshot.last_change),
+            self._get_readable_delta(snapshot.start_time),
+            snapshot.last_mac,
+            self._get_readable_delta(snapshot.last_packet),
+            snapshot.triggered
         )
+
+    def status(self):
+        """Return the current state as a dict of plain values."""
+        return asdict(self.snapshot)
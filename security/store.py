@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Keeps the alarm state across restarts.
+
+The state, when each MAC address was last seen and the photos waiting on
+the camera queues are checkpointed to a small JSON file when the state
+changes and on shutdown. Every 30 seconds it's written again if anything
+in it changed, and every 5 minutes whether it did or not so that there's
+always one recent enough to restore. Rewriting the same checkpoint over
+and over would only wear out the SD card. At startup a recent checkpoint is
+restored so the alarm carries on armed or disarmed in seconds, rather than
+waiting out packet_timeout as if the phones had only just been seen.
+
+Files are written to a temporary file next to them, synced and renamed
+over the old one, so a crash or power cut part way through leaves either
+the old checkpoint or the new one and never half of either.
+"""
+
+import json
+import logging
+import os
+import time
+from threading import Event, Lock
+
+logger = logging.getLogger()
+
+VERSION = 1
+# Seconds between checks for changes to checkpoint.
+CHECKPOINT_INTERVAL = 30
+# Seconds after which a checkpoint is written even if nothing changed, at
+# most half of max_age.
+REFRESH_INTERVAL = 300
+TEMP_SUFFIX = '.tmp'
+
+
+def write_atomic(path, data):
+    """Replace the file at `path` with `data` (bytes), all or nothing."""
+    directory = os.path.dirname(os.path.abspath(path))
+    temp = path + TEMP_SUFFIX
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+    # The rename is only durable once the directory is synced.
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StateStore(object):
+    """Checkpoints `state` and the queues of `cameras` to `path`.
+
+    Args:
+        max_age (float): Checkpoints older than this many seconds, or from
+            the future after the clock has been set back, aren't restored.
+            Packets aren't sniffed while the service is stopped, so after a
+            long stop the phones may have come back unseen. Unchanged
+            checkpoints are rewritten after half of it, so they stay recent
+            enough.
+    """
+
+    def __init__(self, path, state, cameras=(), max_age=600):
+        self.path = path
+        self.state = state
+        self.cameras = cameras
+        self.max_age = max_age
+        self.refresh_interval = min(REFRESH_INTERVAL, max_age / 2) if max_age else REFRESH_INTERVAL
+        self.lock = Lock()
+        self.changed = Event()
+        self.saved = None
+        # The last checkpoint written, without `saved`.
+        self.last = None
+
+    def state_changed(self, snapshot):
+        """A State listener, wakes the save_state thread to checkpoint."""
+        self.changed.set()
+
+    def checkpoint(self):
+        """Return the checkpoint as a dict of plain values."""
+        pending = {}
+        for camera in self.cameras:
+            with camera.queue.mutex:
+                paths = [path for path in camera.queue.queue if path is not None]
+            if paths:
+                pending[camera.name] = paths
+        with self.state.lock:
+            snapshot = self.state.snapshot
+            last_seen = dict(self.state.last_seen)
+        return {
+            'version': VERSION,
+            'saved': time.time(),
+            'current': snapshot.current,
+            'previous': snapshot.previous,
+            'last_change': snapshot.last_change,
+            'last_packet': snapshot.last_packet,
+            'last_mac': snapshot.last_mac,
+            'triggered': snapshot.triggered,
+            'last_seen': last_seen,
+            'pending': pending,
+        }
+
+    def save(self, force=True):
+        """Write a checkpoint. Returns False if it failed.
+
+        Without `force` it's only written if it differs from the last one
+        or that was written `refresh_interval` seconds ago.
+        """
+        with self.lock:
+            checkpoint = self.checkpoint()
+            unsaved = dict(checkpoint)
+            del unsaved['saved']
+            if not force and unsaved == self.last and 0 <= checkpoint['saved'] - self.saved < self.refresh_interval:
+                return True
+            try:
+                write_atomic(self.path, json.dumps(checkpoint).encode('utf-8'))
+            except Exception as exc:
+                logger.error('Failed to write state file %s: %s', self.path, repr(exc))
+                return False
+            self.saved = checkpoint['saved']
+            self.last = unsaved
+            return True
+
+    def load(self, now=None):
+        """Return the checkpoint if it's recent enough to restore, or None."""
+        now = time.time() if now is None else now
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = json.loads(f.read().decode('utf-8'))
+            if checkpoint['version'] != VERSION:
+                raise ValueError('unknown version {0!r}'.format(checkpoint['version']))
+            age = now - checkpoint['saved']
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.error('Failed to read state file %s: %s', self.path, repr(exc))
+            return None
+        if not 0 <= age <= self.max_age:
+            logger.info('Not restoring state saved %.0fs ago', age)
+            return None
+        return checkpoint
+
+    def restore(self, now=None):
+        """Restore the state and queued photos from a recent checkpoint.
+
+        Returns:
+            (bool): True if there was one to restore.
+        """
+        now = time.time() if now is None else now
+        checkpoint = self.load(now)
+        if checkpoint is None:
+            return False
+        try:
+            self.state.restore(checkpoint)
+        except Exception as exc:
+            logger.error('Failed to restore state from %s: %s', self.path, repr(exc))
+            return False
+        restored = 0
+        for camera in self.cameras:
+            for path in checkpoint['pending'].get(camera.name, ()):
+                if os.path.exists(path):
+                    camera.queue.put(path)
+                    restored += 1
+        logger.info(
+            'Restored state %s saved %.0fs ago, with %s queued photos',
+            checkpoint['current'], now - checkpoint['saved'], restored
+        )
+        return True
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Restarts worker threads that fail or stop making progress.
+
+Workers call `heartbeat()` from their loops. A worker that raises, returns
+or goes longer than its `timeout` without a heartbeat is restarted after a
+backoff that doubles with each consecutive failure. Python can't kill a
+thread, so a hung one is abandoned: it's renamed and `heartbeat()` raises
+WorkerAbandoned in it if it ever gets going again.
+"""
+
+import logging
+import time
+from threading import Event, Lock, Thread, current_thread, get_ident
+
+logger = logging.getLogger()
+
+# Worker threads by thread ident, for `heartbeat`.
+_workers = {}
+_workers_lock = Lock()
+
+
+class WorkerAbandoned(Exception):
+    """Raised in a thread that was replaced after it hung."""
+
+
+def heartbeat():
+    """Tell the supervisor the current thread is making progress.
+
+    Does nothing in threads that aren't supervised.
+
+    Raises:
+        WorkerAbandoned: If the thread has been replaced.
+    """
+    worker = _workers.get(get_ident())
+    if worker is None:
+        return
+    if worker.thread is not current_thread():
+        raise WorkerAbandoned('{0} was restarted after it hung'.format(worker.name))
+    worker.last_heartbeat = time.monotonic()
+
+
+class Worker(object):
+    """A supervised thread and its restart history."""
+
+    def __init__(self, name, target, args=(), timeout=None):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.timeout = timeout
+        self.thread = None
+        self.started = None
+        self.last_heartbeat = None
+        self.restarts = 0
+        self.failures = 0
+        self.restart_at = None
+        self.last_error = None
+
+    def status(self, now):
+        if self.restart_at is not None:
+            state = 'restarting'
+        elif self.timeout is not None and now - self.last_heartbeat > self.timeout:
+            state = 'hung'
+        else:
+            state = 'running'
+        return {
+            'state': state,
+            'restarts': self.restarts,
+            'seconds_since_heartbeat': round(now - self.last_heartbeat, 1),
+            'last_error': self.last_error,
+        }
+
+
+class Supervisor(object):
+    """Starts the worker threads and restarts them when they fail or hang.
+
+    Args:
+        check_interval (float): Seconds between checks of the workers.
+        backoff (float): Seconds before the first restart, doubled for each
+            consecutive failure up to `max_backoff`.
+        reset_after (float): A worker that ran this long before failing
+            starts again from `backoff`.
+    """
+
+    def __init__(self, check_interval=1.0, backoff=1.0, max_backoff=60.0, reset_after=60.0):
+        self.check_interval = check_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reset_after = reset_after
+        self.workers = {}
+        self.lock = Lock()
+        self.thread = None
+        self.stopping = Event()
+
+    def add(self, name, target, args=(), timeout=None):
+        """Add a worker, started now if the supervisor is running.
+
+        Args:
+            name (str): The thread name, unique.
+            target (callable): The thread function, which should loop forever.
+            args (tuple): Arguments for `target`.
+            timeout (float): Seconds without a heartbeat before the worker
+                counts as hung, None if it's never hung.
+        """
+        worker = Worker(name, target, args, timeout)
+        with self.lock:
+            if name in self.workers:
+                raise ValueError('There is already a worker called {0}'.format(name))
+            self.workers[name] = worker
+            if self.thread is not None:
+                self._start(worker)
+        return worker
+
+    def start(self):
+        with self.lock:
+            for worker in self.workers.values():
+                self._start(worker)
+        self.thread = Thread(name='supervisor', target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop checking the workers. The workers themselves carry on, they
+        are daemon threads and end with the process.
+        """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        logger.info("thread running")
+        while not self.stopping.wait(self.check_interval):
+            self.check()
+
+    def _start(self, worker):
+        worker.thread = Thread(name=worker.name, target=self._run, args=(worker,), daemon=True)
+        worker.started = worker.last_heartbeat = time.monotonic()
+        worker.restart_at = None
+        worker.thread.start()
+
+    def _run(self, worker):
+        thread = current_thread()
+        with _workers_lock:
+            _workers[get_ident()] = worker
+        try:
+            worker.target(*worker.args)
+        except WorkerAbandoned:
+            logger.info('%s exited after being replaced', thread.name)
+        except Exception as exc:
+            logger.exception('%s failed', worker.name)
+            if worker.thread is thread:
+                worker.last_error = repr(exc)
+        else:
+            if worker.thread is thread:
+                worker.last_error = 'returned'
+        finally:
+            with _workers_lock:
+                _workers.pop(get_ident(), None)
+
+    def check(self):
+        """Schedule restarts of failed and hung workers and start those that are due."""
+        now = time.monotonic()
+        with self.lock:
+            for worker in self.workers.values():
+                if worker.restart_at is not None:
+                    if now >= worker.restart_at:
+                        logger.warning('Restarting %s', worker.name)
+                        worker.restarts += 1
+                        self._start(worker)
+                    continue
+                if not worker.thread.is_alive():
+                    logger.error('%s stopped: %s', worker.name, worker.last_error)
+                elif worker.timeout is not None and now - worker.last_heartbeat > worker.timeout:
+                    worker.last_error = 'no heartbeat for {0:.0f}s'.format(now - worker.last_heartbeat)
+                    logger.error('%s is hung, %s', worker.name, worker.last_error)
+                    worker.thread.name = '{0}_abandoned'.format(worker.name)
+                else:
+                    continue
+                if now - worker.started >= self.reset_after:
+                    worker.failures = 0
+                delay = min(self.max_backoff, self.backoff * 2 ** worker.failures)
+                worker.failures += 1
+                worker.restart_at = now + delay
+
+    def status(self):
+        """State, restart count and last error of each worker thread."""
+        now = time.monotonic()
+        with self.lock:
+            return dict((name, worker.status(now)) for name, worker in self.workers.items())
@@ -1,6 +1,33 @@
 # -*- coding: utf-8 -*-
+"""The worker threads, imported on first use.
 
-from .telegram_bot import telegram_bot
-from .monitor_alarm_state import monitor_alarm_state
-from .capture_packets import capture_packets
-from .process_photos import process_photos
+Each thread imports its own heavy dependencies (telegram, scapy) when it
+starts so they load in parallel with the camera rather than before it.
+"""
+
+from importlib import import_module
+
+_LAZY_ATTRIBUTES = {
+    'telegram_bot': '.telegram_bot',
+    'monitor_alarm_state': '.monitor_alarm_state',
+    'detect_motion': '.detect_motion',
+    'capture_packets': '.capture_packets',
+    'process_photos': '.process_photos',
+    'notifier': '.notifier',
+    'switch_profiles': '.switch_profiles',
+    'save_state': '.save_state',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+    value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,46 +1,88 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from functools import partial
 
-from scapy.all import conf as scapy_conf
-from scapy.all import sniff
+from ..supervisor import heartbeat
 
-import _thread
 
-scapy_conf.promisc=0
-scapy_conf.sniff_promisc=0
+logger = logging.getLogger()
 
+# Seconds before sniffing is restarted to pick up changed settings.
+SNIFF_TIMEOUT = 60
 
-logger = logging.getLogger()
+
+def packet_mac(packet, mac_addresses):
+    """Return which of `mac_addresses` sent `packet`, None if none did."""
+    macs = set(mac_addresses) & set([
+        getattr(packet[0], 'addr2', None),
+        getattr(packet[0], 'addr3', None)
+    ])
+    return min(macs) if macs else None
 
 
-def capture_packets(network):
+def update_time(network, mac_addresses, packet, recorder=None):
+    """The sniff callback. Records when one of `mac_addresses` was last seen.
+
+    Every packet is also passed to `recorder` if there is one.
+
+    Returns:
+        (str): The MAC address the packet was from, None if it's not one of
+            `mac_addresses`.
+    """
+    if recorder is not None:
+        recorder.record(packet)
+    mac = packet_mac(packet, mac_addresses)
+    if mac is not None:
+        network.state.update_last_mac(mac)
+        logger.debug('Packet detected from %s', mac)
+    return mac
+
+
+def calculate_filter(mac_addresses, my_mac_address):
+    mac_string = ' or '.join(mac_addresses)
+    filter_text = (
+        '((wlan addr2 ({0}) or wlan addr3 ({0})) '
+        'and type mgt subtype probe-req) '
+        'or (wlan addr1 {1} '
+        'and wlan addr3 ({0}))'
+    )
+    return filter_text.format(mac_string, my_mac_address)
+
+
+def capture_packets(network, recorder=None):
     """
     This function uses scapy to sniff packets for our MAC addresses and updates
-    the alarm state when packets are detected.
+    the alarm state when packets are detected. Errors are raised for the
+    supervisor to restart the thread. Every packet is passed to `recorder`,
+    a PacketRecorder, if there is one. It's created by the caller so a
+    restart doesn't start another trace.
     """
     logging.getLogger("scapy.runtime").setLevel(logging.ERROR)
+    from scapy.all import conf as scapy_conf
+    from scapy.all import sniff
+
+    scapy_conf.promisc = 0
+    scapy_conf.sniff_promisc = 0
 
-    def update_time(packet):
-        packet_mac = set(network.mac_addresses) & set([packet[0].addr2, packet[0].addr3])
-        packet_mac_str = list(packet_mac)[0]
-        network.state.update_last_mac(packet_mac_str)
-        logger.debug('Packet detected from {0}'.format(packet_mac_str))
-
-    def calculate_filter(mac_addresses):
-        mac_string = ' or '.join(mac_addresses)
-        filter_text = (
-            '((wlan addr2 ({0}) or wlan addr3 ({0})) '
-            'and type mgt subtype probe-req) '
-            'or (wlan addr1 {1} '
-            'and wlan addr3 ({0}))'
-        )
-        return filter_text.format(mac_string, network.my_mac_address)
+    def settings_changed(packet=None):
+        return network.settings.mac_addresses != settings.mac_addresses
 
+    logger.info("thread running")
     while True:
-        logger.info("thread running")
+        heartbeat()
+        # Sniffing stops periodically so a reloaded list of MAC addresses
+        # gets a new filter.
+        settings = network.settings
         try:
-            sniff(iface=network.network_interface, store=0, prn=update_time, filter=calculate_filter(network.mac_addresses))
+            sniff(
+                iface=settings.network_interface,
+                store=0,
+                prn=partial(update_time, network, settings.mac_addresses, recorder=recorder),
+                filter=calculate_filter(settings.mac_addresses, network.my_mac_address),
+                stop_filter=settings_changed,
+                timeout=SNIFF_TIMEOUT
+            )
         except Exception as e:
             logger.error('Scapy failed to sniff packets with error {0}'.format(repr(e)))
-            _thread.interrupt_main()
+            raise
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from ..supervisor import heartbeat
+
+logger = logging.getLogger()
+
+
+def detect_motion(network, camera, on_motion=None):
+    """
+    Runs motion detection on one camera while the alarm is armed and captures photos
+    or a gif when it's triggered. Every camera has its own thread. on_motion is called
+    with the camera before capturing, nodes use it to tell the coordinator straight away.
+    A camera with a wake_sensor only records while that sensor is active.
+    """
+    logger.info("thread running")
+    detecting = False
+    while True:
+        heartbeat()
+        if network.state.current != 'armed':
+            if detecting:
+                camera.stop_motion_detection()
+                detecting = False
+            time.sleep(0.1)
+            continue
+        sensor = camera.wake_sensor
+        if sensor is not None and not sensor.active():
+            if detecting:
+                camera.stop_motion_detection()
+                detecting = False
+            # Woken by the PIR interrupt.
+            sensor.wait(0.1)
+            continue
+        if not detecting:
+            camera.start_motion_detection()
+            detecting = True
+        if camera.motion_detected.wait(0.1):
+            camera.stop_motion_detection()
+            detecting = False
+            if on_motion is not None:
+                on_motion(camera)
+            camera.trigger_alarm().result()
+            camera.motion_detected.clear()
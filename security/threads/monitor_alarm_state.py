@@ -3,29 +3,18 @@
 import logging
 import time
 
+from ..supervisor import heartbeat
+
 logger = logging.getLogger()
 
 
-def monitor_alarm_state(network, camera):
+def monitor_alarm_state(network):
     """
-    This function monitors and updates the alarm state, starts/stops motion detection when
-    state is armed and takes photos when motion detection is triggered.
+    This function monitors and updates the alarm state. Motion detection runs in a
+    detect_motion thread for each camera, which follow the state set here.
     """
     logger.info("thread running")
     while True:
+        heartbeat()
         time.sleep(0.1)
         network.state.check()
-        if network.state.current == 'armed':
-            while not camera.lock.locked():
-                camera.start_motion_detection()
-                network.state.check()
-                if network.state.current is not 'armed':
-                    break
-                if camera.motion_detector.camera_trigger.is_set():
-                    camera.stop_motion_detection()
-                    camera.trigger_camera()
-                    camera.motion_detector.camera_trigger.clear()
-            else:
-                camera.stop_motion_detection()
-        else:
-            camera.stop_motion_detection()
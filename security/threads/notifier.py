@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from queue import Empty
+
+from ..supervisor import heartbeat
+
+logger = logging.getLogger()
+
+
+def notifier(network):
+    """
+    Sends the notifications queued by state changes so the threads changing
+    the state never wait on Telegram.
+    """
+    logger.info("thread running")
+    notifications = network.state.notifications
+    while True:
+        heartbeat()
+        try:
+            message = notifications.get(timeout=1)
+        except Empty:
+            continue
+        try:
+            network.telegram_send_message(message)
+        except Exception as exc:
+            logger.error('Failed to send notification "{0}": {1}'.format(message, repr(exc)))
+        finally:
+            notifications.task_done()
@@ -2,36 +2,101 @@
 
 import logging
 import time
+from queue import Empty
+
+from ..supervisor import heartbeat
 
 logger = logging.getLogger()
 
 
-def process_photos(network, camera):
+def process_photos(network, cameras, verifier=None, deduplicator=None, encoder=None):
     """
-    Monitors the captured_from_camera list for newly captured photos.
+    Monitors the queues of the cameras for newly captured photos.
     When a new photos are present it will run arp_ping_macs to remove false positives and then send the photos via Telegram.
+    If verify_threshold is set the photos are scored by `verifier` first, events scoring below it are dropped and the score is sent in the caption.
+    If dedupe_window is set `deduplicator` drops photos that look the same as ones sent in the window, the message says how many.
+    If upload_target is set `encoder` re-encodes the photos so they should all arrive within that many seconds.
+    Photos are sent as thumbnails first, the originals are kept for the /original command or sent afterwards if send_originals is set.
     After successfully sendind the photo it will also archive the photo and remove it from the list.
     """
     logger.info("thread running")
     while True:
-        if not camera.queue.empty():
+        heartbeat()
+        if any(not camera.queue.empty() for camera in cameras):
             if network.state.current == 'armed':
                 logger.debug('Running arp_ping_macs before sending photos...')
                 network.arp_ping_macs()
                 time.sleep(2)
-                while True:
-                    if network.state.current != 'armed':
-                        camera.clear_queue()
-                        break
-                    photo = camera.queue.get()
-                    if photo is None:
-                        break
-                    logger.debug('Processing the photo: {0}'.format(photo))
-                    network.state.update_triggered(True)
-                    network.telegram_send_message('Motioned detected')
-                    if network.telegram_send_file(photo):
+                if network.state.current != 'armed':
+                    cameras.clear_queues()
+                    continue
+                for camera in cameras:
+                    photos = []
+                    while True:
+                        try:
+                            photos.append(camera.queue.get_nowait())
+                        except Empty:
+                            break
+                    for photo in photos:
                         camera.queue.task_done()
+                    photos = [photo for photo in photos if photo is not None]
+                    if not photos:
+                        continue
+                    logger.debug('Processing the photos: {0}'.format(photos))
+                    caption = None
+                    settings = network.settings.for_camera(camera.name)
+                    if settings.verify_threshold and verifier is not None:
+                        score = verifier.score(photos, settings.verify_budget_ms)
+                        if score is not None and score < settings.verify_threshold:
+                            logger.info('Not sending {0}, scored {1:.2f}'.format(photos, score))
+                            continue
+                        if score is not None:
+                            caption = 'Score {0:.2f}'.format(score)
+                    message = 'Motioned detected{0}'.format(cameras.label(camera))
+                    if settings.dedupe_window and deduplicator is not None:
+                        photos, dropped = deduplicator.filter(
+                            camera.name, photos, settings.dedupe_window, settings.dedupe_distance
+                        )
+                        if dropped:
+                            logger.info('Not sending {0}, near-duplicates of photos already sent'.format(dropped))
+                            if not photos:
+                                continue
+                            message += ', {0} similar photos not sent'.format(len(dropped))
+                    network.state.update_triggered(True)
+                    network.telegram_send_message(message)
+                    send_photos(network, camera, photos, caption, encoder, deduplicator)
             else:
                 logger.debug('Stopping photo processing as state is now {0} and clearing queue'.format(network.state.current))
-                camera.queue.queue.clear()
+                cameras.clear_queues()
         time.sleep(0.1)
+
+
+def send_photos(network, camera, photos, caption=None, encoder=None, deduplicator=None):
+    """Send thumbnails of jpgs and keep the originals for later.
+
+    `caption` goes with the first file sent. With an `encoder` each file is
+    re-encoded to arrive in its share of upload_target. Photos that were
+    sent are passed to `deduplicator` so later ones are compared with them.
+    """
+    jpgs = [photo for photo in photos if photo.endswith('.jpg')]
+    thumbnails = dict(camera.thumbnails.map(jpgs)) if camera.thumbnails else {}
+    target = network.settings.upload_target / max(len(photos), 1) if encoder is not None else 0
+    for photo in photos:
+        heartbeat()
+        if network.state.current != 'armed':
+            break
+        thumbnail = thumbnails.get(photo)
+        path = photo if thumbnail is None else thumbnail
+        if target:
+            path = encoder.fit(path, target)
+        sent = network.telegram_send_file(path, caption)
+        caption = None
+        if not sent:
+            continue
+        if deduplicator is not None:
+            deduplicator.sent(camera.name, photo)
+        if thumbnail is not None:
+            if network.settings.send_originals:
+                network.telegram_send_file(photo)
+            else:
+                camera.thumbnails.add_original(photo)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from ..supervisor import heartbeat
+from ..store import CHECKPOINT_INTERVAL
+
+logger = logging.getLogger()
+
+
+def save_state(store):
+    """
+    Checkpoints the alarm state with `store` as soon as it changes, and
+    every CHECKPOINT_INTERVAL seconds if anything else in the checkpoint has.
+    """
+    logger.info("thread running")
+    while True:
+        heartbeat()
+        store.changed.wait(CHECKPOINT_INTERVAL)
+        store.changed.clear()
+        store.save(force=False)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+from ..profiles import ProfileSwitcher
+from ..supervisor import heartbeat
+
+logger = logging.getLogger()
+
+# Seconds to wait for the camera to measure or apply a profile.
+CAMERA_TIMEOUT = 30
+
+
+def switch_profiles(camera, get_settings):
+    """
+    Measures the brightness of one camera's scene every profile_interval seconds and
+    switches it between the day and night profiles, or meters exposure again when
+    the light has changed. Idles while night_mode is off for the camera. get_settings
+    returns the current Settings, which the coordinator reloads and a node doesn't.
+    """
+    logger.info("thread running")
+    switcher = None
+    while True:
+        heartbeat()
+        settings = get_settings().for_camera(camera.name)
+        if not settings.night_mode:
+            switcher = None
+            time.sleep(1)
+            continue
+        if switcher is None:
+            switcher = ProfileSwitcher(settings)
+        else:
+            switcher.apply_settings(settings)
+        try:
+            profile = switcher.update(camera.measure_luminance().result(timeout=CAMERA_TIMEOUT))
+            if profile is None and camera.profile != switcher.current:
+                # The settings of the current profile were changed.
+                profile = switcher.current
+            if profile is not None:
+                camera.apply_profile(profile).result(timeout=CAMERA_TIMEOUT)
+        except Exception as exc:
+            logger.error('Failed to switch profile of {0}: {1}'.format(camera.name, repr(exc)))
+        deadline = time.monotonic() + settings.profile_interval
+        while time.monotonic() < deadline:
+            heartbeat()
+            time.sleep(min(1, max(0, deadline - time.monotonic())))
@@ -1,21 +1,31 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
+import time
+from datetime import datetime
 
-from telegram.ext import CommandHandler, RegexHandler, Updater
-
-import _thread
+from ..profiler import DEFAULT_SECONDS, ProfilerBusy, profile as run_profile
+from ..supervisor import heartbeat
 
 logging.getLogger("telegram").setLevel(logging.ERROR)
 
+# Seconds to wait for the camera before giving up on a /photo or /gif.
+CAPTURE_TIMEOUT = 120
+
 
 logger = logging.getLogger()
 
 
-def telegram_bot(network, camera):
+def telegram_bot(network, cameras):
     """
     This function runs the telegram bot that responds to commands like /enable, /disable or /status.
+    /photo and /gif capture from every camera, or from the cameras named after the command.
+    The thread stays alive while the bot is polling so the supervisor can restart it.
     """
+    from telegram.ext import CommandHandler, RegexHandler, Updater
+    from telegram.ext.dispatcher import run_async
+
     def save_chat_id(bot, update):
         if 'telegram_chat_id' not in network.saved_data or network.saved_data['telegram_chat_id'] is None:
             network.save_telegram_chat_id(update.message.chat_id)
@@ -33,7 +43,7 @@ def telegram_bot(network, camera):
 
     def help(bot, update):
         if check_chat_id(update):
-            bot.sendMessage(update.message.chat_id, parse_mode='Markdown', text='/status: Request status\n/disable: Disable alarm\n/enable: Enable alarm\n/photo: Take a photo\n/gif: Take a gif\n', timeout=10)
+            bot.sendMessage(update.message.chat_id, parse_mode='Markdown', text='/status: Request status\n/disable: Disable alarm\n/enable: Enable alarm\n/photo <camera>: Take a photo\n/gif <camera>: Take a gif\n/original: Send full size photos\n/profile <seconds>: Find the busy threads\n', timeout=10)
 
     def status(bot, update):
         if check_chat_id(update):
@@ -47,21 +57,85 @@ def telegram_bot(network, camera):
         if check_chat_id(update):
             network.state.update_state('disarmed')
 
-    def photo(bot, update):
+    def send_capture(future):
+        # Runs on a dispatcher worker so waiting on the camera doesn't hold
+        # up /status, /disable etc.
+        try:
+            path = future.result(timeout=CAPTURE_TIMEOUT)
+        except Exception as exc:
+            logger.error('Capture failed with error {0}'.format(repr(exc)))
+            path = None
+        if path is None:
+            network.telegram_send_message('Failed to capture from the camera')
+        elif cameras.thumbnails and path.endswith('.jpg'):
+            for path, thumbnail in cameras.thumbnails.map([path]):
+                network.telegram_send_file(thumbnail or path)
+                if thumbnail:
+                    cameras.thumbnails.add_original(path)
+        else:
+            network.telegram_send_file(path)
+
+    def selected_cameras(args):
+        if not args:
+            return list(cameras)
+        try:
+            return [cameras.get(name) for name in args]
+        except KeyError:
+            network.telegram_send_message(
+                'Unknown camera, use one of: {0}'.format(', '.join(cameras.names()))
+            )
+            return []
+
+    @run_async
+    def photo(bot, update, args):
         if check_chat_id(update):
-            photo = camera.take_photo()
-            network.telegram_send_file(photo)
+            # Submit to every camera before waiting so they capture together.
+            futures = [camera.take_photo() for camera in selected_cameras(args)]
+            for future in futures:
+                send_capture(future)
 
-    def gif(bot, update):
+    @run_async
+    def gif(bot, update, args):
+        if check_chat_id(update):
+            futures = [camera.take_gif() for camera in selected_cameras(args)]
+            for future in futures:
+                send_capture(future)
+
+    @run_async
+    def original(bot, update):
+        if check_chat_id(update):
+            originals = cameras.thumbnails.pop_originals() if cameras.thumbnails else []
+            if not originals:
+                network.telegram_send_message('No photos waiting to be sent')
+            for path in originals:
+                network.telegram_send_file(path)
+
+    @run_async
+    def profile(bot, update, args):
         if check_chat_id(update):
-            gif = camera.take_gif()
-            network.telegram_send_file(gif)
+            try:
+                seconds = int(args[0]) if args else DEFAULT_SECONDS
+                network.telegram_send_message('Profiling for {0} seconds'.format(seconds))
+                result = run_profile(seconds)
+            except (ValueError, ProfilerBusy) as exc:
+                network.telegram_send_message('Profile failed: {0}'.format(exc))
+                return
+            # The summary is preformatted so thread names with underscores
+            # aren't taken as Markdown.
+            network.telegram_send_message('```\n{0}\n```'.format(result.summary()))
+            path = os.path.join(
+                network.settings.camera_save_path,
+                'profile-{0}.folded'.format(datetime.now().strftime('%Y-%m-%d-%H%M%S'))
+            )
+            with open(path, 'w') as f:
+                f.write(result.collapsed())
+            network.telegram_send_file(path)
 
     def error_callback(bot, update, error):
         logger.error('Update "{0}" caused error "{1}"'.format(update, error))
 
     try:
-        updater = Updater(network.telegram_bot_token)
+        updater = Updater(network.settings.telegram_bot_token)
         dp = updater.dispatcher
         dp.add_handler(RegexHandler('.*', save_chat_id), group=1)
         dp.add_handler(RegexHandler('.*', debug), group=2)
@@ -69,12 +143,16 @@ def telegram_bot(network, camera):
         dp.add_handler(CommandHandler("status", status), group=3)
         dp.add_handler(CommandHandler("disable", disable), group=3)
         dp.add_handler(CommandHandler("enable", enable), group=3)
-        dp.add_handler(CommandHandler("photo", photo), group=3)
-        dp.add_handler(CommandHandler("gif", gif), group=3)
+        dp.add_handler(CommandHandler("photo", photo, pass_args=True), group=3)
+        dp.add_handler(CommandHandler("gif", gif, pass_args=True), group=3)
+        dp.add_handler(CommandHandler("original", original), group=3)
+        dp.add_handler(CommandHandler("profile", profile, pass_args=True), group=3)
         dp.add_error_handler(error_callback)
         updater.start_polling(timeout=10)
     except Exception as e:
         logger.error('Telegram Updater failed to start with error {0}'.format(repr(e)))
-        _thread.interrupt_main()
-    else:
-        logger.info("thread running")
+        raise
+    logger.info("thread running")
+    while updater.running:
+        heartbeat()
+        time.sleep(1)
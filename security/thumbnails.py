@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+logger = logging.getLogger()
+
+THUMBNAIL_SUFFIX = '-thumb'
+
+
+def thumbnail_path(path, suffix=THUMBNAIL_SUFFIX):
+    """Return the path a thumbnail of `path` is saved to."""
+    root, extension = os.path.splitext(path)
+    return root + suffix + '.jpg'
+
+
+def make_thumbnail(path, size, quality=80):
+    """Save a downscaled JPEG copy of an image.
+
+    Runs in a worker process. For JPEGs `draft` lets the decoder scale by
+    1/2, 1/4 or 1/8 while decoding so a full 2592x1944 frame is never held
+    in memory.
+
+    Args:
+        path (str): The image to downscale.
+        size (tuple): Maximum (width, height) of the thumbnail.
+        quality (int): JPEG quality of the thumbnail.
+    Returns:
+        (str): The path of the thumbnail.
+    """
+    from PIL import Image
+
+    output = thumbnail_path(path)
+    with Image.open(path) as image:
+        image.draft('RGB', size)
+        image = image.convert('RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        image.save(output, 'JPEG', quality=quality)
+    return output
+
+
+class ThumbnailPool(object):
+    """Generates thumbnails of captured photos in a pool of processes.
+
+    PIL holds the GIL while resizing and encoding so a thread pool wouldn't
+    help on multi-core Pis. `max_pending` bounds how many images are in
+    flight at once which keeps memory use bounded, `submit` blocks when the
+    pool is full.
+
+    The full size originals of recently sent photos are kept in
+    `originals` so they can be sent on request.
+    """
+
+    def __init__(self, size=(1024, 768), quality=80, workers=1, max_pending=None, max_originals=20):
+        self.size = tuple(size)
+        self.quality = quality
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.slots = BoundedSemaphore(max_pending or workers * 2)
+        self.originals = deque(maxlen=max_originals)
+        self.originals_lock = Lock()
+
+    def run(self, func, *args):
+        """Call `func(*args)` in a worker, blocking while the pool is full.
+
+        Other work sharing the pool goes through here rather than straight
+        to `executor` so it counts towards `max_pending`.
+
+        Returns:
+            (Future): Resolves to what `func` returns.
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def submit(self, path):
+        """Queue a thumbnail of `path`.
+
+        Returns:
+            (Future): Resolves to the thumbnail path.
+        """
+        return self.run(make_thumbnail, path, self.size, self.quality)
+
+    def map(self, paths):
+        """Thumbnail `paths` in parallel, yielding (path, thumbnail) in order.
+
+        The thumbnail is None if it couldn't be generated.
+        """
+        futures = [(path, self.submit(path)) for path in paths]
+        for path, future in futures:
+            try:
+                yield path, future.result()
+            except Exception as exc:
+                logger.error('Failed to create thumbnail of %s: %s', path, exc)
+                yield path, None
+
+    def add_original(self, path):
+        with self.originals_lock:
+            self.originals.append(path)
+
+    def pop_originals(self):
+        """Return and forget the originals waiting to be requested."""
+        with self.originals_lock:
+            originals = list(self.originals)
+            self.originals.clear()
+        return originals
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
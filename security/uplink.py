@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Fits what's sent to Telegram to how fast the uplink is.
+
+The time each send takes is recorded. Small ones, like messages, measure
+the round trip and large ones the throughput once the round trip is taken
+off. Before a photo or GIF is sent it's re-encoded in a worker to the
+largest size and quality that should arrive in the time it's given, with
+fewer frames for GIFs or as a short H.264 clip if ffmpeg is installed.
+"""
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+from threading import Lock
+
+logger = logging.getLogger()
+
+# Sends smaller than this, in bytes, are timed as round trips.
+SMALL_SEND = 4096
+# Weight of the newest measurement in the moving averages.
+ALPHA = 0.3
+FIT_SUFFIX = '-fit'
+FITTED_EXTENSIONS = ('.jpg', '.jpeg', '.gif')
+# Seconds allowed for a worker to re-encode one file.
+FIT_TIMEOUT = 60
+
+# The largest rung that fits is used: (longest side, JPEG quality).
+JPEG_RUNGS = ((1024, 80), (800, 70), (640, 60), (480, 50), (320, 40))
+# (longest side, x264 CRF), a clip is usually a fifth the size of the GIF.
+CLIP_RUNGS = ((1024, 28), (640, 30), (480, 34), (320, 38))
+CLIP_CODEC = 'libx264'
+# (longest side, keep every nth frame).
+GIF_RUNGS = ((640, 1), (640, 2), (480, 2), (320, 3))
+
+
+class UplinkEstimator(object):
+    """Moving averages of the round trip and throughput of recent sends."""
+
+    def __init__(self, alpha=ALPHA):
+        self.alpha = alpha
+        self.round_trip = None
+        self.bytes_per_second = None
+        self.lock = Lock()
+
+    def _average(self, old, new):
+        return new if old is None else old + self.alpha * (new - old)
+
+    def record(self, size, seconds, delivered=True):
+        """Record a send of `size` bytes taking `seconds`.
+
+        A send that failed, usually by timing out, only shows the throughput
+        is below what it managed, and only counts if that's lower than the
+        average.
+        """
+        with self.lock:
+            if size < SMALL_SEND:
+                if delivered:
+                    self.round_trip = self._average(self.round_trip, seconds)
+                return
+            transfer = max(seconds - (self.round_trip or 0), seconds / 10.0)
+            if delivered:
+                self.bytes_per_second = self._average(self.bytes_per_second, size / transfer)
+            elif self.bytes_per_second is None or size / transfer < self.bytes_per_second:
+                self.bytes_per_second = size / transfer
+
+    def budget(self, seconds):
+        """Return the bytes that should arrive in `seconds`, or None until a
+        large send has been timed.
+        """
+        with self.lock:
+            if self.bytes_per_second is None:
+                return None
+            return max(int((seconds - (self.round_trip or 0)) * self.bytes_per_second), 0)
+
+
+def fit_path(path, extension):
+    """Return the path a re-encoded copy of `path` is saved to."""
+    root, _ = os.path.splitext(path)
+    return root + FIT_SUFFIX + extension
+
+
+def _largest_fit(rungs, encode, budget):
+    """Return the encoding of the largest rung under `budget` bytes, or of
+    the last if none are. Encodings get smaller down the rungs so they're
+    bisected, three encodes at most for five rungs.
+    """
+    encoded = {}
+    low, high = 0, len(rungs) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        encoded[middle] = encode(rungs[middle])
+        if len(encoded[middle]) <= budget:
+            high = middle - 1
+        else:
+            low = middle + 1
+    if low == len(rungs):
+        low -= 1
+    return encoded[low] if low in encoded else encode(rungs[low])
+
+
+def _save(data, output):
+    with open(output, 'wb') as f:
+        f.write(data)
+    return output
+
+
+def fit_jpeg(path, budget):
+    """Save the largest rung of JPEG_RUNGS under `budget` bytes."""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft('RGB', (JPEG_RUNGS[0][0], JPEG_RUNGS[0][0] * 3 // 4))
+        image = image.convert('RGB')
+
+    def encode(rung):
+        side, quality = rung
+        scaled = image.copy()
+        scaled.thumbnail((side, side), Image.BILINEAR)
+        data = io.BytesIO()
+        scaled.save(data, 'JPEG', quality=quality)
+        return data.getvalue()
+
+    return _save(_largest_fit(JPEG_RUNGS, encode, budget), fit_path(path, '.jpg'))
+
+
+def fit_clip(path, budget, ffmpeg):
+    """Save a GIF as an H.264 clip at the largest rung of CLIP_RUNGS under
+    `budget` bytes.
+    """
+    output = fit_path(path, '.mp4')
+
+    def encode(rung):
+        side, crf = rung
+        subprocess.run([
+            ffmpeg, '-y', '-loglevel', 'error', '-f', 'gif', '-i', path,
+            '-vf', "scale='min({0},iw)':-2".format(side),
+            '-c:v', CLIP_CODEC, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart', '-an', output
+        ], check=True, timeout=FIT_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(output, 'rb') as f:
+            return f.read()
+
+    return _save(_largest_fit(CLIP_RUNGS, encode, budget), output)
+
+
+def fit_gif(path, budget):
+    """Save the largest rung of GIF_RUNGS under `budget` bytes."""
+    from PIL import Image, ImageSequence
+
+    with Image.open(path) as image:
+        duration = image.info.get('duration', 200)
+        frames = [frame.convert('RGB') for frame in ImageSequence.Iterator(image)]
+
+    def encode(rung):
+        side, step = rung
+        kept = []
+        for frame in frames[::step]:
+            frame = frame.copy()
+            frame.thumbnail((side, side), Image.BILINEAR)
+            kept.append(frame)
+        data = io.BytesIO()
+        kept[0].save(data, 'GIF', save_all=True, append_images=kept[1:], loop=0, duration=duration * step)
+        return data.getvalue()
+
+    # Rungs that would save the GIF as it is are skipped.
+    rungs = [rung for rung in GIF_RUNGS if rung[0] < max(frames[0].size) or rung[1] > 1] or GIF_RUNGS[-1:]
+    return _save(_largest_fit(rungs, encode, budget), fit_path(path, '.gif'))
+
+
+def fit_file(path, budget):
+    """Return `path`, or a copy re-encoded to about `budget` bytes. Runs in a
+    worker process.
+    """
+    if os.path.getsize(path) <= budget:
+        return path
+    extension = os.path.splitext(path)[1]
+    if extension == '.gif':
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg:
+            return fit_clip(path, budget, ffmpeg)
+        return fit_gif(path, budget)
+    return fit_jpeg(path, budget)
+
+
+class UplinkEncoder(object):
+    """Re-encodes files to arrive within a time on the uplink `estimator` measures.
+
+    `pool` re-encodes in worker processes, usually the cameras'
+    ThumbnailPool. Without one they're re-encoded in the calling thread.
+    """
+
+    def __init__(self, estimator, pool=None):
+        self.estimator = estimator
+        self.pool = pool
+
+    def fit(self, path, seconds):
+        """Return the file to send so it arrives in about `seconds`.
+
+        It's `path` until the uplink has been measured, if it already fits,
+        or if it can't be re-encoded.
+        """
+        budget = self.estimator.budget(seconds)
+        if budget is None or os.path.splitext(path)[1] not in FITTED_EXTENSIONS:
+            return path
+        try:
+            if self.pool is None:
+                fitted = fit_file(path, budget)
+            else:
+                fitted = self.pool.run(fit_file, path, budget).result(timeout=FIT_TIMEOUT)
+        except Exception as exc:
+            logger.error('Failed to re-encode {0}: {1}'.format(path, repr(exc)))
+            return path
+        if fitted != path:
+            logger.info(
+                'Re-encoded %s from %s to %s bytes for a budget of %s',
+                path, os.path.getsize(path), os.path.getsize(fitted), budget
+            )
+        return fitted
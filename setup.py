@@ -16,7 +16,8 @@ setup(
         'security',
         'security/threads'
     ],
-    scripts=['bin/manage.py'],
+    scripts=['bin/manage.py', 'bin/rpi-security-control.py', 'bin/rpi-security-node.py'],
+    python_requires='>=3.10',
     data_files=[
         ('/lib/systemd/system', ['etc/rpi-security.service']),
         ('/etc', ['etc/rpi-security.conf']),
@@ -1,8 +1,139 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue
+
 import pytest
 
-from rpisec.rpis_camera import Camera
+from security.state import State
+
 
 @pytest.fixture(scope="session")
 def picamera():
     """Return an instance of the camera."""
+    from security.camera import Camera
     return Camera()
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+    send_originals = False
+    upload_target = 6.0
+
+
+class FakeNetwork(object):
+    """A network with the settings and the alarm state.
+
+    Files are sent to `sent` as (path, caption), except those in `unsent`
+    which fail.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = FakeSettings() if settings is None else settings
+        self.state = State(self)
+        self.sent = []
+        self.unsent = set()
+        self.arp_pings = 0
+
+    def arp_ping_macs(self):
+        self.arp_pings += 1
+
+    def telegram_send_file(self, path, caption=None):
+        if path in self.unsent:
+            return False
+        self.sent.append((path, caption))
+        return True
+
+
+class FakeCamera(object):
+    """A camera backend that records what the daemon asks of it.
+
+    Photos and GIFs are files of `size` bytes written to `directory`, or
+    `future`, which is left for the test to resolve, without a directory.
+    """
+
+    def __init__(self, name='security', settings=None, thumbnails=None, directory=None, size=1000,
+                 wake_sensor=None):
+        self.name = name
+        self.settings = settings
+        self.thumbnails = thumbnails
+        self.directory = directory
+        self.size = size
+        self.wake_sensor = wake_sensor
+        self.queue = Queue()
+        self.motion_detected = threading.Event()
+        self.future = Future()
+        self.detecting = False
+        self.alarms = 0
+        self.captures = 0
+
+    @classmethod
+    def from_settings(cls, settings, name='security', thumbnails=None):
+        return cls(name, settings, thumbnails)
+
+    def apply_settings(self, settings):
+        self.settings = settings
+
+    def start_motion_detection(self):
+        self.detecting = True
+
+    def stop_motion_detection(self):
+        self.detecting = False
+
+    def trigger_alarm(self):
+        self.alarms += 1
+        path = '/var/tmp/{0}-{1}.jpg'.format(self.name, self.alarms)
+        self.queue.put(path)
+        future = Future()
+        future.set_result([path])
+        return future
+
+    def clear_queue(self):
+        with self.queue.mutex:
+            self.queue.queue.clear()
+
+    def capture(self):
+        self.captures += 1
+        path = os.path.join(self.directory, '{0}-{1}.jpg'.format(self.name, self.captures))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(self.size))
+        return path
+
+    def take_photo(self):
+        if self.directory is None:
+            return self.future
+        future = Future()
+        future.set_result(self.capture())
+        return future
+
+    take_gif = take_photo
+
+
+def _wait_for(condition, timeout=3):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def fake_network():
+    """The FakeNetwork class, `fake_network(settings=None)`."""
+    return FakeNetwork
+
+
+@pytest.fixture
+def fake_camera():
+    """The FakeCamera class, also usable as a CameraGroup backend."""
+    return FakeCamera
+
+
+@pytest.fixture
+def wait_for():
+    """`wait_for(condition, timeout=3)` polls until `condition()` is true
+    and returns False if it isn't within `timeout` seconds.
+    """
+    return _wait_for
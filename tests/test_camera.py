@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 
@@ -60,3 +62,49 @@ def test_capture_to_path():
 @pytest.mark.xfail
 def test_create_gif():
     assert 1 == 2
+
+
+def test_motion_detection_with_preview():
+    """The preview recording on its own port doesn't stop motion detection
+    starting, or get stopped with it."""
+    pytest.importorskip('picamera')
+    from security.camera import MOTION_SPLITTER_PORT, PREVIEW_SPLITTER_PORT, Camera
+
+    class PortCamera(Camera):
+        """Records per splitter port like PiCamera, without the hardware."""
+
+        def __init__(self):
+            self.ports = set()
+            self.motion_detector = None
+            self.motion_detecting = False
+            self.motion_detected = threading.Event()
+            self.motion_detection_setting = (60, 10)
+            self.motion_analysis_size = None
+            self.profile = None
+            self.pir = None
+            self.recorder = None
+            self.exposure_speed = 20000
+
+        @property
+        def recording(self):
+            return bool(self.ports)
+
+        def start_recording(self, output, format=None, splitter_port=1, **kwargs):
+            assert splitter_port not in self.ports
+            self.ports.add(splitter_port)
+
+        def stop_recording(self, splitter_port=1):
+            self.ports.remove(splitter_port)
+
+        def close(self):
+            pass
+
+    camera = PortCamera()
+    camera.start_preview_stream(None)
+    camera.start_motion_detection()
+    assert camera.ports == {MOTION_SPLITTER_PORT, PREVIEW_SPLITTER_PORT}
+    camera.start_motion_detection()
+    camera.stop_motion_detection()
+    assert camera.ports == {PREVIEW_SPLITTER_PORT}
+    camera.stop_motion_detection()
+    assert camera.ports == {PREVIEW_SPLITTER_PORT}
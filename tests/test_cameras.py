@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from security.cameras import DEFAULT_CAMERA, CameraGroup
+from security.settings import Settings
+from security.threads.detect_motion import detect_motion
+
+CONFIG = """[main]
+mac_addresses=aa:aa:aa:bb:bb:bb
+telegram_bot_token=token
+thumbnail_size=0x0
+"""
+
+
+def settings_from(tmp_path, extra=''):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text(CONFIG + extra)
+    return Settings.from_file(str(path))
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return settings_from(
+        tmp_path,
+        'cameras=front,garden\ncamera_mode=photo\n'
+        '[camera:garden]\ncamera_num=1\ncamera_mode=gif\n'
+    )
+
+
+@pytest.fixture
+def cameras(settings, fake_camera):
+    return CameraGroup.from_settings(settings, backend=fake_camera)
+
+
+def test_single_camera_by_default(tmp_path, fake_camera):
+    cameras = CameraGroup.from_settings(settings_from(tmp_path), backend=fake_camera)
+    assert cameras.names() == [DEFAULT_CAMERA]
+    assert cameras.label(cameras.get()) == ''
+
+
+def test_per_camera_settings(cameras):
+    assert cameras.names() == ['front', 'garden']
+    front, garden = cameras
+    assert (front.settings.camera_num, front.settings.camera_mode) == (0, 'photo')
+    assert (garden.settings.camera_num, garden.settings.camera_mode) == (1, 'gif')
+    assert cameras.label(garden) == ' on garden'
+
+
+def test_get(cameras):
+    assert cameras.get().name == 'front'
+    assert cameras.get('Garden').name == 'garden'
+    with pytest.raises(KeyError):
+        cameras.get('porch')
+
+
+def test_apply_settings(tmp_path, cameras):
+    cameras.apply_settings(settings_from(
+        tmp_path,
+        'cameras=front,garden\n[camera:garden]\ncamera_mode=photo\n'
+    ))
+    assert [camera.settings.camera_mode for camera in cameras] == ['gif', 'photo']
+
+
+def test_detect_motion_per_camera(settings, cameras, fake_network, wait_for):
+    """Motion on one camera only captures from that camera."""
+    network = fake_network(settings)
+    for camera in cameras:
+        threading.Thread(target=detect_motion, args=(network, camera), daemon=True).start()
+    front, garden = cameras
+    network.state.update_state('armed')
+    assert wait_for(lambda: front.detecting and garden.detecting)
+    garden.motion_detected.set()
+    assert wait_for(lambda: garden.alarms == 1)
+    assert front.alarms == 0
+    assert garden.queue.get_nowait() == '/var/tmp/garden-1.jpg'
+    assert wait_for(lambda: garden.detecting)
+
+    network.state.update_state('disarmed')
+    assert wait_for(lambda: not front.detecting and not garden.detecting)
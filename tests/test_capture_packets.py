@@ -0,0 +1,95 @@
+import pytest
+
+from security.threads.capture_packets import calculate_filter, capture_packets, packet_mac, update_time
+
+
+class FakePacket(object):
+
+    def __init__(self, addr2=None, addr3=None):
+        self.addr2 = addr2
+        self.addr3 = addr3
+
+    def __getitem__(self, layer):
+        return self
+
+
+class FakeState(object):
+
+    def __init__(self):
+        self.macs = []
+
+    def update_last_mac(self, mac):
+        self.macs.append(mac)
+
+
+class FakeNetwork(object):
+
+    def __init__(self):
+        self.state = FakeState()
+
+
+MACS = ('aa:aa:aa:aa:aa:aa', 'bb:bb:bb:bb:bb:bb')
+
+
+def test_packet_mac():
+    assert packet_mac(FakePacket(addr2=MACS[1]), MACS) == MACS[1]
+    assert packet_mac(FakePacket(addr3=MACS[0]), MACS) == MACS[0]
+    assert packet_mac(FakePacket('cc:cc:cc:cc:cc:cc'), MACS) is None
+
+
+def test_update_time():
+    network = FakeNetwork()
+    assert update_time(network, MACS, FakePacket(addr2=MACS[0])) == MACS[0]
+    assert update_time(network, MACS, FakePacket()) is None
+    assert network.state.macs == [MACS[0]]
+
+
+def test_update_time_records():
+    recorded = []
+
+    class FakeRecorder(object):
+        record = recorded.append
+
+    packets = [FakePacket(addr2=MACS[0]), FakePacket()]
+    for packet in packets:
+        update_time(FakeNetwork(), MACS, packet, recorder=FakeRecorder())
+    assert recorded == packets
+
+
+def test_restarts_share_recorder(monkeypatch):
+    """A restart after sniffing fails carries on with the same recorder."""
+    scapy = pytest.importorskip('scapy.all')
+    packet = FakePacket(addr2=MACS[0])
+
+    def sniff(prn, **kwargs):
+        prn(packet)
+        raise OSError('interface went down')
+
+    class FakeSettings(object):
+        mac_addresses = MACS
+        network_interface = 'mon0'
+
+    recorded = []
+
+    class FakeRecorder(object):
+        record = recorded.append
+
+    monkeypatch.setattr(scapy, 'sniff', sniff)
+    network = FakeNetwork()
+    network.settings = FakeSettings()
+    network.my_mac_address = 'cc:cc:cc:cc:cc:cc'
+    recorder = FakeRecorder()
+    for _ in range(2):
+        with pytest.raises(OSError):
+            capture_packets(network, recorder)
+    assert recorded == [packet, packet]
+
+
+def test_calculate_filter():
+    assert calculate_filter(MACS, 'cc:cc:cc:cc:cc:cc') == (
+        '((wlan addr2 (aa:aa:aa:aa:aa:aa or bb:bb:bb:bb:bb:bb) '
+        'or wlan addr3 (aa:aa:aa:aa:aa:aa or bb:bb:bb:bb:bb:bb)) '
+        'and type mgt subtype probe-req) '
+        'or (wlan addr1 cc:cc:cc:cc:cc:cc '
+        'and wlan addr3 (aa:aa:aa:aa:aa:aa or bb:bb:bb:bb:bb:bb))'
+    )
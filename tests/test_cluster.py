@@ -0,0 +1,192 @@
+import os
+import socket
+import time
+
+import pytest
+
+import security.cluster
+from security.cameras import CameraGroup
+from security.cluster import (
+    Coordinator, Node, parse_address, recv_frame, send_frame
+)
+
+HEARTBEAT_INTERVAL = 0.05
+HEARTBEAT_TIMEOUT = 0.5
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def coordinator(tmp_path, fake_network):
+    media = tmp_path / 'coordinator'
+    media.mkdir()
+    coordinator = Coordinator(
+        fake_network(),
+        CameraGroup([]),
+        address=('127.0.0.1', 0),
+        token='secret',
+        media_directory=str(media),
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        heartbeat_timeout=HEARTBEAT_TIMEOUT
+    )
+    coordinator.start()
+    yield coordinator
+    coordinator.stop()
+
+
+@pytest.fixture
+def make_node(tmp_path, fake_camera):
+    def make_node(coordinators, token='secret', name='node1', size=1000):
+        directory = tmp_path / name
+        directory.mkdir(exist_ok=True)
+        camera = fake_camera('front', directory=str(directory), size=size)
+        node = Node(
+            name,
+            CameraGroup([camera]),
+            [c.address for c in coordinators],
+            token=token,
+            heartbeat_interval=HEARTBEAT_INTERVAL,
+            heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            chunk_size=256
+        )
+        return node, camera
+    return make_node
+
+
+@pytest.fixture
+def node(coordinator, make_node):
+    node, camera = make_node([coordinator])
+    node.start()
+    assert node.connected.wait(3)
+    yield node
+    node.stop()
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('10.0.0.2:7400', ('10.0.0.2', 7400)),
+    (':7400', ('', 7400)),
+    ('coordinator', ('coordinator', 7300)),
+])
+def test_parse_address(value, expected):
+    assert parse_address(value) == expected
+
+
+def test_frames():
+    a, b = socket.socketpair()
+    send_frame(a, {'type': 'media_chunk', 'offset': 3}, b'\x00\xff')
+    send_frame(a, {'type': 'heartbeat'})
+    assert recv_frame(b) == ({'type': 'media_chunk', 'offset': 3}, b'\x00\xff')
+    assert recv_frame(b) == ({'type': 'heartbeat'}, b'')
+    a.close()
+    b.close()
+
+
+def test_state_follows_coordinator(coordinator, node, wait_for):
+    assert coordinator.cameras.names() == ['node1-front']
+    assert node.state.current == 'disarmed'
+    coordinator.network.state.update_state('armed')
+    assert wait_for(lambda: node.state.current == 'armed')
+
+
+def test_wrong_token(coordinator, make_node):
+    node, _ = make_node([coordinator], token='wrong')
+    node.start()
+    assert not node.connected.wait(0.3)
+    assert coordinator.nodes == {}
+    node.stop()
+
+
+def test_alarm_media(coordinator, node, wait_for):
+    camera = node.cameras.get('front')
+    path = camera.capture()
+    camera.queue.put(path)
+    remote = coordinator.cameras.get('node1-front')
+    received = remote.queue.get(timeout=3)
+    assert os.path.basename(received) == 'node1-' + os.path.basename(path)
+    assert read(received) == read(path)
+    assert wait_for(lambda: not node.outbox)
+
+
+def test_capture_request(coordinator, node):
+    path = coordinator.cameras.get('node1-front').take_photo().result(timeout=3)
+    assert read(path) == read(os.path.join(node.cameras.get('front').directory, 'front-1.jpg'))
+
+
+def test_capture_from_offline_node(coordinator, node, wait_for):
+    remote = coordinator.cameras.get('node1-front')
+    node.stop()
+    assert wait_for(lambda: coordinator.nodes == {})
+    with pytest.raises(security.cluster.ClusterError):
+        remote.take_photo().result(timeout=1)
+
+
+def test_capture_pending_when_node_disconnects(coordinator):
+    sock = socket.create_connection(coordinator.address)
+    send_frame(sock, {'type': 'hello', 'node': 'raw', 'cameras': ['front'], 'token': 'secret'})
+    assert recv_frame(sock)[0]['type'] == 'welcome'
+    future = coordinator.cameras.get('raw-front').take_photo()
+    while recv_frame(sock)[0]['type'] != 'capture':
+        pass
+    sock.close()
+    with pytest.raises(security.cluster.ClusterError):
+        future.result(timeout=3)
+    assert coordinator.requests == {}
+    assert coordinator.offline == {'raw'}
+
+
+def test_upload_resumes(monkeypatch, coordinator, node):
+    """Only the part the coordinator doesn't have is sent."""
+    camera = node.cameras.get('front')
+    path = camera.capture()
+    partial = os.path.join(coordinator.media_directory, 'node1-' + os.path.basename(path) + '.part')
+    with open(partial, 'wb') as f:
+        f.write(read(path)[:600])
+    offsets = []
+    send = security.cluster.send_frame
+
+    def spy(sock, header, body=b''):
+        if header['type'] == 'media_chunk':
+            offsets.append(header['offset'])
+        send(sock, header, body)
+
+    monkeypatch.setattr(security.cluster, 'send_frame', spy)
+    camera.queue.put(path)
+    received = coordinator.cameras.get('node1-front').queue.get(timeout=3)
+    assert read(received) == read(path)
+    assert offsets == [600, 856]
+
+
+def test_node_offline_after_heartbeat_timeout(coordinator, wait_for):
+    sock = socket.create_connection(coordinator.address)
+    send_frame(sock, {'type': 'hello', 'node': 'silent', 'cameras': [], 'token': 'secret'})
+    assert recv_frame(sock)[0]['type'] == 'welcome'
+    started = time.time()
+    assert wait_for(lambda: 'silent' not in coordinator.nodes)
+    assert time.time() - started >= HEARTBEAT_TIMEOUT * 0.9
+    assert coordinator.network.state.notifications.get(timeout=1) == 'Node silent is offline'
+    sock.close()
+
+
+def test_failover(coordinator, make_node, fake_network, wait_for):
+    standby = Coordinator(
+        fake_network(),
+        CameraGroup([]),
+        address=('127.0.0.1', 0),
+        token='secret',
+        media_directory=coordinator.media_directory,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        heartbeat_timeout=HEARTBEAT_TIMEOUT
+    )
+    standby.start()
+    standby.network.state.update_state('armed')
+    node, _ = make_node([coordinator, standby])
+    node.start()
+    assert wait_for(lambda: node.coordinator == coordinator.address)
+    coordinator.stop()
+    assert wait_for(lambda: node.coordinator == standby.address and node.connected.is_set())
+    assert wait_for(lambda: node.state.current == 'armed')
+    node.stop()
+    standby.stop()
@@ -0,0 +1,135 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from security.cameras import CameraGroup
+from security.control import ControlServer, register_state_commands, request
+
+
+@pytest.fixture
+def network(fake_network):
+    return fake_network()
+
+
+@pytest.fixture
+def camera(fake_camera):
+    return fake_camera('front')
+
+
+@pytest.fixture
+def server(tmp_path, network, camera, fake_camera):
+    server = ControlServer(str(tmp_path / 'control.sock'))
+    register_state_commands(server, network, CameraGroup([camera, fake_camera('garden')]))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_status(server, network):
+    response = request('status', path=server.path)
+    assert response['ok']
+    assert response['result']['current'] == 'disarmed'
+
+
+def test_status_text(server):
+    response = request('status_text', path=server.path)
+    assert response['result'].startswith('*rpi-security status*')
+
+
+def test_disable_and_enable(server, network):
+    assert request('disable', path=server.path)['result']['current'] == 'disabled'
+    assert network.state.current == 'disabled'
+    assert request('enable', path=server.path)['result']['current'] == 'disarmed'
+    assert network.state.notifications.get_nowait() == 'rpi-security is now disabled'
+    assert network.state.notifications.get_nowait() == 'rpi-security is now disarmed'
+
+
+def test_unknown_command(server):
+    response = request('explode', path=server.path)
+    assert response == {'ok': False, 'error': 'Unknown command: explode'}
+
+
+def test_bad_args(server):
+    response = request('status', {'verbose': True}, path=server.path)
+    assert not response['ok']
+
+
+def test_help(server):
+    result = request('help', path=server.path)['result']
+    assert result['status'] == 'Current alarm state.'
+    assert 'disable' in result
+
+
+def test_future_result(server, camera):
+    """Commands returning a Future are answered when it resolves."""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(request('photo', path=server.path)))
+    thread.start()
+    time.sleep(0.05)
+    # Other clients are still served while the photo is pending.
+    assert request('status', path=server.path)['ok']
+    camera.future.set_result('/var/tmp/photo.jpg')
+    thread.join(2)
+    assert result == {'ok': True, 'result': '/var/tmp/photo.jpg'}
+
+
+def test_camera_argument(server, camera):
+    assert request('cameras', path=server.path)['result'] == ['front', 'garden']
+    assert request('photo', {'camera': 'porch'}, path=server.path) == {
+        'ok': False, 'error': 'Unknown camera: porch'
+    }
+    camera.future.set_result('/var/tmp/photo.jpg')
+    assert request('photo', {'camera': 'front'}, path=server.path)['result'] == '/var/tmp/photo.jpg'
+
+
+def test_invalid_json(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    sock.sendall(b'not json\n')
+    response = json.loads(sock.makefile().readline())
+    assert not response['ok']
+    sock.close()
+
+
+def test_pipelined_requests(server):
+    """Several requests on one connection are answered with their ids."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server.path)
+    sock.sendall(b''.join(
+        json.dumps({'command': 'status', 'id': i}).encode('utf-8') + b'\n'
+        for i in range(50)
+    ))
+    reader = sock.makefile()
+    ids = [json.loads(reader.readline())['id'] for _ in range(50)]
+    assert ids == list(range(50))
+    sock.close()
+
+
+def test_many_clients(server):
+    results = []
+
+    def client():
+        for _ in range(20):
+            results.append(request('status', path=server.path)['ok'])
+
+    threads = [threading.Thread(target=client) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == [True] * 200
+
+
+def test_profile(server):
+    response = request('profile', {'seconds': 0.2, 'interval': 0.01}, path=server.path)
+    assert response['ok']
+    assert 'control_server' in response['result']['threads']
+    assert response['result']['collapsed'].startswith(tuple(response['result']['threads']))
+
+
+def test_profile_invalid(server):
+    response = request('profile', {'seconds': -1}, path=server.path)
+    assert not response['ok']
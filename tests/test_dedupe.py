@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from security.dedupe import HASH_BITS, HASH_SIZE, Deduplicator, HashIndex, dhash, hash_array
+from security.thumbnails import ThumbnailPool
+
+
+@pytest.fixture
+def photos(tmp_path):
+    """A scene, the scene brighter with noise, and someone in it."""
+    rng = np.random.default_rng(0)
+    x = np.arange(640)[None, :] / 640.0
+    y = np.arange(480)[:, None] / 480.0
+    scene = 0.3 + 0.4 * np.sin(6 * x) * np.cos(4 * y)
+    frames = {
+        'scene': scene,
+        'brighter': scene * 1.15 + rng.normal(0, 0.02, scene.shape),
+        'person': scene.copy(),
+    }
+    frames['person'][100:420, 260:380] = 0.95
+    paths = {}
+    for name, frame in frames.items():
+        paths[name] = str(tmp_path / '{0}.jpg'.format(name))
+        Image.fromarray((np.clip(frame, 0, 1) * 255).astype(np.uint8)).save(paths[name], quality=85)
+    return paths
+
+
+def bits(a, b):
+    return bin(a ^ b).count('1')
+
+
+def test_hash_array():
+    pixels = np.zeros((HASH_SIZE, HASH_SIZE + 1), dtype=np.int16)
+    assert hash_array(pixels) == 0
+    pixels[:, 0] = 1
+    # Only the first column is brighter than the next.
+    assert bits(hash_array(pixels), 0) == HASH_SIZE
+
+
+def test_dhash(photos):
+    scene = dhash(photos['scene'])
+    assert bits(scene, dhash(photos['brighter'])) <= 8
+    assert bits(scene, dhash(photos['person'])) > 16
+
+
+def test_dhash_gif(tmp_path, photos):
+    path = str(tmp_path / 'scene.gif')
+    with Image.open(photos['scene']) as image:
+        image.save(path)
+    assert bits(dhash(path), dhash(photos['scene'])) <= 8
+
+
+def test_index_nearest():
+    index = HashIndex(size=4)
+    assert index.nearest(0, now=0, window=60) is None
+    index.add(0b1111, now=0)
+    index.add(0b1, now=50)
+    assert index.nearest(0b11, now=55, window=60) == 1
+    # The first hash has left the window.
+    assert index.nearest(0b1111, now=100, window=60) == 3
+
+
+def test_index_is_bounded():
+    index = HashIndex(size=2)
+    for value in (2 ** HASH_BITS - 1, 0, 0):
+        index.add(value, now=0)
+    assert index.nearest(2 ** HASH_BITS - 1, now=0, window=60) == HASH_BITS
+
+
+def test_filter(photos):
+    deduplicator = Deduplicator()
+    kept, dropped = deduplicator.filter(
+        'front', [photos['scene'], photos['brighter'], photos['person']], 600, 8, now=0
+    )
+    assert kept == [photos['scene'], photos['person']]
+    assert dropped == [photos['brighter']]
+    for photo in kept:
+        deduplicator.sent('front', photo, now=0)
+    # Later events are compared with what was sent.
+    assert deduplicator.filter('front', [photos['scene']], 600, 8, now=300) == ([], [photos['scene']])
+    assert deduplicator.filter('front', [photos['scene']], 600, 8, now=900) == ([photos['scene']], [])
+    # Each camera has its own index.
+    assert deduplicator.filter('back', [photos['scene']], 600, 8, now=300) == ([photos['scene']], [])
+
+
+def test_filter_remembers_only_what_was_sent(photos):
+    deduplicator = Deduplicator()
+    assert deduplicator.filter('front', [photos['scene']], 600, 8, now=0) == ([photos['scene']], [])
+    # It failed to send, so the next one like it is kept.
+    assert deduplicator.filter('front', [photos['brighter']], 600, 8, now=10) == ([photos['brighter']], [])
+    deduplicator.sent('front', photos['brighter'], now=10)
+    # Photos from an earlier event, or never kept, are ignored.
+    deduplicator.sent('front', photos['scene'], now=10)
+    deduplicator.sent('back', photos['scene'], now=10)
+    assert deduplicator.filter('front', [photos['scene']], 600, 8, now=20) == ([], [photos['scene']])
+    assert deduplicator.indexes['front'].added == 1
+
+
+def test_filter_pool(photos):
+    pool = ThumbnailPool(workers=2)
+    try:
+        kept, dropped = Deduplicator(pool).filter('front', [photos['scene'], photos['brighter']], 600, 8)
+    finally:
+        pool.shutdown()
+    assert (kept, dropped) == ([photos['scene']], [photos['brighter']])
+
+
+def test_filter_keeps_what_it_cant_hash(tmp_path, photos):
+    broken = str(tmp_path / 'broken.jpg')
+    with open(broken, 'wb') as f:
+        f.write(b'not a jpeg')
+    video = str(tmp_path / 'event.mp4')
+    kept, dropped = Deduplicator().filter('front', [photos['scene'], broken, video, broken], 600, 8)
+    assert kept == [photos['scene'], broken, video, broken]
+    assert dropped == []
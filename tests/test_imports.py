@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Milliseconds. Generous so slow CI machines pass, the heavy dependencies
+# alone take well over a second to import.
+IMPORT_BUDGET_MS = 250
+
+HEAVY_MODULES = ('picamera', 'scapy', 'telegram', 'numpy', 'PIL', 'netaddr', 'netifaces', 'RPi')
+
+
+def import_time(module):
+    """Return {module: cumulative microseconds} from `python -X importtime`."""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {0}'.format(module)],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        check=True
+    )
+    times = {}
+    for line in process.stderr.decode('utf-8').splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', [
+    'security',
+    'security.threads',
+    'security.settings',
+    'security.state',
+    'security.util',
+    'security.scheduler',
+    'security.preview',
+    'security.thumbnails',
+    'security.cameras',
+    'security.cluster',
+    'security.network',
+    'security.recorder',
+    'security.profiler',
+    'security.supervisor',
+    'security.control',
+    'security.threads.capture_packets',
+    'security.threads.telegram_bot',
+    'security.threads.process_photos',
+    'security.threads.detect_motion',
+    'security.threads.switch_profiles',
+    'security.profiles',
+    'security.pir',
+    'security.verifier',
+    'security.dedupe',
+    'security.uplink',
+    'security.logs',
+    'security.store',
+    'security.threads.save_state',
+])
+def test_no_heavy_imports(module):
+    """Only the subsystems that need them import the heavy dependencies."""
+    times = import_time(module)
+    assert [name for name in HEAVY_MODULES if name in times] == []
+
+
+def test_import_budget():
+    times = import_time('security, security.threads, security.network, security.settings')
+    total_ms = times['security'] / 1000.0 + sum(
+        times[name] for name in ('security.threads', 'security.network')
+    ) / 1000.0
+    assert total_ms < IMPORT_BUDGET_MS
+
+
+def test_lazy_attributes():
+    """The names the package used to import eagerly are still available."""
+    code = (
+        'import sys, security, security.threads\n'
+        'assert security.State.__name__ == "State"\n'
+        'assert security.Settings.__name__ == "Settings"\n'
+        'assert callable(security.exit_clean)\n'
+        'assert security.threads.process_photos.__name__ == "process_photos"\n'
+        'assert "security.camera" not in sys.modules\n'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
@@ -0,0 +1,106 @@
+import logging
+from queue import SimpleQueue
+
+from security.logs import DroppingQueueHandler, LogPipeline, RateLimitFilter, set_debug
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self, level=logging.DEBUG):
+        super(ListHandler, self).__init__(level)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def make_logger(name):
+    target = logging.getLogger(name)
+    target.propagate = False
+    target.handlers = []
+    return target
+
+
+def record(level=logging.DEBUG, lineno=1, msg='Packet detected from %s'):
+    return logging.LogRecord('test', level, 'capture_packets.py', lineno, msg, ('aa',), None)
+
+
+def test_rate_limit():
+    limiter = RateLimitFilter(rate=1, burst=2)
+    assert [limiter.filter(record()) for _ in range(4)] == [True, True, False, False]
+    # Other lines and warnings have their own limits.
+    assert limiter.filter(record(lineno=2))
+    assert limiter.filter(record(logging.WARNING))
+    assert limiter.suppressed == 2
+    limiter.sites[('capture_packets.py', 1)][1] -= 1
+    passed = record()
+    assert limiter.filter(passed)
+    assert passed.getMessage() == 'Packet detected from aa [2 similar suppressed]'
+
+
+def test_queue_drops_when_full():
+    handler = DroppingQueueHandler(SimpleQueue(), size=2)
+    for _ in range(5):
+        handler.handle(record())
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    # Records are queued unformatted.
+    assert handler.queue.get().args == ('aa',)
+
+
+def test_pipeline():
+    target = make_logger('test_pipeline')
+    info, debug = ListHandler(logging.INFO), ListHandler()
+    pipeline = LogPipeline([info, debug], rate=1000, burst=1000)
+    pipeline.start(target)
+    try:
+        target.debug('Packet detected from %s', 'aa')
+        target.info('Motion detected')
+    finally:
+        pipeline.stop()
+    assert info.messages == ['Motion detected']
+    assert debug.messages == ['Packet detected from aa', 'Motion detected']
+    assert pipeline.stats() == {'queued': 0, 'dropped': 0, 'suppressed': 0}
+
+
+def test_pipeline_level():
+    """Debug records aren't created unless a handler writes them."""
+    target = make_logger('test_pipeline_level')
+    syslog, stdout = ListHandler(logging.INFO), ListHandler(logging.CRITICAL)
+    pipeline = LogPipeline([syslog, stdout])
+    pipeline.start(target)
+    try:
+        assert not target.isEnabledFor(logging.DEBUG)
+        pipeline.handlers[0].setLevel(logging.DEBUG)
+        pipeline.update_level(target)
+        assert target.isEnabledFor(logging.DEBUG)
+    finally:
+        pipeline.stop()
+
+
+def test_set_debug():
+    root = logging.getLogger()
+    level = root.level
+    pipeline = LogPipeline([ListHandler(logging.INFO), ListHandler(logging.CRITICAL)])
+    try:
+        set_debug(pipeline, True)
+        assert pipeline.handlers[0].level == logging.DEBUG
+        assert root.level == logging.DEBUG
+        set_debug(pipeline, False)
+        assert root.level == logging.INFO
+    finally:
+        root.setLevel(level)
+
+
+def test_stop_reports_drops():
+    target = make_logger('test_stop_reports_drops')
+    handler = ListHandler()
+    pipeline = LogPipeline([handler], queue_size=1)
+    pipeline.start(target)
+    # The queue fills while the listener is stopped.
+    pipeline.listener.stop()
+    target.warning('first')
+    target.warning('second')
+    pipeline.listener.start()
+    pipeline.stop()
+    assert handler.messages == ['first', 'Dropped 1 log records']
@@ -0,0 +1,45 @@
+import numpy as np
+
+from security.motion import MOTION_DTYPE, MotionAnalyser, count_motion_vectors, motion_grid, scale_thresholds
+
+
+def frame(vectors, length=20, shape=(45, 81)):
+    """A frame with `vectors` macroblocks moving `length` to the right."""
+    a = np.zeros(shape, dtype=MOTION_DTYPE)
+    a['x'].flat[:vectors] = length
+    return a
+
+
+def test_count_motion_vectors():
+    a = frame(5, length=-100)
+    a['y'].flat[5] = 61
+    a['y'].flat[6] = 60
+    assert count_motion_vectors(a, 60) == 6
+
+
+def test_analyse():
+    analyser = MotionAnalyser(magnitude=10, vectors=3)
+    assert not analyser.analyse(frame(3), now=5)
+    assert analyser.analyse(frame(4), now=5)
+    assert not analyser.analyse(frame(4, length=10), now=5)
+
+
+def test_settle_time():
+    analyser = MotionAnalyser(magnitude=10, vectors=3, settle_time=1)
+    analyser.start(now=100)
+    assert not analyser.analyse(frame(50), now=100.5)
+    assert analyser.analyse(frame(50), now=101)
+
+
+def test_motion_grid():
+    assert motion_grid((1280, 720)) == (45, 81)
+    assert motion_grid((320, 240)) == (15, 21)
+    # Partial macroblocks count.
+    assert motion_grid((1920, 1080)) == (68, 121)
+
+
+def test_scale_thresholds():
+    assert scale_thresholds((60, 10), (1280, 720), (1280, 720)) == (60, 10)
+    assert scale_thresholds((60, 100), (1280, 720), (640, 360)) == (30, 26)
+    # At least one vector and one pixel.
+    assert scale_thresholds((2, 10), (1280, 720), (320, 180)) == (1, 1)
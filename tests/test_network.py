@@ -0,0 +1,112 @@
+import os
+from threading import Lock
+
+import pytest
+import yaml
+
+from security.network import Network
+from security.settings import Settings
+from security.uplink import UplinkEstimator
+
+CONFIG = """[main]
+mac_addresses=aa:aa:aa:bb:bb:bb
+telegram_bot_token=token
+"""
+
+
+@pytest.fixture
+def network(tmp_path):
+    """A Network without the system checks or Telegram connection."""
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text(CONFIG)
+    network = Network.__new__(Network)
+    network.config_file = str(path)
+    network.settings = Settings.from_file(network.config_file)
+    return network
+
+
+def rewrite(network, extra):
+    with open(network.config_file, 'w') as f:
+        f.write(CONFIG + extra)
+
+
+def test_reload_swaps_settings(network):
+    old = network.settings
+    rewrite(network, 'packet_timeout=60\ncamera_mode=photo\n')
+    assert network.reload_settings() == {'packet_timeout', 'camera_mode'}
+    assert network.settings is not old
+    assert network.settings.packet_timeout == 60
+    assert old.packet_timeout == 700
+
+
+def test_reload_keeps_settings_on_error(network):
+    old = network.settings
+    rewrite(network, 'packet_timeout=soon\n')
+    assert network.reload_settings() is None
+    assert network.settings is old
+
+
+def test_reload_warns_on_restart_required(network, caplog):
+    rewrite(network, 'network_interface=mon1\n')
+    assert network.reload_settings() == {'network_interface'}
+    assert 'Restart required for changes to: network_interface' in caplog.text
+
+
+def test_reload_unchanged(network):
+    assert network.reload_settings() == set()
+
+
+class FakeBot(object):
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def sendPhoto(self, chat_id, photo, caption, timeout):
+        with photo:
+            photo.read()
+        if self.fail:
+            raise Exception('Timed out')
+
+
+def test_send_file_measures_uplink(network, tmp_path):
+    network.saved_data = {'telegram_chat_id': 1}
+    network.uplink = UplinkEstimator()
+    network._bot = FakeBot()
+    network._bot_lock = Lock()
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'x' * 10000)
+    assert network.telegram_send_file(str(path))
+    assert network.uplink.bytes_per_second > 0
+    network._bot = FakeBot(fail=True)
+    network.uplink.bytes_per_second = None
+    assert not network.telegram_send_file(str(path))
+    assert network.uplink.bytes_per_second > 0
+    assert not network.telegram_send_file(str(tmp_path / 'photo.txt'))
+
+
+def test_save_telegram_chat_id(network, tmp_path):
+    network.data_file = str(tmp_path / 'data.yaml')
+    network.saved_data = {'other': 'kept'}
+    network._data_lock = Lock()
+    network.save_telegram_chat_id(1234)
+    with open(network.data_file) as f:
+        assert yaml.safe_load(f) == {'other': 'kept', 'telegram_chat_id': 1234}
+    assert sorted(os.listdir(str(tmp_path))) == ['data.yaml', 'rpi-security.conf']
+
+
+class FakeTime(object):
+
+    def sleep(self, seconds):
+        pass
+
+
+def test_arp_ping_heartbeats(network, monkeypatch):
+    """Each ping can take a second, the supervisor hears from the thread between them."""
+    scapy = pytest.importorskip('scapy.all')
+    calls = []
+    monkeypatch.setattr(scapy, 'srp', lambda *args, **kwargs: calls.append('ping') or ([], []))
+    monkeypatch.setattr('security.network.heartbeat', lambda: calls.append('heartbeat'))
+    monkeypatch.setattr('security.network.time', FakeTime())
+    network.network_address = '192.168.1.0/24'
+    network.arp_ping_macs(repeat=2)
+    assert calls == ['heartbeat', 'ping'] * 2
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from security.motion import MOTION_DTYPE, MotionAnalyser
+from security.pir import PIRSensor
+from security.recorder import PIRRecorder, read_pir_trace
+from security.settings import Settings
+from security.threads.detect_motion import detect_motion
+
+
+class FakeGPIO(object):
+    """Works like RPi.GPIO, `set` changes an input and calls its callback."""
+    BCM = 11
+    IN = 1
+    PUD_DOWN = 21
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.callbacks = {}
+
+    def setmode(self, mode):
+        assert mode == self.BCM
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels.setdefault(pin, 0)
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        assert pin not in self.callbacks
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        del self.callbacks[pin]
+
+    def set(self, pin, level):
+        self.levels[pin] = level
+        self.callbacks[pin](pin)
+
+
+def make_settings(**overrides):
+    return Settings(mac_addresses=('aa:aa:aa:bb:bb:bb',), telegram_bot_token='token', **overrides)
+
+
+@pytest.fixture
+def gpio():
+    return FakeGPIO()
+
+
+@pytest.fixture
+def sensor(gpio):
+    sensor = PIRSensor(14, hold=5, gpio=gpio)
+    yield sensor
+    sensor.close()
+
+
+def test_hold_after_output_falls(sensor):
+    assert not sensor.active(now=100)
+    sensor.edge(True, now=100)
+    assert sensor.active(now=200)
+    sensor.edge(False, now=200)
+    assert sensor.active(now=204.9)
+    assert not sensor.active(now=205)
+
+
+def test_interrupt(gpio, sensor):
+    gpio.set(14, 1)
+    assert sensor.level and sensor.active()
+    # A bounce that reads the same level again isn't an edge.
+    gpio.set(14, 1)
+    assert sensor.edges == 1
+
+
+def test_wait_wakes_on_interrupt(gpio, sensor):
+    assert not sensor.wait(0.05)
+    threading.Timer(0.05, gpio.set, (14, 1)).start()
+    started = time.monotonic()
+    assert sensor.wait(2)
+    assert time.monotonic() - started < 1
+
+
+def test_from_settings_shares_sensor(gpio):
+    assert PIRSensor.from_settings(make_settings(), gpio=gpio) is None
+    settings = make_settings(pir_mode='gate', pir_pin=17, pir_hold=2)
+    sensor = PIRSensor.from_settings(settings, gpio=gpio)
+    try:
+        assert sensor.hold == 2
+        assert PIRSensor.from_settings(settings, gpio=gpio) is sensor
+    finally:
+        sensor.close()
+    assert gpio.callbacks == {}
+
+
+def test_recorded_edges(tmp_path, gpio):
+    path = str(tmp_path / 'pir.pir')
+    sensor = PIRSensor(14, gpio=gpio, recorder=PIRRecorder(path))
+    sensor.edge(True, now=10)
+    sensor.edge(False, now=12.5)
+    sensor.recorder.close()
+    sensor.close()
+    with open(path, 'a') as f:
+        f.write('13.0')
+    assert read_pir_trace(path) == [(10.0, True), (12.5, False)]
+
+
+def test_analyser_needs_both(sensor):
+    a = np.zeros((45, 81), dtype=MOTION_DTYPE)
+    a['x'].flat[:20] = 100
+    analyser = MotionAnalyser(settle_time=0, gate=sensor.active)
+    assert not analyser.analyse(a, now=100)
+    sensor.edge(True, now=100)
+    assert analyser.analyse(a, now=101)
+    sensor.edge(False, now=101)
+    assert not analyser.analyse(a, now=106)
+
+
+def test_detect_motion_wakes_on_pir(gpio, fake_camera, fake_network, wait_for):
+    sensor = PIRSensor(14, hold=0.2, gpio=gpio)
+    camera = fake_camera(wake_sensor=sensor)
+    network = fake_network()
+    network.state.update_state('armed')
+    threading.Thread(target=detect_motion, args=(network, camera), daemon=True).start()
+    try:
+        time.sleep(0.2)
+        assert not camera.detecting
+        gpio.set(14, 1)
+        assert wait_for(lambda: camera.detecting)
+        gpio.set(14, 0)
+        time.sleep(0.1)
+        assert camera.detecting
+        assert wait_for(lambda: not camera.detecting)
+    finally:
+        sensor.close()
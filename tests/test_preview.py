@@ -0,0 +1,170 @@
+import socket
+import threading
+import time
+from http.client import HTTPConnection
+
+import pytest
+
+from security.preview import FrameBuffer, PreviewServer
+
+
+def make_frame(n):
+    return b'\xff\xd8' + str(n).encode('ascii') + b'\xff\xd9'
+
+
+@pytest.fixture
+def frames():
+    return FrameBuffer()
+
+
+@pytest.fixture
+def server(frames):
+    server = PreviewServer(frames, address=('127.0.0.1', 0), max_clients=2, send_timeout=1, frame_timeout=0.1)
+    server.start()
+    yield server
+    server.stop()
+
+
+def read_frame(response):
+    """Read one multipart part from a stream response."""
+    boundary = response.fp.readline()
+    assert boundary == b'--FRAME\r\n'
+    headers = {}
+    while True:
+        line = response.fp.readline().strip()
+        if not line:
+            break
+        key, value = line.decode('ascii').split(': ')
+        headers[key] = value
+    frame = response.fp.read(int(headers['Content-Length']))
+    response.fp.readline()
+    return frame
+
+
+def open_stream(server):
+    connection = HTTPConnection('127.0.0.1', server.server_address[1], timeout=2)
+    connection.request('GET', '/stream.mjpg')
+    return connection, connection.getresponse()
+
+
+def test_write_publishes_complete_frames(frames):
+    """A frame is published once its end marker has been written."""
+    frames.write(b'\xff\xd8abc')
+    assert frames.sequence == 0
+    frames.write(b'def\xff\xd9')
+    assert frames.wait(0, timeout=0) == (1, b'\xff\xd8abcdef\xff\xd9')
+
+
+def test_wait_returns_latest_frame(frames):
+    """A slow reader skips straight to the newest frame."""
+    for n in range(5):
+        frames.write(make_frame(n))
+    assert frames.wait(0, timeout=0) == (5, make_frame(4))
+    assert frames.wait(5, timeout=0) == (5, None)
+
+
+def test_close_wakes_waiters(frames):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(frames.wait(0)))
+    thread.start()
+    frames.close()
+    thread.join(1)
+    assert result == [(0, None)]
+
+
+def test_stream_sends_frames(server, frames):
+    """Clients receive frames as multipart JPEG parts."""
+    connection, response = open_stream(server)
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'multipart/x-mixed-replace; boundary=FRAME'
+    frames.write(make_frame(1))
+    assert read_frame(response) == make_frame(1)
+    frames.write(make_frame(2))
+    assert read_frame(response) == make_frame(2)
+    connection.close()
+
+
+def test_stream_shared_between_clients(server, frames):
+    """Every client gets the same encoded frame."""
+    streams = [open_stream(server) for _ in range(2)]
+    for _, response in streams:
+        assert response.status == 200
+    frames.write(make_frame(1))
+    for connection, response in streams:
+        assert read_frame(response) == make_frame(1)
+        connection.close()
+
+
+def test_max_clients(server, frames):
+    """Viewers over the cap are turned away."""
+    streams = [open_stream(server) for _ in range(2)]
+    connection, response = open_stream(server)
+    assert response.status == 503
+    connection.close()
+    for connection, _ in streams:
+        connection.close()
+
+
+def test_client_slot_released_on_disconnect(server, frames):
+    connection, response = open_stream(server)
+    frames.write(make_frame(1))
+    read_frame(response)
+    response.close()
+    connection.close()
+    # The server notices on its next write.
+    deadline = time.time() + 2
+    while server.clients and time.time() < deadline:
+        frames.write(make_frame(2))
+        time.sleep(0.01)
+    assert server.clients == 0
+
+
+def test_stream_ends_when_frames_close(server, frames, wait_for):
+    """Clients are let go rather than spun on once the camera stops."""
+    connection, response = open_stream(server)
+    frames.write(make_frame(1))
+    read_frame(response)
+    frames.close()
+    assert wait_for(lambda: server.clients == 0)
+    assert response.fp.readline() == b''
+    connection.close()
+
+
+def test_stalled_client_is_dropped(frames):
+    """A client that stops reading doesn't hold the encoder or a slot."""
+    server = PreviewServer(frames, address=('127.0.0.1', 0), max_clients=1, send_timeout=0.2, frame_timeout=0.05)
+    server.start()
+    try:
+        stalled = socket.create_connection(server.server_address)
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.sendall(b'GET /stream.mjpg HTTP/1.0\r\n\r\n')
+        while not server.clients:
+            time.sleep(0.01)
+        big = b'\xff\xd8' + b'x' * 256 * 1024 + b'\xff\xd9'
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            frames.write(big)
+            if not server.clients:
+                break
+            time.sleep(0.05)
+        assert server.clients == 0
+        stalled.close()
+    finally:
+        server.stop()
+
+
+def test_snapshot(server, frames):
+    frames.write(make_frame(7))
+    connection = HTTPConnection('127.0.0.1', server.server_address[1], timeout=2)
+    connection.request('GET', '/snapshot.jpg')
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.read() == make_frame(7)
+    connection.close()
+
+
+def test_snapshot_without_frames(server):
+    connection = HTTPConnection('127.0.0.1', server.server_address[1], timeout=2)
+    connection.request('GET', '/snapshot.jpg')
+    assert connection.getresponse().status == 503
+    connection.close()
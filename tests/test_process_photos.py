@@ -0,0 +1,57 @@
+import pytest
+
+from security.threads.process_photos import send_photos
+
+
+class FakeEncoder(object):
+
+    def __init__(self):
+        self.targets = []
+
+    def fit(self, path, seconds):
+        self.targets.append(seconds)
+        return path + '-fit'
+
+
+class FakeDeduplicator(object):
+
+    def __init__(self):
+        self.photos = []
+
+    def sent(self, camera, photo, now=None):
+        self.photos.append((camera, photo))
+
+
+@pytest.fixture
+def network(fake_network):
+    network = fake_network()
+    network.state.update_state('armed')
+    return network
+
+
+def test_send_photos_caption(network, fake_camera):
+    """The caption only goes with the first file."""
+    send_photos(network, fake_camera(), ['a.jpg', 'b.jpg'], 'Score 0.91')
+    assert network.sent == [('a.jpg', 'Score 0.91'), ('b.jpg', None)]
+
+
+def test_send_photos_encoder(network, fake_camera):
+    """Each file is given its share of upload_target."""
+    encoder = FakeEncoder()
+    send_photos(network, fake_camera(), ['a.jpg', 'b.jpg', 'c.jpg'], encoder=encoder)
+    assert network.sent == [('a.jpg-fit', None), ('b.jpg-fit', None), ('c.jpg-fit', None)]
+    assert encoder.targets == [2.0, 2.0, 2.0]
+
+
+def test_send_photos_deduplicator(network, fake_camera):
+    """Only photos that were sent are remembered."""
+    network.unsent.add('b.jpg')
+    deduplicator = FakeDeduplicator()
+    send_photos(network, fake_camera('front'), ['a.jpg', 'b.jpg', 'c.jpg'], deduplicator=deduplicator)
+    assert deduplicator.photos == [('front', 'a.jpg'), ('front', 'c.jpg')]
+
+
+def test_send_photos_stops_when_disarmed(network, fake_camera):
+    network.state.update_state('disarmed')
+    send_photos(network, fake_camera(), ['a.jpg'])
+    assert network.sent == []
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from security import profiler
+from security.profiler import ProfilerBusy, profile
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(name='busy', target=spin, args=(stop,), daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def test_profile(busy_thread):
+    result = profile(seconds=0.3, interval=0.005)
+    assert result.sample_count > 10
+    threads = result.threads()
+    assert 'busy' in threads
+    assert 'MainThread' not in threads or threads['busy']['cpu_percent'] >= threads['MainThread']['cpu_percent']
+    assert list(threads)[0] == 'busy'
+    busy_lines = [line for line in result.collapsed().splitlines() if line.startswith('busy;')]
+    assert busy_lines
+    assert all('test_profiler.py:spin' in line for line in busy_lines)
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in busy_lines) == threads['busy']['samples']
+    assert 'busy' in result.summary()
+
+
+def test_profile_busy(monkeypatch):
+    lock = threading.Lock()
+    lock.acquire()
+    monkeypatch.setattr(profiler, '_running', lock)
+    with pytest.raises(ProfilerBusy):
+        profile(seconds=0.1)
+
+
+@pytest.mark.parametrize('seconds, interval', [(0, 0.01), (1000, 0.01), (1, 0), (1, 2)])
+def test_profile_limits(seconds, interval):
+    with pytest.raises(ValueError):
+        profile(seconds, interval)
+
+
+def test_thread_cpu_times():
+    times = profiler.thread_cpu_times()
+    if not times:
+        pytest.skip('no /proc')
+    started = time.thread_time()
+    while time.thread_time() - started < 0.05:
+        pass
+    assert profiler.thread_cpu_times()[threading.get_native_id()] >= times[threading.get_native_id()]
@@ -0,0 +1,167 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from security.profiles import LUMINANCE_SIZE, CameraProfile, ProfileSwitcher, luminance
+from security.settings import Settings
+from security.threads.switch_profiles import switch_profiles
+
+
+def make_settings(**overrides):
+    return Settings(mac_addresses=('aa:aa:aa:bb:bb:bb',), telegram_bot_token='token', **overrides)
+
+
+def done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class FakeCamera(object):
+    """Reports brightness from `readings` and records the profiles applied."""
+
+    def __init__(self, readings, name='security'):
+        self.name = name
+        self.readings = list(readings)
+        self.profile = None
+        self.applied = []
+        self.measured = threading.Event()
+
+    def measure_luminance(self):
+        value = self.readings.pop(0) if len(self.readings) > 1 else self.readings[0]
+        if len(self.readings) == 1:
+            self.measured.set()
+        return done(value)
+
+    def apply_profile(self, profile):
+        self.profile = profile
+        self.applied.append(profile.name)
+        return done(profile)
+
+
+def feed(switcher, readings):
+    return [getattr(switcher.update(value), 'name', None) for value in readings]
+
+
+def test_profiles_from_settings():
+    settings = make_settings(night_framerate=3, night_iso=400, night_motion_detection_setting=(50, 30))
+    assert CameraProfile.day(settings) == CameraProfile('day', motion_detection_setting=(60, 10))
+    night = CameraProfile.night(settings)
+    assert (night.framerate, night.iso, night.exposure_mode) == (3, 400, 'night')
+    assert night.motion_detection_setting == (50, 30)
+
+
+def test_luminance():
+    width, height = LUMINANCE_SIZE
+    # The U and V planes after the Y plane are ignored.
+    assert luminance(bytes([100]) * (width * height) + bytes([255]) * 100) == 100
+    # Scaled to a 10ms exposure at unity gain.
+    assert luminance(bytes([100]) * (width * height), exposure_speed=40000, gain=2) == 12.5
+
+
+def test_meters_on_first_reading():
+    switcher = ProfileSwitcher(make_settings())
+    assert feed(switcher, [120, 118, 121]) == ['day', None, None]
+
+
+def test_switches_after_confirming_readings():
+    switcher = ProfileSwitcher(make_settings(night_luminance=40, day_luminance=60))
+    assert feed(switcher, [120, 30, 25, 20, 45, 50]) == ['day', None, 'night', None, None, None]
+    assert switcher.current.name == 'night'
+    assert feed(switcher, [70, 80]) == [None, 'day']
+
+
+def test_headlights_dont_switch():
+    switcher = ProfileSwitcher(make_settings())
+    feed(switcher, [10, 10, 10])
+    assert switcher.current.name == 'night'
+    assert feed(switcher, [200, 10, 220, 10]) == [None, None, None, None]
+    assert switcher.current.name == 'night'
+
+
+def test_hysteresis_between_thresholds():
+    switcher = ProfileSwitcher(make_settings(night_luminance=40, day_luminance=60))
+    feed(switcher, [45, 39, 38])
+    assert switcher.current.name == 'night'
+    # Between the thresholds the night profile stays.
+    assert feed(switcher, [45, 55, 50]) == [None, None, None]
+
+
+def test_remeters_when_brightness_drifts():
+    switcher = ProfileSwitcher(make_settings())
+    assert feed(switcher, [200, 120, 90]) == ['day', None, 'day']
+    assert switcher.metered_at == 90
+
+
+def test_apply_settings_keeps_current_profile():
+    switcher = ProfileSwitcher(make_settings())
+    feed(switcher, [10, 10, 10])
+    switcher.apply_settings(make_settings(night_iso=1600))
+    assert switcher.current.name == 'night'
+    assert switcher.current.iso == 1600
+
+
+class FakeClock(object):
+    """Stands in for `time` in the thread so an interval passes at once."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        time.sleep(0.001)
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('security.threads.switch_profiles.time', clock)
+    return clock
+
+
+def run_thread(camera, settings):
+    thread = threading.Thread(target=switch_profiles, args=(camera, lambda: settings), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_thread_follows_brightness_ramp():
+    # Dusk to night to dawn, one reading a second.
+    ramp = list(range(120, 0, -20)) + [5, 5] + list(range(20, 140, 20))
+    camera = FakeCamera(ramp)
+    run_thread(camera, make_settings(night_mode=True, profile_interval=60, night_luminance=40, day_luminance=60))
+    assert camera.measured.wait(5)
+    assert 'night' in camera.applied
+    assert camera.applied[0] == 'day'
+    assert camera.profile.name == 'day'
+    switches = [name for i, name in enumerate(camera.applied) if i and name != camera.applied[i - 1]]
+    assert switches == ['night', 'day']
+
+
+def test_thread_idles_without_night_mode():
+    camera = FakeCamera([10])
+    run_thread(camera, make_settings())
+    time.sleep(0.2)
+    assert camera.applied == []
+    assert not camera.measured.is_set()
+
+
+def test_thread_reapplies_changed_profile():
+    camera = FakeCamera([10])
+    settings = make_settings(night_mode=True)
+    run_thread(camera, settings)
+    deadline = time.time() + 5
+    while 'night' not in camera.applied and time.time() < deadline:
+        time.sleep(0.05)
+    assert camera.profile.name == 'night'
+    # A profile applied from other settings is replaced by the current one.
+    camera.profile = CameraProfile('night', iso=100)
+    deadline = time.time() + 3
+    while camera.profile.iso == 100 and time.time() < deadline:
+        time.sleep(0.05)
+    assert camera.profile == CameraProfile.night(settings)
@@ -0,0 +1,139 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from security.motion import MOTION_DTYPE
+from security.recorder import HEADER, MotionRecorder, MotionTrace, PacketRecorder, TraceWriter
+
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+
+def frames(count, shape=(3, 5)):
+    rng = np.random.default_rng(0)
+    result = []
+    for _ in range(count):
+        a = np.zeros(shape, dtype=MOTION_DTYPE)
+        a['x'] = rng.integers(-128, 128, shape)
+        a['y'] = rng.integers(-128, 128, shape)
+        a['sad'] = rng.integers(0, 65536, shape)
+        result.append(a)
+    return result
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, compress):
+    path = str(tmp_path / 'front.motion')
+    recorder = MotionRecorder(path, compress=compress, chunk_frames=4)
+    written = frames(10)
+    for i, a in enumerate(written):
+        recorder.record(a, now=100 + i)
+    recorder.close()
+
+    with MotionTrace(path) as trace:
+        assert trace.compressed == compress
+        assert trace.shape == (3, 5)
+        assert len(trace) == 10
+        read = list(trace)
+        assert [t for t, _ in read] == list(range(100, 110))
+        for (_, a), b in zip(read, written):
+            assert np.array_equal(a, b)
+        t, a = trace[-3]
+        assert t == 107
+        assert np.array_equal(a, written[7])
+        with pytest.raises(IndexError):
+            trace[10]
+
+
+def test_record_copies(tmp_path):
+    path = str(tmp_path / 'front.motion')
+    recorder = MotionRecorder(path)
+    a = frames(1)[0]
+    expected = a.copy()
+    recorder.record(a, now=1)
+    a['x'] = 0
+    recorder.close()
+    with MotionTrace(path) as trace:
+        assert np.array_equal(trace[0][1], expected)
+
+
+def test_truncated_record_ignored(tmp_path):
+    path = str(tmp_path / 'front.motion')
+    recorder = MotionRecorder(path)
+    for a in frames(3):
+        recorder.record(a)
+    recorder.close()
+    with open(path, 'r+b') as f:
+        f.truncate(HEADER.size + 2 * 8 + 2 * 3 * 5 * 4 + 7)
+    with MotionTrace(path) as trace:
+        assert len(trace) == 2
+
+
+def test_closed_at_exit(tmp_path):
+    """A compressed chunk still in memory is written when the process exits."""
+    path = str(tmp_path / 'front.motion')
+    script = (
+        'import sys\n'
+        'sys.path.insert(0, {0!r})\n'
+        'from tests.test_recorder import frames\n'
+        'from security.recorder import MotionRecorder\n'
+        'recorder = MotionRecorder({1!r}, compress=True)\n'
+        'for a in frames(3):\n'
+        '    recorder.record(a)\n'
+    ).format(os.path.abspath(ROOT), path)
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=30)
+    with MotionTrace(path) as trace:
+        assert len(trace) == 3
+
+
+def test_other_sizes_not_recorded(tmp_path):
+    path = str(tmp_path / 'front.motion')
+    recorder = MotionRecorder(path)
+    recorder.record(frames(1)[0])
+    recorder.record(frames(1, shape=(4, 5))[0])
+    recorder.close()
+    assert recorder.written == 1
+    with MotionTrace(path) as trace:
+        assert len(trace) == 1
+
+
+def test_not_a_trace(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'\xff\xd8' + b'\x00' * 100)
+    with pytest.raises(ValueError):
+        MotionTrace(str(path))
+
+
+def test_packets(tmp_path):
+    scapy = pytest.importorskip('scapy.all')
+    path = str(tmp_path / 'packets.pcap')
+    recorder = PacketRecorder(path)
+    packets = [
+        scapy.RadioTap() / scapy.Dot11(addr2='aa:aa:aa:aa:aa:{0:02x}'.format(i)) / scapy.Dot11ProbeReq()
+        for i in range(5)
+    ]
+    for packet in packets:
+        recorder.record(packet)
+    recorder.close()
+    assert [p.addr2 for p in scapy.rdpcap(path)] == [p.addr2 for p in packets]
+
+
+def test_incomplete_writer(tmp_path):
+    """A writer missing a method fails when it's made, not on its thread."""
+
+    class NoClose(TraceWriter):
+
+        def _open(self):
+            pass
+
+        def _write(self, item):
+            pass
+
+        def _flush(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClose(str(tmp_path / 'trace'))
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from security.scheduler import PRIORITY_ALARM, PRIORITY_ON_DEMAND, CaptureScheduler
+
+
+class FakeCamera(object):
+    """Records captures and how many ran at once."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.captures = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+
+    def capture(self, name):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.release.wait()
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            self.captures.append(name)
+        return '/var/tmp/{0}.jpg'.format(name)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = CaptureScheduler()
+    scheduler.start()
+    yield scheduler
+    scheduler.stop(timeout=1)
+
+
+def test_submit_returns_result(scheduler):
+    """The future resolves to the return value of the job."""
+    camera = FakeCamera(delay=0)
+    future = scheduler.submit('photo', lambda: camera.capture('photo'))
+    assert future.result(timeout=1) == '/var/tmp/photo.jpg'
+
+
+def test_jobs_are_serialized(scheduler):
+    """Only one job touches the camera at a time."""
+    camera = FakeCamera(delay=0.01)
+    futures = [
+        scheduler.submit(i, lambda i=i: camera.capture(i))
+        for i in range(10)
+    ]
+    for future in futures:
+        future.result(timeout=2)
+    assert camera.max_active == 1
+    assert len(camera.captures) == 10
+
+
+def test_identical_requests_are_coalesced(scheduler):
+    """Concurrent requests with the same key share one capture."""
+    camera = FakeCamera(delay=0)
+    camera.release.clear()
+    futures = [
+        scheduler.submit('photo', lambda: camera.capture('photo'))
+        for _ in range(20)
+    ]
+    camera.release.set()
+    results = set(future.result(timeout=1) for future in futures)
+    assert results == {'/var/tmp/photo.jpg'}
+    assert camera.captures == ['photo']
+
+
+def test_alarm_runs_before_on_demand(scheduler):
+    """Alarm captures jump ahead of queued on-demand requests."""
+    camera = FakeCamera(delay=0)
+    camera.release.clear()
+    blocker = scheduler.submit('blocker', lambda: camera.capture('blocker'))
+    while not camera.active:
+        time.sleep(0.001)
+    photo = scheduler.submit('photo', lambda: camera.capture('photo'), PRIORITY_ON_DEMAND)
+    gif = scheduler.submit('gif', lambda: camera.capture('gif'), PRIORITY_ON_DEMAND)
+    alarm = scheduler.submit('alarm', lambda: camera.capture('alarm'), PRIORITY_ALARM)
+    camera.release.set()
+    for future in (blocker, photo, gif, alarm):
+        future.result(timeout=1)
+    assert camera.captures == ['blocker', 'alarm', 'photo', 'gif']
+
+
+def test_coalesced_request_upgrades_priority(scheduler):
+    """A pending job resubmitted at a higher priority is moved forward."""
+    camera = FakeCamera(delay=0)
+    camera.release.clear()
+    blocker = scheduler.submit('blocker', lambda: camera.capture('blocker'))
+    while not camera.active:
+        time.sleep(0.001)
+    gif = scheduler.submit('gif', lambda: camera.capture('gif'), PRIORITY_ON_DEMAND)
+    photo = scheduler.submit('photo', lambda: camera.capture('photo'), PRIORITY_ON_DEMAND)
+    assert scheduler.submit('photo', lambda: camera.capture('photo'), PRIORITY_ALARM) is photo
+    camera.release.set()
+    for future in (blocker, gif, photo):
+        future.result(timeout=1)
+    assert camera.captures == ['blocker', 'photo', 'gif']
+
+
+def test_exception_is_set_on_future(scheduler):
+    """A failing job doesn't kill the worker."""
+    def broken():
+        raise RuntimeError('camera on fire')
+
+    with pytest.raises(RuntimeError):
+        scheduler.submit('broken', broken).result(timeout=1)
+    assert scheduler.submit('ok', lambda: 'ok').result(timeout=1) == 'ok'
+
+
+def test_submit_does_not_block_on_capture(scheduler):
+    """Submitting while the camera is busy returns immediately."""
+    camera = FakeCamera(delay=0)
+    camera.release.clear()
+    scheduler.submit('blocker', lambda: camera.capture('blocker'))
+    started = time.time()
+    future = scheduler.submit('photo', lambda: camera.capture('photo'))
+    assert time.time() - started < 0.05
+    assert not future.done()
+    camera.release.set()
+    future.result(timeout=1)
+
+
+def test_stop_cancels_pending(scheduler):
+    """Pending jobs are cancelled when the scheduler stops."""
+    camera = FakeCamera(delay=0)
+    camera.release.clear()
+    scheduler.submit('blocker', lambda: camera.capture('blocker'))
+    while not camera.active:
+        time.sleep(0.001)
+    pending = scheduler.submit('photo', lambda: camera.capture('photo'))
+    scheduler.stop(timeout=0)
+    camera.release.set()
+    assert pending.cancelled()
@@ -0,0 +1,179 @@
+import dataclasses
+import os
+
+import pytest
+
+from security.settings import Settings, SettingsError
+
+CONFIG = """[main]
+mac_addresses=AA:AA:AA:BB:BB:BB, cc:cc:cc:dd:dd:dd
+telegram_bot_token=token
+"""
+
+SHIPPED_CONFIG = os.path.join(os.path.dirname(__file__), '..', 'etc', 'rpi-security.conf')
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text(CONFIG)
+    return str(path)
+
+
+def write(path, extra):
+    with open(path, 'w') as f:
+        f.write(CONFIG + extra)
+
+
+def test_defaults(config_file):
+    settings = Settings.from_file(config_file)
+    assert settings.mac_addresses == ('aa:aa:aa:bb:bb:bb', 'cc:cc:cc:dd:dd:dd')
+    assert settings.packet_timeout == 700
+    assert settings.camera_mode == 'gif'
+    assert settings.debug_mode is False
+    assert settings.photo_size == (1024, 768)
+
+
+def test_shipped_config():
+    """The example config file is valid."""
+    settings = Settings.from_file(SHIPPED_CONFIG)
+    assert settings.photo_size == (2592, 1944)
+    assert settings.motion_detection_setting == (60, 17)
+    assert settings.camera_mode == 'photo'
+
+
+def test_parses_types(config_file):
+    write(config_file, 'debug_mode=Yes\npacket_timeout=30\nmotion_size=320x240\ncamera_mode=PHOTO\n')
+    settings = Settings.from_file(config_file)
+    assert settings.debug_mode is True
+    assert settings.packet_timeout == 30
+    assert settings.motion_size == (320, 240)
+    assert settings.camera_mode == 'photo'
+
+
+@pytest.mark.parametrize('extra, expected', [
+    ('', (320, 240)),
+    ('motion_size=1280x720\n', (320, 180)),
+    ('motion_size=240x180\n', (240, 180)),
+    ('motion_size=1280x720\nmotion_analysis_size=640x360\n', (640, 360)),
+    ('motion_size=1280x720\nmotion_analysis_size=\n', (320, 180)),
+])
+def test_analysis_size(config_file, extra, expected):
+    """Without motion_analysis_size motion_size is capped at 320 wide."""
+    write(config_file, extra)
+    assert Settings.from_file(config_file).analysis_size == expected
+
+
+def test_immutable(config_file):
+    settings = Settings.from_file(config_file)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.packet_timeout = 1
+    assert not hasattr(settings, '__dict__')
+
+
+@pytest.mark.parametrize('extra, message', [
+    ('packet_timeout=soon\n', 'packet_timeout'),
+    ('packet_timeout=-1\n', 'packet_timeout must be positive'),
+    ('debug_mode=maybe\n', 'debug_mode'),
+    ('camera_mode=video\n', 'camera_mode must be one of'),
+    ('photo_size=1024\n', 'photo_size'),
+    ('photo_size=0x768\n', 'photo_size must be positive'),
+    ('preview_port=70000\n', 'preview_port'),
+    ('night_luminance=80\n', 'must be below day_luminance'),
+    ('night_iso=3200\n', 'night_iso'),
+    ('pir_mode=always\n', 'pir_mode must be empty or one of gate, wake'),
+    ('motion_analysis_size=1280x720\n', 'motion_analysis_size must not be larger than motion_size'),
+    ('motion_analysis_size=0x0\n', 'motion_analysis_size must be positive'),
+    ('verify_threshold=1.5\n', 'verify_threshold must be between 0 and 1'),
+    ('dedupe_distance=300\n', 'dedupe_distance must be between 0 and 256'),
+    ('upload_target=-1\n', 'upload_target must not be negative'),
+    ('state_max_age=-1\n', 'state_max_age must not be negative'),
+    ('cluster_role=coordinator\n', 'cluster_token must be set when cluster_role is set'),
+    ('telegram_bot_token=again\n', 'Unable to parse'),
+])
+def test_invalid(config_file, extra, message):
+    write(config_file, extra)
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(config_file)
+    assert message in str(exc.value)
+
+
+def test_invalid_mac_address(tmp_path):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text('[main]\nmac_addresses=aa:aa:aa:bb:bb:bb,not-a-mac\ntelegram_bot_token=token\n')
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(str(path))
+    assert "invalid MAC address 'not-a-mac'" in str(exc.value)
+
+
+def test_errors_are_collected(config_file):
+    """Every problem is reported at once."""
+    write(config_file, 'packet_timeout=soon\ndebug_mode=maybe\n')
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(config_file)
+    assert 'packet_timeout' in str(exc.value)
+    assert 'debug_mode' in str(exc.value)
+
+
+def test_required(tmp_path):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text('[main]\n')
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(str(path))
+    assert 'mac_addresses must be set' in str(exc.value)
+    assert 'telegram_bot_token must be set' in str(exc.value)
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(SettingsError):
+        Settings.from_file(str(tmp_path / 'missing.conf'))
+
+
+def test_changed(config_file):
+    settings = Settings.from_file(config_file)
+    other = dataclasses.replace(settings, packet_timeout=10, camera_mode='photo')
+    assert settings.changed(other) == {'packet_timeout', 'camera_mode'}
+    assert settings.changed(settings) == set()
+
+
+def test_camera_sections(config_file):
+    write(config_file, 'cameras=front,Garden\n[camera:garden]\ncamera_num=1\npreview_port=8001\n')
+    settings = Settings.from_file(config_file)
+    assert settings.cameras == ('front', 'garden')
+    assert settings.for_camera('front') is settings
+    garden = settings.for_camera('garden')
+    assert (garden.camera_num, garden.preview_port) == (1, 8001)
+    assert garden.packet_timeout == settings.packet_timeout
+
+
+@pytest.mark.parametrize('extra, message', [
+    ('cameras=front\n[camera:garden]\ncamera_num=1\n', '[camera:garden] is not listed in cameras'),
+    ('cameras=front\n[camera:front]\npacket_timeout=10\n', 'packet_timeout can not be set per camera'),
+    ('cameras=front\n[camera:front]\ncamera_mode=video\n', 'camera_mode must be one of'),
+    ('cameras=front,back\npreview_port=8000\n[camera:back]\ncamera_num=1\n', 'each camera needs its own preview_port'),
+    ('cameras=front,front\n', 'duplicates'),
+    ('cameras=front door\n', "invalid name 'front door'"),
+    ('camera_overrides=x\n', 'camera_overrides: set in [camera:<name>] sections'),
+])
+def test_invalid_camera_sections(config_file, extra, message):
+    write(config_file, extra)
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(config_file)
+    assert message in str(exc.value)
+
+
+def test_node_settings(tmp_path):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text('[main]\ncluster_role=node\ncoordinators=10.0.0.2:7300\ncluster_token=secret\nheartbeat_interval=0.5\n')
+    settings = Settings.from_file(str(path))
+    assert settings.mac_addresses == ()
+    assert settings.coordinators == ('10.0.0.2:7300',)
+    assert settings.heartbeat_interval == 0.5
+
+
+def test_node_needs_coordinators(tmp_path):
+    path = tmp_path / 'rpi-security.conf'
+    path.write_text('[main]\ncluster_role=node\n')
+    with pytest.raises(SettingsError) as exc:
+        Settings.from_file(str(path))
+    assert 'coordinators must be set on a node' in str(exc.value)
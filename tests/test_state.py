@@ -0,0 +1,148 @@
+import dataclasses
+import threading
+import time
+
+import pytest
+
+from security.state import MAX_NOTIFICATIONS, State
+from security.threads.notifier import notifier
+
+
+class FakeSettings(object):
+    packet_timeout = 700
+
+
+class FakeNetwork(object):
+
+    def __init__(self, send_delay=0):
+        self.settings = FakeSettings()
+        self.send_delay = send_delay
+        self.messages = []
+        self.arp_pings = 0
+        self.state = State(self)
+
+    def telegram_send_message(self, message):
+        time.sleep(self.send_delay)
+        self.messages.append(message)
+        return True
+
+    def arp_ping_macs(self):
+        self.arp_pings += 1
+
+
+@pytest.fixture
+def network():
+    return FakeNetwork()
+
+
+def test_initial_state(network):
+    assert network.state.current == 'disarmed'
+    assert network.state.previous == 'Not running'
+    assert network.state.last_mac is None
+
+
+def test_snapshot_is_immutable(network):
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        network.state.snapshot.current = 'armed'
+
+
+def test_update_swaps_snapshot(network):
+    """Old snapshots are never modified."""
+    before = network.state.snapshot
+    network.state.update_last_mac('aa:aa:aa:bb:bb:bb')
+    assert network.state.snapshot is not before
+    assert before.last_mac is None
+    assert network.state.last_mac == 'aa:aa:aa:bb:bb:bb'
+
+
+def test_update_state_queues_notification(network):
+    network.state.update_state('armed')
+    assert network.state.current == 'armed'
+    assert network.state.previous == 'disarmed'
+    assert network.messages == []
+    assert network.state.notifications.get_nowait() == 'rpi-security is now armed'
+
+
+def test_update_state_unchanged(network):
+    network.state.update_state('disarmed')
+    assert network.state.notifications.empty()
+
+
+def test_notification_queue_is_bounded(network):
+    for i in range(MAX_NOTIFICATIONS + 5):
+        network.state.notify(str(i))
+    assert network.state.notifications.qsize() == MAX_NOTIFICATIONS
+    assert network.state.notifications.get_nowait() == '5'
+
+
+def test_check_arms_after_timeout(network):
+    network.state.snapshot = dataclasses.replace(network.state.snapshot, last_packet=time.time() - 800)
+    network.state.check()
+    assert network.state.current == 'armed'
+
+
+def test_check_arp_pings_before_arming(network):
+    network.state.snapshot = dataclasses.replace(network.state.snapshot, last_packet=time.time() - 710)
+    network.state.check()
+    assert network.state.current == 'disarmed'
+    assert network.arp_pings == 1
+
+
+def test_check_disabled(network):
+    network.state.update_state('disabled')
+    network.state.snapshot = dataclasses.replace(network.state.snapshot, last_packet=time.time() - 800)
+    network.state.check()
+    assert network.state.current == 'disabled'
+
+
+def test_status(network):
+    status = network.state.status()
+    assert status['current'] == 'disarmed'
+    assert set(status) == set(f.name for f in dataclasses.fields(network.state.snapshot))
+
+
+def test_generate_status_text(network):
+    network.state.update_last_mac('aa:aa:aa:bb:bb:bb')
+    text = network.state.generate_status_text()
+    assert 'Current state: _disarmed_' in text
+    assert 'Last MAC detected: _aa:aa:aa:bb:bb:bb 0 minutes ago_' in text
+
+
+def test_slow_notification_does_not_block_packets():
+    """A slow Telegram send doesn't hold up the packet thread."""
+    network = FakeNetwork(send_delay=0.5)
+    thread = threading.Thread(target=notifier, args=(network,))
+    thread.daemon = True
+    thread.start()
+    network.state.update_state('armed')
+    started = time.time()
+    network.state.update_last_mac('aa:aa:aa:bb:bb:bb')
+    assert time.time() - started < 0.1
+    network.state.notifications.join()
+    assert network.messages == ['rpi-security is now armed']
+
+
+def test_concurrent_readers_see_consistent_snapshots(network):
+    """last_mac and last_packet always come from the same update."""
+    stop = threading.Event()
+    errors = []
+
+    def writer(n):
+        while not stop.is_set():
+            network.state.update_last_mac(str(n))
+
+    def reader():
+        while not stop.is_set():
+            snapshot = network.state.snapshot
+            if snapshot.last_mac is not None and snapshot.last_packet < network.state.start_time:
+                errors.append(snapshot)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    threads += [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
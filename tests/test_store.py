@@ -0,0 +1,205 @@
+import dataclasses
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from security.store import TEMP_SUFFIX, VERSION, StateStore, write_atomic
+from security.threads.save_state import save_state
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+MAC = 'aa:aa:aa:bb:bb:bb'
+
+
+class FakeClock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'state.json')
+
+
+def test_write_atomic(path):
+    write_atomic(path, b'first')
+    write_atomic(path, b'second')
+    with open(path, 'rb') as f:
+        assert f.read() == b'second'
+    assert not os.path.exists(path + TEMP_SUFFIX)
+
+
+def test_round_trip(path, tmp_path, fake_network, fake_camera):
+    photo = str(tmp_path / 'photo.jpg')
+    open(photo, 'wb').close()
+    network, camera = fake_network(), fake_camera('front')
+    network.state.update_last_mac(MAC)
+    network.state.update_state('disabled')
+    network.state.update_triggered(True)
+    for queued in (photo, None, str(tmp_path / 'deleted.jpg')):
+        camera.queue.put(queued)
+    assert StateStore(path, network.state, [camera]).save()
+
+    restored, restored_camera = fake_network(), fake_camera('front')
+    assert StateStore(path, restored.state, [restored_camera, fake_camera('back')]).restore()
+    before, after = network.state.snapshot, restored.state.snapshot
+    assert (after.current, after.previous, after.last_mac, after.triggered) == ('disabled', 'disarmed', MAC, True)
+    assert (after.last_change, after.last_packet) == (before.last_change, before.last_packet)
+    assert restored.state.last_seen == {MAC: before.last_packet}
+    # Photos that were deleted aren't queued again.
+    assert list(restored_camera.queue.queue) == [photo]
+    # Restoring doesn't notify.
+    assert restored.state.notifications.empty()
+
+
+def test_restore_arms_at_once(path, fake_network):
+    """A restart while armed, or with the phones long gone, doesn't wait
+    out packet_timeout again."""
+    for current in ('armed', 'disarmed'):
+        network = fake_network()
+        network.state.update_state(current)
+        network.state.update_last_mac(MAC)
+        network.state.snapshot = dataclasses.replace(network.state.snapshot, last_packet=time.time() - 800)
+        StateStore(path, network.state).save()
+        restarted = fake_network()
+        StateStore(path, restarted.state).restore()
+        restarted.state.check()
+        assert restarted.state.current == 'armed'
+
+
+@pytest.mark.parametrize('age', [-60, 601])
+def test_restore_ignores_old_checkpoints(path, age, fake_network):
+    network = fake_network()
+    network.state.update_state('armed')
+    store = StateStore(path, network.state, max_age=600)
+    store.save()
+    restarted = fake_network()
+    assert not StateStore(path, restarted.state, max_age=600).restore(now=store.saved + age)
+    assert restarted.state.current == 'disarmed'
+
+
+@pytest.mark.parametrize('content', [
+    None,
+    b'',
+    b'{"version": 1, "saved": ',
+    json.dumps({'version': VERSION + 1, 'saved': 0}).encode('utf-8'),
+    b'[]',
+])
+def test_restore_ignores_bad_files(path, content, fake_network):
+    if content is not None:
+        with open(path, 'wb') as f:
+            f.write(content)
+    network = fake_network()
+    assert not StateStore(path, network.state).restore()
+    assert network.state.current == 'disarmed'
+
+
+def test_restore_rejects_unknown_state(path, fake_network):
+    network = fake_network()
+    store = StateStore(path, network.state)
+    with open(path, 'w') as f:
+        json.dump(dict(store.checkpoint(), current='panicking'), f)
+    assert not store.restore()
+
+
+def test_failed_save_keeps_checkpoint(path, monkeypatch, fake_network):
+    """A crash before the rename leaves the old checkpoint."""
+    network = fake_network()
+    network.state.update_state('armed')
+    store = StateStore(path, network.state)
+    assert store.save()
+    network.state.update_state('disabled')
+
+    def crash(src, dst):
+        raise OSError('crashed')
+
+    monkeypatch.setattr(os, 'replace', crash)
+    assert not store.save()
+    monkeypatch.undo()
+    # A half written temporary file is ignored.
+    with open(path + TEMP_SUFFIX, 'wb') as f:
+        f.write(b'{"version": 1, "sa')
+    restarted = fake_network()
+    assert StateStore(path, restarted.state).restore()
+    assert restarted.state.current == 'armed'
+
+
+def test_save_only_when_changed(path, monkeypatch, fake_network):
+    network = fake_network()
+    store = StateStore(path, network.state, max_age=600)
+    writes = []
+    monkeypatch.setattr('security.store.write_atomic', lambda path, data: writes.append(data))
+    assert store.save(force=False)
+    assert store.save(force=False)
+    assert len(writes) == 1
+    # Anything but the time it was saved counts as a change.
+    network.state.update_last_mac(MAC)
+    assert store.save(force=False)
+    assert len(writes) == 2
+    # It's written anyway once half of max_age has passed.
+    clock = FakeClock(store.saved + 299)
+    monkeypatch.setattr('security.store.time', clock)
+    store.save(force=False)
+    assert len(writes) == 2
+    clock.now += 1
+    store.save(force=False)
+    assert len(writes) == 3
+    store.save()
+    assert len(writes) == 4
+
+
+def test_save_state_on_change(path, fake_network):
+    network = fake_network()
+    store = StateStore(path, network.state)
+    network.state.listeners.append(store.state_changed)
+    thread = threading.Thread(target=save_state, args=(store,))
+    thread.daemon = True
+    thread.start()
+    network.state.update_state('armed')
+    deadline = time.time() + 2
+    while store.saved is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.load()['current'] == 'armed'
+
+
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+from security.state import State
+from security.store import StateStore
+
+state = State(None)
+state.notify = lambda message: None
+store = StateStore({path!r}, state)
+store.save()
+print('ready', flush=True)
+while True:
+    for current in ('armed', 'disarmed', 'disabled'):
+        state.update_state(current)
+        state.update_last_mac('aa:aa:aa:bb:bb:' + current[:2])
+        store.save()
+"""
+
+
+def test_killed_while_saving(path, fake_network):
+    """Killing the process at any point leaves a checkpoint that restores."""
+    script = WRITER.format(root=os.path.abspath(ROOT), path=path)
+    for delay in (0.005, 0.01, 0.02, 0.03, 0.05, 0.08):
+        process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+        assert process.stdout.readline() == b'ready\n'
+        time.sleep(delay)
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+        process.stdout.close()
+        network = fake_network()
+        assert StateStore(path, network.state).restore()
+        assert network.state.last_mac[-2:] == network.state.current[:2]
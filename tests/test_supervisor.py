@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from security.supervisor import Supervisor, WorkerAbandoned, heartbeat
+
+
+class FaultyWorker(object):
+    """Fails the way it's told to on its first runs, then works.
+
+    Args:
+        faults (list): 'raise', 'return' or 'hang' for each failing run,
+            or 'late' to raise after running for `late` seconds.
+    """
+
+    def __init__(self, faults, late=0.6):
+        self.faults = list(faults)
+        self.late = late
+        self.runs = 0
+        self.items = 0
+        self.release = threading.Event()
+        self.abandoned = []
+
+    def __call__(self):
+        self.runs += 1
+        fault = self.faults.pop(0) if self.faults else None
+        if fault == 'raise':
+            raise RuntimeError('injected')
+        if fault == 'return':
+            return
+        if fault == 'late':
+            deadline = time.monotonic() + self.late
+            while time.monotonic() < deadline:
+                heartbeat()
+                time.sleep(0.005)
+            raise RuntimeError('injected late')
+        if fault == 'hang':
+            self.release.wait()
+            try:
+                heartbeat()
+            except WorkerAbandoned:
+                self.abandoned.append(threading.current_thread().name)
+                raise
+        while True:
+            heartbeat()
+            self.items += 1
+            time.sleep(0.005)
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor(check_interval=0.01, backoff=0.05, max_backoff=0.2, reset_after=0.5)
+    yield supervisor
+    supervisor.stop()
+
+
+@pytest.mark.parametrize('fault, error', [
+    ('raise', "RuntimeError('injected')"),
+    ('return', 'returned'),
+])
+def test_restart_failed(supervisor, fault, error, wait_for):
+    worker = FaultyWorker([fault])
+    supervisor.add('faulty', worker, timeout=1)
+    supervisor.start()
+    assert wait_for(lambda: worker.items > 0)
+    status = supervisor.status()['faulty']
+    assert status['state'] == 'running'
+    assert status['restarts'] == 1
+    assert status['last_error'] == error
+
+
+def test_restart_hung(supervisor, wait_for):
+    worker = FaultyWorker(['hang'])
+    supervisor.add('hung', worker, timeout=0.1)
+    supervisor.start()
+    assert wait_for(lambda: worker.items > 0)
+    assert supervisor.status()['hung']['restarts'] == 1
+    assert supervisor.status()['hung']['last_error'].startswith('no heartbeat')
+    # The replaced thread leaves at its next heartbeat.
+    worker.release.set()
+    assert wait_for(lambda: worker.abandoned == ['hung_abandoned'])
+    assert supervisor.status()['hung']['restarts'] == 1
+    assert [t.name for t in threading.enumerate()].count('hung') == 1
+
+
+def test_backoff(supervisor, wait_for):
+    worker = FaultyWorker(['raise'] * 4)
+    supervisor.add('faulty', worker)
+    started = time.monotonic()
+    supervisor.start()
+    assert wait_for(lambda: worker.items > 0)
+    # 0.05 + 0.1 + 0.2 + 0.2
+    assert time.monotonic() - started >= 0.55
+    assert supervisor.workers['faulty'].failures == 4
+
+
+def test_backoff_reset(supervisor, wait_for):
+    """A failure after running for reset_after starts the backoff again."""
+    worker = FaultyWorker(['raise', 'late'])
+    supervisor.add('faulty', worker)
+    supervisor.start()
+    assert wait_for(lambda: worker.items > 0)
+    assert supervisor.status()['faulty']['restarts'] == 2
+    assert supervisor.workers['faulty'].failures == 1
+
+
+def test_add_while_running(supervisor, wait_for):
+    supervisor.start()
+    worker = FaultyWorker([])
+    supervisor.add('late', worker)
+    assert wait_for(lambda: worker.items > 0)
+    with pytest.raises(ValueError):
+        supervisor.add('late', worker)
+
+
+def test_stop(supervisor):
+    worker = FaultyWorker(['raise'])
+    supervisor.add('faulty', worker)
+    supervisor.stop()
+    supervisor.start()
+    supervisor.stop(timeout=1)
+    assert not supervisor.thread.is_alive()
+    time.sleep(0.1)
+    assert supervisor.status()['faulty']['restarts'] == 0
+
+
+def test_heartbeat_unsupervised():
+    heartbeat()
@@ -0,0 +1,88 @@
+import pytest
+from PIL import Image
+
+from security.thumbnails import ThumbnailPool, make_thumbnail, thumbnail_path
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = str(tmp_path / '2018-01-27-000000-security-0.jpg')
+    Image.new('RGB', (2592, 1944), (10, 120, 200)).save(path, quality=95)
+    return path
+
+
+@pytest.fixture
+def pool():
+    pool = ThumbnailPool(size=(640, 480), workers=2, max_originals=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_thumbnail_path():
+    assert thumbnail_path('/var/tmp/photo.jpg') == '/var/tmp/photo-thumb.jpg'
+
+
+def test_make_thumbnail(photo):
+    """The thumbnail fits the size and keeps the aspect ratio."""
+    path = make_thumbnail(photo, (640, 480))
+    assert path == thumbnail_path(photo)
+    with Image.open(path) as image:
+        assert image.size == (640, 480)
+        assert image.format == 'JPEG'
+
+
+def test_make_thumbnail_smaller_than_size(tmp_path):
+    """Small images aren't scaled up."""
+    path = str(tmp_path / 'small.jpg')
+    Image.new('RGB', (320, 240)).save(path)
+    with Image.open(make_thumbnail(path, (640, 480))) as image:
+        assert image.size == (320, 240)
+
+
+def test_pool_submit(pool, photo):
+    assert pool.submit(photo).result(timeout=30) == thumbnail_path(photo)
+
+
+def test_pool_run_holds_a_slot(pool, photo):
+    """Other work run in the pool counts towards max_pending."""
+    assert pool.run(make_thumbnail, photo, (64, 48)).result(timeout=30) == thumbnail_path(photo)
+    # The slot is given back when it's done, there are workers * 2.
+    for _ in range(4):
+        assert pool.slots.acquire(timeout=5)
+    assert not pool.slots.acquire(blocking=False)
+
+
+def test_pool_map_keeps_order(pool, tmp_path):
+    paths = []
+    for i in range(5):
+        path = str(tmp_path / '{0}.jpg'.format(i))
+        Image.new('RGB', (1280, 960)).save(path)
+        paths.append(path)
+    assert list(pool.map(paths)) == [(path, thumbnail_path(path)) for path in paths]
+
+
+def test_pool_map_failure(pool, tmp_path):
+    """A broken image yields None rather than raising."""
+    path = str(tmp_path / 'broken.jpg')
+    with open(path, 'wb') as f:
+        f.write(b'not a jpeg')
+    assert list(pool.map([path])) == [(path, None)]
+
+
+def test_pool_bounds_pending(pool, photo):
+    """Every slot is released once the jobs finish."""
+    futures = [pool.submit(photo) for _ in range(10)]
+    for future in futures:
+        future.result(timeout=30)
+    # Slots are released from a done callback which can run just after
+    # result() returns.
+    for _ in range(4):
+        assert pool.slots.acquire(timeout=5)
+
+
+def test_originals(pool):
+    """Only the most recent originals are kept."""
+    for path in ('a.jpg', 'b.jpg', 'c.jpg'):
+        pool.add_original(path)
+    assert pool.pop_originals() == ['b.jpg', 'c.jpg']
+    assert pool.pop_originals() == []
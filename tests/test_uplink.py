@@ -0,0 +1,124 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from security.thumbnails import ThumbnailPool
+from security.uplink import (
+    UplinkEncoder,
+    UplinkEstimator,
+    fit_clip,
+    fit_file,
+    fit_gif,
+    fit_jpeg,
+    fit_path,
+)
+
+
+def noise(rng, size):
+    return Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8))
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = str(tmp_path / 'photo.jpg')
+    noise(np.random.default_rng(0), (1024, 768)).save(path, quality=80)
+    return path
+
+
+@pytest.fixture
+def gif(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / 'event.gif')
+    images = [noise(rng, (320, 240)) for _ in range(6)]
+    images[0].save(path, save_all=True, append_images=images[1:], loop=0, duration=200)
+    return path
+
+
+def test_estimator():
+    estimator = UplinkEstimator(alpha=0.5)
+    assert estimator.budget(5) is None
+    estimator.record(100, 0.4)
+    estimator.record(100, 0.2)
+    assert estimator.round_trip == pytest.approx(0.3)
+    # The round trip is taken off large sends.
+    estimator.record(100000, 1.3)
+    assert estimator.bytes_per_second == pytest.approx(100000)
+    assert estimator.budget(5.3) == 500000
+    assert estimator.budget(0.1) == 0
+
+
+def test_estimator_failed_sends():
+    """A send that times out caps the throughput, it doesn't raise it."""
+    estimator = UplinkEstimator()
+    estimator.record(300000, 30, delivered=False)
+    assert estimator.bytes_per_second == pytest.approx(10000)
+    estimator.record(3000000, 30, delivered=False)
+    assert estimator.bytes_per_second == pytest.approx(10000)
+    estimator.record(100, 30, delivered=False)
+    assert estimator.round_trip is None
+
+
+def test_fit_file_already_fits(photo):
+    assert fit_file(photo, os.path.getsize(photo)) == photo
+
+
+def test_fit_jpeg(photo):
+    small = os.path.getsize(fit_jpeg(photo, 0))
+    assert fit_jpeg(photo, 0) == fit_path(photo, '.jpg')
+    with Image.open(fit_path(photo, '.jpg')) as image:
+        assert max(image.size) == 320
+    # The largest that fits is chosen.
+    output = fit_jpeg(photo, small * 4)
+    assert small < os.path.getsize(output) <= small * 4
+    with Image.open(output) as image:
+        assert max(image.size) > 320
+
+
+def test_fit_gif(gif):
+    output = fit_gif(gif, os.path.getsize(gif) // 2)
+    assert output == fit_path(gif, '.gif')
+    assert os.path.getsize(output) <= os.path.getsize(gif) // 2
+    with Image.open(output) as image:
+        assert sum(1 for _ in ImageSequence.Iterator(image)) < 6
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg')
+def test_fit_clip(gif):
+    output = fit_clip(gif, os.path.getsize(gif) // 2, shutil.which('ffmpeg'))
+    assert output == fit_path(gif, '.mp4')
+    assert os.path.getsize(output) <= os.path.getsize(gif) // 2
+
+
+def test_encoder(photo):
+    estimator = UplinkEstimator()
+    encoder = UplinkEncoder(estimator)
+    # Nothing is re-encoded until the uplink has been measured.
+    assert encoder.fit(photo, 5) == photo
+    estimator.record(20000, 1)
+    assert encoder.fit(photo, 5) == fit_path(photo, '.jpg')
+    assert os.path.getsize(fit_path(photo, '.jpg')) <= 100000
+    assert encoder.fit(photo + '.mp4', 5) == photo + '.mp4'
+
+
+def test_encoder_pool(photo):
+    estimator = UplinkEstimator()
+    estimator.record(20000, 1)
+    pool = ThumbnailPool(workers=1)
+    try:
+        assert UplinkEncoder(estimator, pool).fit(photo, 5) == fit_path(photo, '.jpg')
+    finally:
+        pool.shutdown()
+    assert os.path.getsize(fit_path(photo, '.jpg')) <= 100000
+
+
+def test_encoder_fails_open(tmp_path):
+    path = str(tmp_path / 'broken.jpg')
+    with open(path, 'wb') as f:
+        f.write(b'not a jpeg' * 1000)
+    estimator = UplinkEstimator()
+    estimator.record(10000, 1)
+    assert UplinkEncoder(estimator).fit(path, 0.5) == path
+
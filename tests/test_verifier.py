@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from security.thumbnails import ThumbnailPool
+from security.verifier import VERIFY_SIZE, EventVerifier, load_frames, score_event
+
+
+def save_event(tmp_path, kind, count=3, size=(640, 480)):
+    """Save a person walking past or a headlight sweep as JPEGs."""
+    width, height = size
+    rng = np.random.default_rng(0)
+    scene = 0.4 + 0.1 * np.sin(np.arange(width) / 40.0)[None, :] + rng.normal(0, 0.02, (height, width))
+    paths = []
+    for n in range(count):
+        frame = scene.copy()
+        if kind == 'person':
+            left = 100 + n * 60
+            frame[120:440, left:left + 110] = 0.1 + rng.normal(0, 0.04, (320, 110))
+            frame[300:440, left + 45:left + 65] = scene[300:440, left + 45:left + 65]
+        else:
+            frame = frame * (1 + 0.2 * n)
+        path = str(tmp_path / '{0}-{1}.jpg'.format(kind, n))
+        Image.fromarray((np.clip(frame, 0, 1) * 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def test_load_frames(tmp_path):
+    frames = load_frames(save_event(tmp_path, 'person'))
+    assert frames.shape == (3, VERIFY_SIZE[1], VERIFY_SIZE[0])
+    assert 0 <= frames.min() and frames.max() <= 1
+
+
+def test_load_frames_gif(tmp_path):
+    path = str(tmp_path / 'event.gif')
+    images = [Image.new('L', (320, 240), value) for value in (0, 100, 200, 250)]
+    images[0].save(path, save_all=True, append_images=images[1:])
+    assert load_frames([path]).shape == (4, VERIFY_SIZE[1], VERIFY_SIZE[0])
+    assert load_frames([path], max_frames=2).shape[0] == 2
+
+
+def test_load_frames_budget(tmp_path):
+    """Decoding stops once frames take longer than the budget, keeping two."""
+    paths = save_event(tmp_path, 'person', count=5)
+    assert load_frames(paths, budget_ms=1e-6).shape[0] == 2
+    assert load_frames(paths, budget_ms=1e6).shape[0] == 5
+
+
+def test_score_event(tmp_path):
+    person = score_event(save_event(tmp_path, 'person'))
+    headlights = score_event(save_event(tmp_path, 'headlights'))
+    assert person['frames'] == headlights['frames'] == 3
+    assert person['score'] > 0.5 > headlights['score']
+
+
+def test_score_event_one_frame(tmp_path):
+    assert score_event(save_event(tmp_path, 'person', count=1))['score'] is None
+
+
+@pytest.fixture
+def verifier():
+    pool = ThumbnailPool(workers=1)
+    yield EventVerifier(pool)
+    pool.shutdown()
+
+
+def test_verifier_score(verifier, tmp_path):
+    assert verifier.score(save_event(tmp_path, 'person')) > 0.5
+
+
+def test_verifier_fails_open(verifier, tmp_path):
+    """Events that can't be scored are sent anyway."""
+    broken = str(tmp_path / 'broken.jpg')
+    with open(broken, 'wb') as f:
+        f.write(b'not a jpeg')
+    assert verifier.score([broken]) is None
+    assert verifier.score([str(tmp_path / 'event.mp4')]) is None
+